@@ -0,0 +1,118 @@
+import sqlite3, hashlib, json, threading, time
+from typing import Optional, List, Dict
+
+# =========================
+# Cache Keys
+# =========================
+def make_cache_key(model: str, messages: List[Dict], params: Optional[Dict] = None) -> str:
+    # content address of a completion request: same inputs, same key
+    raw = json.dumps({"model": model, "messages": messages, "params": params or {}}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+# =========================
+# Response Cache
+# =========================
+class ResponseCache:
+    # SQLite-backed completion cache with TTL and LRU eviction by entry count
+    # and total stored bytes. Safe to share between worker threads.
+    def __init__(self, db_path: str = "bookgen_cache.db", max_entries: Optional[int] = 10000,
+                 max_bytes: Optional[int] = None, ttl: Optional[float] = None):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("""
+        CREATE TABLE IF NOT EXISTS llm_cache (
+            key TEXT PRIMARY KEY,
+            model TEXT NOT NULL,
+            response TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            created_at REAL NOT NULL,
+            last_access REAL NOT NULL
+        )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_last_access ON llm_cache (last_access)")
+        self.conn.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self.conn.execute("SELECT response, created_at FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            if row and self.ttl is not None and now - row[1] > self.ttl:
+                self.conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self.conn.commit()
+                self.evictions += 1
+                row = None
+            if not row:
+                self.misses += 1
+                return None
+            self.conn.execute("UPDATE llm_cache SET last_access = ? WHERE key = ?", (now, key))
+            self.conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, model: str, response: str):
+        now = time.time()
+        with self._lock:
+            self.conn.execute("""
+            INSERT OR REPLACE INTO llm_cache (key, model, response, size, created_at, last_access)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """, (key, model, response, len(response.encode("utf-8")), now, now))
+            self._evict(now)
+            self.conn.commit()
+
+    def delete(self, key: str):
+        with self._lock:
+            self.conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+            self.conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self.conn.execute("DELETE FROM llm_cache")
+            self.conn.commit()
+
+    def _evict(self, now: float):
+        cursor = self.conn.cursor()
+        if self.ttl is not None:
+            cursor.execute("DELETE FROM llm_cache WHERE created_at < ?", (now - self.ttl,))
+            self.evictions += cursor.rowcount
+        if self.max_entries is not None:
+            cursor.execute("""
+            DELETE FROM llm_cache WHERE key IN (
+                SELECT key FROM llm_cache ORDER BY last_access DESC LIMIT -1 OFFSET ?
+            )
+            """, (self.max_entries,))
+            self.evictions += cursor.rowcount
+        if self.max_bytes is not None:
+            total = cursor.execute("SELECT COALESCE(SUM(size), 0) FROM llm_cache").fetchone()[0]
+            if total > self.max_bytes:
+                # walk from least recently used until we are back under budget
+                stale = []
+                for key, size in cursor.execute("SELECT key, size FROM llm_cache ORDER BY last_access ASC").fetchall():
+                    if total <= self.max_bytes:
+                        break
+                    stale.append((key,))
+                    total -= size
+                cursor.executemany("DELETE FROM llm_cache WHERE key = ?", stale)
+                self.evictions += len(stale)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            entries, size = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache").fetchone()
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": entries,
+                "bytes": size,
+            }
+
+    def close(self):
+        self.conn.close()
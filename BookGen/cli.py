@@ -0,0 +1,153 @@
+import os, re, sys, json, time, argparse, multiprocessing
+from contextlib import ExitStack
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+from .db_utils import ConnectionManager, get_book, get_headings_by_book, iter_books, iter_headings_by_book
+from .export_utils import book_outline, get_exporter, split_paragraphs
+
+# Bulk commands over every book in the store. Books are spread over a
+# process pool, each process reads through its own read-only connection,
+# results stream out as one JSON object per line and progress goes to stderr.
+#   python -m BookGen stats --db bookgen.db > stats.jsonl
+#   python -m BookGen export --formats docx,markdown --out-dir exports
+WORDS_PER_MINUTE = 238
+
+# =========================
+# Per-Book Tasks
+# =========================
+_db = None
+
+def _init_worker(db_path: str):
+    global _db
+    _db = ConnectionManager(db_path, read_only=True)
+
+def book_stats(conn, book_id: int, title: str, wpm: int = WORDS_PER_MINUTE) -> Dict:
+    chapters = written = words = paragraphs = 0
+    for heading in iter_headings_by_book(conn, book_id, ("content",)):
+        chapters += 1
+        if heading["content"]:
+            written += 1
+            words += len(heading["content"].split())
+            paragraphs += sum(1 for _ in split_paragraphs(heading["content"]))
+    return {
+        "book_id": book_id,
+        "book_title": title,
+        "chapters": chapters,
+        "written_chapters": written,
+        "words": words,
+        "paragraphs": paragraphs,
+        "avg_chapter_words": round(words / written) if written else 0,
+        "reading_minutes": round(words / wpm, 1),
+    }
+
+def book_outline_json(conn, book_id: int, title: str) -> Dict:
+    book = get_book(conn, title)
+    return {"book_id": book_id, **book_outline(book, get_headings_by_book(conn, book_id))}
+
+def export_file_stem(out_dir: str, book_id: int, title: str) -> str:
+    # the id keeps titles that slug the same apart
+    slug = re.sub(r"[^\w\-]+", "_", title).strip("_")[:80] or "book"
+    return os.path.join(out_dir, f"{book_id}-{slug}")
+
+def export_book_files(conn, book_id: int, title: str, out_dir: str, formats: Iterable[str]) -> Dict:
+    # one read of each chapter, rendered into every format; the render cache
+    # is not used, it would need a writable database
+    exporters = {name: get_exporter(name) for name in formats}
+    stem = export_file_stem(out_dir, book_id, title)
+    chapters = [(h["heading_number"], h["heading_title"])
+                for h in iter_headings_by_book(conn, book_id, ("heading_number", "heading_title"))]
+    paths = {name: stem + exporter.extension for name, exporter in exporters.items()}
+    with ExitStack() as stack:
+        outputs = {name: stack.enter_context(exporter(paths[name], title.title(), chapters))
+                   for name, exporter in exporters.items()}
+        for heading in iter_headings_by_book(conn, book_id):
+            for name, exporter in exporters.items():
+                outputs[name].write_chapter(exporter.render_chapter(heading["heading_number"], heading["heading_title"], heading["content"]))
+    return {"book_id": book_id, "book_title": title, "chapters": len(chapters), "paths": paths}
+
+def _run_task(task: Tuple) -> Dict:
+    command, book_id, title, options = task
+    try:
+        conn = _db.connection()
+        if command == "stats":
+            return book_stats(conn, book_id, title, options["wpm"])
+        if command == "outline":
+            return book_outline_json(conn, book_id, title)
+        return export_book_files(conn, book_id, title, options["out_dir"], options["formats"])
+    except Exception as e:
+        # one bad book is reported in the output, the run goes on
+        return {"book_id": book_id, "book_title": title, "error": f"{type(e).__name__}: {e}"}
+
+# =========================
+# Runner
+# =========================
+def run_command(command: str, db_path: str, options: Dict, titles: Optional[Iterable[str]] = None, limit: Optional[int] = None,
+                processes: Optional[int] = None, ordered: bool = False) -> Iterator[Dict]:
+    # yields one result per book as workers finish them
+    _init_worker(db_path)
+    books = list(iter_books(_db.connection(), titles))[:limit]
+    tasks = [(command, book["id"], book["title"], options) for book in books]
+    processes = min(processes or os.cpu_count() or 1, max(len(tasks), 1))
+    if processes == 1:
+        yield from map(_run_task, tasks)
+        return
+    with multiprocessing.Pool(processes, _init_worker, (db_path,)) as pool:
+        # small chunks keep progress smooth, large enough to amortize the IPC
+        chunksize = max(1, min(64, len(tasks) // (processes * 16)))
+        results = pool.imap(_run_task, tasks, chunksize) if ordered else pool.imap_unordered(_run_task, tasks, chunksize)
+        yield from results
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m BookGen", description="Bulk operations over every book in a BookGen store.")
+    parser.add_argument("--db", default="bookgen.db", help="BookGen SQLite database, opened read-only")
+    parser.add_argument("--processes", type=int, default=None, help="worker processes (default: one per CPU)")
+    parser.add_argument("--book", action="append", dest="books", help="only this book, may be repeated")
+    parser.add_argument("--limit", type=int, default=None, help="at most this many books")
+    parser.add_argument("--output", default="-", help="JSONL output file (default: stdout)")
+    parser.add_argument("--ordered", action="store_true", help="emit results in book order instead of as they finish")
+    parser.add_argument("--progress-every", type=float, default=2.0, help="seconds between progress lines on stderr, 0 for none")
+    commands = parser.add_subparsers(dest="command", required=True)
+    stats = commands.add_parser("stats", help="word counts and reading time per book")
+    stats.add_argument("--wpm", type=int, default=WORDS_PER_MINUTE, help="reading speed in words per minute")
+    commands.add_parser("outline", help="the get_book_and_outline JSON of every book")
+    export = commands.add_parser("export", help="write every book to files")
+    export.add_argument("--out-dir", required=True)
+    export.add_argument("--formats", default="docx", help="comma separated, e.g. docx,markdown,epub")
+    args = parser.parse_args(argv)
+    if not os.path.exists(args.db):
+        parser.error(f"database not found: {args.db}")
+    options = {}
+    if args.command == "stats":
+        options["wpm"] = args.wpm
+    elif args.command == "export":
+        options["formats"] = [name.strip() for name in args.formats.split(",") if name.strip()]
+        try:
+            for name in options["formats"]:
+                get_exporter(name)
+        except ValueError as e:
+            parser.error(str(e))
+        os.makedirs(args.out_dir, exist_ok=True)
+        options["out_dir"] = args.out_dir
+
+    out = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    start = last_report = time.monotonic()
+    done = errors = 0
+    try:
+        for result in run_command(args.command, args.db, options, args.books, args.limit, args.processes, args.ordered):
+            out.write(json.dumps(result, ensure_ascii=False) + "\n")
+            done += 1
+            errors += "error" in result
+            now = time.monotonic()
+            if args.progress_every and now - last_report >= args.progress_every:
+                out.flush()
+                print(f"{args.command}: {done} book(s), {done / (now - start):.1f}/s, {errors} error(s)", file=sys.stderr, flush=True)
+                last_report = now
+    except BrokenPipeError:
+        # the reader went away, e.g. `| head`: stop quietly
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return 1
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    elapsed = time.monotonic() - start
+    print(f"{args.command}: {done} book(s) in {elapsed:.1f}s, {errors} error(s)", file=sys.stderr, flush=True)
+    return 1 if errors else 0
@@ -0,0 +1,129 @@
+import os, logging, threading
+from typing import List, Optional
+
+OPENROUTER_DEFAULT_URL = "https://openrouter.ai/api/v1/chat/completions"
+LOG_FORMAT = "%(asctime)s | %(levelname)s | %(name)s | %(message)s"
+LOG_DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# =========================
+# Configuration
+# =========================
+class BookGenConfig:
+    # Settings BookGen used to read from the environment at import time.
+    # from_env() loads .env and the environment; build one directly to keep
+    # the process environment out of it entirely.
+    def __init__(self, api_key: Optional[str] = None, api_url: str = OPENROUTER_DEFAULT_URL, log_level: str = "INFO",
+                 log_dir: Optional[str] = "logs", log_max_bytes: int = 10 * 1024 * 1024, log_backups: int = 5,
+                 smtp_host: Optional[str] = None, smtp_port: int = 587, smtp_user: Optional[str] = None,
+                 smtp_password: Optional[str] = None, smtp_ssl: bool = False, smtp_starttls: Optional[bool] = None,
+                 notify_from: Optional[str] = None, notify_to: Optional[List[str]] = None):
+        self.api_key = api_key
+        self.api_url = api_url
+        self.log_level = log_level.upper()
+        # None: console logging only, nothing is written to disk
+        self.log_dir = log_dir
+        self.log_max_bytes = log_max_bytes
+        self.log_backups = log_backups
+        # notifications are on once a host and at least one recipient are set,
+        # e.g. smtp.gmail.com:587 with an app password
+        self.smtp_host = smtp_host
+        self.smtp_port = smtp_port
+        self.smtp_user = smtp_user
+        self.smtp_password = smtp_password
+        self.smtp_ssl = smtp_ssl
+        # default: STARTTLS whenever credentials are sent over a plain connection
+        self.smtp_starttls = bool(smtp_user) and not smtp_ssl if smtp_starttls is None else smtp_starttls
+        self.notify_from = notify_from or smtp_user
+        self.notify_to = list(notify_to or [])
+
+    @property
+    def notifications_enabled(self) -> bool:
+        return bool(self.smtp_host and self.notify_to)
+
+    @property
+    def log_file(self) -> Optional[str]:
+        return os.path.join(self.log_dir, "bookgen.log") if self.log_dir else None
+
+    @classmethod
+    def from_env(cls, dotenv: bool = True) -> "BookGenConfig":
+        if dotenv:
+            from dotenv import load_dotenv
+            load_dotenv()
+        return cls(
+            api_key=os.getenv("OPENROUTER_API_KEY"),
+            api_url=os.getenv("OPENROUTER_URL", OPENROUTER_DEFAULT_URL),
+            log_level=os.getenv("BOOKGEN_LOG_LEVEL", "INFO"),
+            log_dir=os.getenv("BOOKGEN_LOG_DIR", "logs") or None,
+            smtp_host=os.getenv("BOOKGEN_SMTP_HOST"),
+            smtp_port=int(os.getenv("BOOKGEN_SMTP_PORT", "587")),
+            smtp_user=os.getenv("BOOKGEN_SMTP_USER"),
+            smtp_password=os.getenv("BOOKGEN_SMTP_PASSWORD"),
+            smtp_ssl=os.getenv("BOOKGEN_SMTP_SSL", "").lower() in ("1", "true", "yes"),
+            notify_from=os.getenv("BOOKGEN_NOTIFY_FROM"),
+            notify_to=[a.strip() for a in os.getenv("BOOKGEN_NOTIFY_TO", "").split(",") if a.strip()],
+        )
+
+    def __repr__(self):
+        # never print the key itself
+        return (f"BookGenConfig(api_key={'set' if self.api_key else None}, api_url={self.api_url!r}, "
+                f"log_level={self.log_level!r}, log_dir={self.log_dir!r}, smtp_host={self.smtp_host!r}, "
+                f"notify_to={self.notify_to!r})")
+
+_config = None
+_config_lock = threading.Lock()
+
+def get_config() -> BookGenConfig:
+    # process-wide config, read from .env / the environment on first use
+    global _config
+    with _config_lock:
+        if _config is None:
+            _config = BookGenConfig.from_env()
+        return _config
+
+def set_config(config: Optional[BookGenConfig]):
+    # None re-reads the environment on the next get_config()
+    global _config
+    with _config_lock:
+        _config = config
+
+# =========================
+# Logging
+# =========================
+_logging_configured = False
+_logging_lock = threading.Lock()
+
+def configure_logging(config: Optional[BookGenConfig] = None, force: bool = False) -> logging.Logger:
+    # Console and rotating file handlers on the "BookGen" logger, attached
+    # the first time a BookGen is created rather than on import. A log
+    # directory that cannot be created (read-only install) means console only.
+    global _logging_configured
+    logger = logging.getLogger("BookGen")
+    with _logging_lock:
+        if _logging_configured and not force:
+            return logger
+        config = config or get_config()
+        formatter = logging.Formatter(LOG_FORMAT, datefmt=LOG_DATE_FORMAT)
+        logger.setLevel(config.log_level)
+        logger.handlers.clear()      # avoid duplicate logs
+        logger.propagate = False
+
+        console_handler = logging.StreamHandler()
+        console_handler.setLevel(config.log_level)
+        console_handler.setFormatter(formatter)
+        logger.addHandler(console_handler)
+
+        if config.log_file:
+            from logging.handlers import RotatingFileHandler
+            try:
+                os.makedirs(config.log_dir, exist_ok=True)
+                file_handler = RotatingFileHandler(config.log_file, maxBytes=config.log_max_bytes,
+                                                   backupCount=config.log_backups, encoding="utf-8")
+            except OSError as e:
+                logger.warning(f"File logging disabled, cannot write {config.log_file}: {e}")
+            else:
+                # capture everything in file
+                file_handler.setLevel(logging.DEBUG)
+                file_handler.setFormatter(formatter)
+                logger.addHandler(file_handler)
+        _logging_configured = True
+    return logger
@@ -1,21 +1,202 @@
-import sqlite3
-from datetime import datetime
-import string, os
-from typing import Optional, List, Dict
+import sqlite3, threading, weakref, os, json, re, time, zlib, hashlib
+from difflib import SequenceMatcher
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Optional, List, Dict, Iterable, Iterator
 
 # =========================
 # Database Initialization
 # =========================
-def get_db_connection(db_path: str = "bookgen.db") -> sqlite3.Connection:
-    conn = sqlite3.connect(db_path)
+SCHEMA_VERSION = 11
+
+class BookGenConnection(sqlite3.Connection):
+    # tracks open transaction() blocks so handlers know not to commit
+    _tx_depth = 0
+
+_initialized_dbs = set()
+_init_lock = threading.Lock()
+
+def _connect(db_path: str, wal: bool = False, synchronous: Optional[str] = None, busy_timeout: float = 5.0,
+             read_only: bool = False) -> sqlite3.Connection:
+    # busy_timeout: seconds to wait on a locked database before failing
+    if read_only:
+        # no DDL and no pragmas that write, the file may live on read-only storage
+        conn = _connect_read_only(db_path, busy_timeout, BookGenConnection)
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        if version < SCHEMA_VERSION:
+            conn.close()
+            raise sqlite3.OperationalError(f"Database {db_path} is at schema version {version}, expected {SCHEMA_VERSION}: "
+                                           "open it once without read_only to migrate it")
+        return conn
+    conn = sqlite3.connect(db_path, timeout=busy_timeout, factory=BookGenConnection)
     conn.row_factory = sqlite3.Row
-    init_db(conn)
+    if wal:
+        conn.execute("PRAGMA journal_mode = WAL")
+    if synchronous:
+        # OFF | NORMAL | FULL | EXTRA, NORMAL is safe with WAL
+        conn.execute(f"PRAGMA synchronous = {synchronous.upper()}")
+    ensure_schema(conn, db_path)
+    conn.execute("PRAGMA foreign_keys = ON")
     return conn
 
+def _connect_read_only(db_path: str, busy_timeout: float, factory=sqlite3.Connection) -> sqlite3.Connection:
+    if not os.path.exists(db_path):
+        # mode=ro would only say "unable to open database file"
+        raise sqlite3.OperationalError(f"Database {db_path} does not exist and cannot be created read-only")
+    conn = sqlite3.connect(f"file:{os.path.abspath(db_path)}?mode=ro", uri=True, timeout=busy_timeout, factory=factory)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+def ensure_schema(conn: sqlite3.Connection, db_path: str):
+    # DDL runs once per database per process, not on every connection
+    if db_path == ":memory:":
+        init_db(conn)
+        return
+    key = os.path.abspath(db_path)
+    with _init_lock:
+        if key not in _initialized_dbs:
+            init_db(conn)
+            _initialized_dbs.add(key)
+
+def get_db_connection(db_path: str = "bookgen.db", wal: bool = False, synchronous: Optional[str] = None) -> sqlite3.Connection:
+    return _connect(db_path, wal, synchronous)
+
+# =========================
+# Connection Manager
+# =========================
+def _close_connections(connections: Iterable[sqlite3.Connection]):
+    for conn in list(connections):
+        try:
+            conn.close()
+        except sqlite3.ProgrammingError:
+            # created in another thread that is still alive
+            pass
+
+class _ThreadConnections:
+    # one per thread, dropped when the thread exits; the finalizer then
+    # closes every connection the thread opened, even ones still referenced
+    __slots__ = ("connections", "__weakref__")
+
+    def __init__(self):
+        self.connections = weakref.WeakSet()
+        weakref.finalize(self, _close_connections, self.connections)
+
+_thread_connections = threading.local()
+
+def _track_thread_connection(conn: sqlite3.Connection):
+    owned = getattr(_thread_connections, "owned", None)
+    if owned is None:
+        owned = _thread_connections.owned = _ThreadConnections()
+    owned.connections.add(conn)
+
+class ConnectionManager:
+    # One connection per thread (sqlite3 connections must not be shared),
+    # WAL so readers never block the writer, and a busy timeout so
+    # concurrent writers queue instead of failing with "database is locked".
+    def __init__(self, db_path: str = "bookgen.db", wal: bool = True, synchronous: Optional[str] = "NORMAL", busy_timeout: float = 30.0,
+                 read_only: bool = False):
+        self.db_path = db_path
+        self.read_only = read_only
+        self.wal = wal
+        self.synchronous = synchronous
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        # weak, so connections of exited threads are not kept alive here
+        self._connections = weakref.WeakSet()
+        self._lock = threading.Lock()
+
+    def connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = _connect(self.db_path, self.wal, self.synchronous, self.busy_timeout, self.read_only)
+            self._local.conn = conn
+            _track_thread_connection(conn)
+            with self._lock:
+                self._connections.add(conn)
+        return conn
+
+    @contextmanager
+    def snapshot(self):
+        # read-only connection pinned to one consistent view of the database
+        # the thread's own connection first: it creates and migrates the file
+        # (or, read-only, checks it is there and current)
+        own = self.connection()
+        if self.db_path == ":memory:":
+            yield own
+            return
+        conn = _connect_read_only(self.db_path, self.busy_timeout)
+        # a pinned read holds a SHARED lock that blocks every writer of a
+        # rollback-journal database, so only WAL databases get one
+        pinned = conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        try:
+            if pinned:
+                conn.execute("BEGIN")
+                conn.execute("SELECT 1 FROM books LIMIT 1").fetchall()
+            yield conn
+        finally:
+            if pinned:
+                conn.rollback()
+            conn.close()
+
+    def close(self):
+        with self._lock:
+            _close_connections(self._connections)
+            self._connections.clear()
+        self._local = threading.local()
+
+# =========================
+# Transactions
+# =========================
+@contextmanager
+def transaction(conn: sqlite3.Connection):
+    # Unit of work: handlers called inside skip their own commit, everything
+    # is committed once at the end or rolled back on error. Blocks nest.
+    depth = getattr(conn, "_tx_depth", 0)
+    if depth == 0:
+        if conn.in_transaction:
+            conn.commit()
+        conn.execute("BEGIN IMMEDIATE")
+    conn._tx_depth = depth + 1
+    try:
+        yield conn
+    except BaseException:
+        conn._tx_depth = depth
+        if depth == 0:
+            conn.rollback()
+        raise
+    conn._tx_depth = depth
+    if depth == 0:
+        conn.commit()
+
+def _commit(conn: sqlite3.Connection):
+    if not getattr(conn, "_tx_depth", 0):
+        conn.commit()
+
+def _rollback(conn: sqlite3.Connection):
+    if not getattr(conn, "_tx_depth", 0):
+        conn.rollback()
+
 def init_db(conn: sqlite3.Connection):
+    # schema is versioned with PRAGMA user_version, each step runs once
+    for version in range(1, SCHEMA_VERSION + 1):
+        migrate = _MIGRATIONS[version - 1]
+        if conn.execute("PRAGMA user_version").fetchone()[0] >= version:
+            continue
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # another process may have migrated while we waited for the lock
+            if conn.execute("PRAGMA user_version").fetchone()[0] < version:
+                migrate(conn)
+                conn.execute(f"PRAGMA user_version = {version}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+def _migrate_v1(conn: sqlite3.Connection):
     cursor = conn.cursor()
     # -----------------
-    # Books Table
+    # Books Table (original layout, one headings table per book)
     # -----------------
     cursor.execute("""
     CREATE TABLE IF NOT EXISTS books (
@@ -28,16 +209,33 @@ def init_db(conn: sqlite3.Connection):
         updated_at TEXT NOT NULL
     )
     """)
-    conn.commit()
 
-def _create_headings_table(conn: sqlite3.Connection, table_name: str):
+def _migrate_v2(conn: sqlite3.Connection):
     cursor = conn.cursor()
     # -----------------
-    # Headings Table
+    # Books Table (without ref_table)
     # -----------------
-    cursor.execute(f"""
-    CREATE TABLE IF NOT EXISTS {table_name} (
+    cursor.execute("""
+    CREATE TABLE books_v2 (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        title TEXT NOT NULL UNIQUE,
+        before_notes TEXT NOT NULL,
+        after_notes TEXT,
+        created_at TEXT NOT NULL,
+        updated_at TEXT NOT NULL
+    )
+    """)
+    cursor.execute("""
+    INSERT INTO books_v2 (id, title, before_notes, after_notes, created_at, updated_at)
+    SELECT id, title, before_notes, after_notes, created_at, updated_at FROM books
+    """)
+    # -----------------
+    # Headings Table (shared by all books)
+    # -----------------
+    cursor.execute("""
+    CREATE TABLE headings (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
+        book_id INTEGER NOT NULL REFERENCES books(id) ON DELETE CASCADE,
         heading_number INTEGER NOT NULL,
         heading_title TEXT NOT NULL,
         sub_heading TEXT,
@@ -50,7 +248,191 @@ def _create_headings_table(conn: sqlite3.Connection, table_name: str):
         updated_at TEXT NOT NULL
     )
     """)
-    conn.commit()
+    # move every per-book table across, then drop it
+    for row in cursor.execute("SELECT id, ref_table FROM books").fetchall():
+        book_id, ref_table = row[0], row[1]
+        exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (ref_table,)).fetchone()
+        if not exists:
+            continue
+        conn.execute(f"""
+        INSERT INTO headings (
+            book_id, heading_number, heading_title, sub_heading, description, summary,
+            content, before_notes, after_notes, created_at, updated_at
+        )
+        SELECT ?, heading_number, heading_title, sub_heading, description, summary,
+            content, before_notes, after_notes, created_at, updated_at
+        FROM "{ref_table}" ORDER BY id
+        """, (book_id,))
+        conn.execute(f'DROP TABLE "{ref_table}"')
+    cursor.execute("DROP TABLE books")
+    cursor.execute("ALTER TABLE books_v2 RENAME TO books")
+    cursor.execute("CREATE INDEX idx_headings_book_number ON headings (book_id, heading_number)")
+    cursor.execute("CREATE INDEX idx_headings_book_title ON headings (book_id, heading_title)")
+
+def _migrate_v3(conn: sqlite3.Connection):
+    # hash of the inputs each heading was last generated from
+    conn.execute("ALTER TABLE headings ADD COLUMN input_fingerprint TEXT")
+
+def _migrate_v4(conn: sqlite3.Connection):
+    # rendered chapter per export format, keyed on the heading's updated_at
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS export_renders (
+        heading_id INTEGER NOT NULL REFERENCES headings(id) ON DELETE CASCADE,
+        format TEXT NOT NULL,
+        source_updated_at TEXT NOT NULL,
+        body TEXT NOT NULL,
+        PRIMARY KEY (heading_id, format)
+    )
+    """)
+
+def _migrate_v5(conn: sqlite3.Connection):
+    # durable book-generation queue: one job per book, an ordered chain of
+    # tasks per job, claimed by workers under a time-limited lease
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        book_title TEXT NOT NULL,
+        notes TEXT NOT NULL,
+        heading_notes TEXT,
+        output_stem TEXT,
+        export_formats TEXT,
+        status TEXT NOT NULL DEFAULT 'pending',
+        error TEXT,
+        created_at TEXT,
+        updated_at TEXT
+    )
+    """)
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS job_tasks (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        job_id INTEGER NOT NULL REFERENCES jobs(id) ON DELETE CASCADE,
+        seq INTEGER NOT NULL,
+        kind TEXT NOT NULL,
+        heading_title TEXT,
+        status TEXT NOT NULL DEFAULT 'pending',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        max_attempts INTEGER NOT NULL DEFAULT 3,
+        available_at REAL NOT NULL DEFAULT 0,
+        lease_owner TEXT,
+        lease_expires_at REAL,
+        error TEXT,
+        updated_at TEXT,
+        UNIQUE (job_id, seq)
+    )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_job_tasks_status ON job_tasks (status, available_at)")
+
+def _migrate_v6(conn: sqlite3.Connection):
+    # one row per LLM call, see telemetry_utils
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS llm_calls (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        ts REAL NOT NULL,
+        book_title TEXT,
+        book_id INTEGER,
+        heading TEXT,
+        stage TEXT,
+        model TEXT,
+        ok INTEGER NOT NULL,
+        cached INTEGER NOT NULL DEFAULT 0,
+        streamed INTEGER NOT NULL DEFAULT 0,
+        latency REAL,
+        ttfb REAL,
+        retries INTEGER,
+        prompt_tokens INTEGER,
+        completion_tokens INTEGER,
+        estimated_prompt_tokens INTEGER,
+        cost REAL,
+        error TEXT
+    )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_calls_book ON llm_calls (book_title, stage)")
+
+def _migrate_v7(conn: sqlite3.Connection):
+    # full-text index over generated text, see Search Index Handlers
+    if _fts5_available(conn):
+        _create_search_index(conn)
+        conn.execute("INSERT INTO headings_fts (headings_fts) VALUES ('rebuild')")
+
+def _migrate_v8(conn: sqlite3.Connection):
+    # outgoing notifications, delivered by notify_utils.NotificationDispatcher
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS notifications (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        event TEXT NOT NULL,
+        book_title TEXT,
+        payload TEXT,
+        status TEXT NOT NULL DEFAULT 'pending',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        available_at REAL NOT NULL DEFAULT 0,
+        lease_owner TEXT,
+        lease_expires_at REAL,
+        created_at REAL NOT NULL,
+        sent_at REAL,
+        error TEXT
+    )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_notifications_status ON notifications (status, available_at)")
+
+def _migrate_v9(conn: sqlite3.Connection):
+    # one row per outline section, headings.content stays the stitched chapter
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS sections (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        heading_id INTEGER NOT NULL REFERENCES headings(id) ON DELETE CASCADE,
+        section_number INTEGER NOT NULL,
+        section_title TEXT NOT NULL,
+        content TEXT,
+        updated_at TEXT NOT NULL,
+        UNIQUE (heading_id, section_number)
+    )
+    """)
+    _add_sections(conn, conn.execute("SELECT id, sub_heading FROM headings").fetchall())
+
+def _migrate_v10(conn: sqlite3.Connection):
+    # provisional chapter drafts written ahead of outline approval, see speculate_utils
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS drafts (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        heading_id INTEGER NOT NULL REFERENCES headings(id) ON DELETE CASCADE,
+        input_fingerprint TEXT NOT NULL,
+        content TEXT NOT NULL,
+        sections TEXT,
+        summary TEXT,
+        tokens INTEGER,
+        seconds REAL,
+        status TEXT NOT NULL DEFAULT 'provisional',
+        created_at TEXT NOT NULL,
+        updated_at TEXT NOT NULL
+    )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_drafts_heading ON drafts (heading_id, status)")
+
+def _migrate_v11(conn: sqlite3.Connection):
+    # append-only history of every heading, see Revision History Handlers
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS revisions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        heading_id INTEGER NOT NULL REFERENCES headings(id) ON DELETE CASCADE,
+        revision INTEGER NOT NULL,
+        keyframe INTEGER NOT NULL,
+        delta INTEGER NOT NULL DEFAULT 0,
+        content BLOB,
+        content_hash TEXT,
+        summary BLOB,
+        input_fingerprint TEXT,
+        created_at TEXT NOT NULL,
+        UNIQUE (heading_id, revision)
+    )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_revisions_heading_time ON revisions (heading_id, created_at)")
+    # what is stored today becomes revision 1
+    for row in conn.execute("SELECT id, content, summary, input_fingerprint, updated_at FROM headings "
+                            "WHERE content IS NOT NULL OR summary IS NOT NULL").fetchall():
+        _insert_revision(conn, row[0], 1, None, row[1], row[2], row[3], row[4])
+
+_MIGRATIONS = [_migrate_v1, _migrate_v2, _migrate_v3, _migrate_v4, _migrate_v5, _migrate_v6, _migrate_v7, _migrate_v8,
+               _migrate_v9, _migrate_v10, _migrate_v11]
 
 # =========================
 # Books Table Handlers
@@ -58,21 +440,12 @@ def _create_headings_table(conn: sqlite3.Connection, table_name: str):
 
 def add_book(conn: sqlite3.Connection, title: str, before_notes: str) -> int:
     cursor = conn.cursor()
-    # craete a random ref table for this book's headings
-    chars = string.ascii_letters + string.digits
-    random_bytes = os.urandom(16)
-    while True:
-        table_name = ''.join(chars[b % len(chars)] for b in random_bytes)
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", (table_name,))
-        if not cursor.fetchone():
-            break   
-    _create_headings_table(conn, table_name)
     now = datetime.utcnow().isoformat()
     cursor.execute("""
-    INSERT INTO books (title, before_notes, created_at, updated_at, ref_table)
-    VALUES (?, ?, ?, ?, ?)
-    """, (title, before_notes, now, now, table_name))
-    conn.commit()
+    INSERT INTO books (title, before_notes, created_at, updated_at)
+    VALUES (?, ?, ?, ?)
+    """, (title, before_notes, now, now))
+    _commit(conn)
     return cursor.lastrowid
 
 def update_book(conn: sqlite3.Connection, title: str = None, before_notes: Optional[str] = None, after_notes: Optional[str] = None):
@@ -93,17 +466,13 @@ def update_book(conn: sqlite3.Connection, title: str = None, before_notes: Optio
     SET {', '.join(fields)}
     WHERE title = ?
     """, values)
-    conn.commit()
+    _commit(conn)
 
 def delete_book(conn: sqlite3.Connection, title: str):
     cursor = conn.cursor()
-    cursor.execute("SELECT ref_table FROM books WHERE title = ?", (title,))
-    row = cursor.fetchone()
-    if row:
-        ref_table = row['ref_table']
-        cursor.execute(f"DROP TABLE IF EXISTS {ref_table}")
+    cursor.execute("DELETE FROM headings WHERE book_id = (SELECT id FROM books WHERE title = ?)", (title,))
     cursor.execute("DELETE FROM books WHERE title = ?", (title,))
-    conn.commit()
+    _commit(conn)
 
 def get_book(conn: sqlite3.Connection, title: str) -> Dict:
     # get book by title
@@ -112,71 +481,765 @@ def get_book(conn: sqlite3.Connection, title: str) -> Dict:
     row = cursor.fetchone()
     return dict(row) if row else None
 
+def iter_books(conn: sqlite3.Connection, titles: Optional[Iterable[str]] = None) -> Iterator[Dict]:
+    # id and title of every book (or the named ones), oldest first
+    titles = list(titles) if titles else None
+    cursor = conn.execute(f"""
+    SELECT id, title FROM books
+    {f"WHERE title IN ({', '.join('?' * len(titles))})" if titles else ""}
+    ORDER BY id
+    """, titles or ())
+    for row in cursor:
+        yield dict(row)
+
 # =========================
 # Headings Table Handlers
 # =========================
 def add_heading(conn: sqlite3.Connection, book_id: int, heading_number: int, heading_title: str, sub_heading: Optional[str] = None, description: Optional[str] = None) -> int:
     cursor = conn.cursor()
     now = datetime.utcnow().isoformat()
-    cursor.execute("SELECT ref_table FROM books WHERE id = ?", (book_id,))
-    row = cursor.fetchone()
-    if not row:
+    try:
+        cursor.execute("""
+        INSERT INTO headings (
+            book_id, heading_number, heading_title,
+            sub_heading, description, created_at, updated_at
+        )
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, (
+            book_id,
+            heading_number,
+            heading_title,
+            sub_heading,
+            description,
+            now,
+            now
+        ))
+    except sqlite3.IntegrityError:
+        _rollback(conn)
         raise ValueError(f"No book found with id {book_id}")
-    table_name = row['ref_table']
-    cursor.execute(f"""
-    INSERT INTO {table_name} (
-        heading_number, heading_title,
-        sub_heading, description, created_at, updated_at
-    )
-    VALUES (?, ?, ?, ?, ?, ?)
-    """, (
-        heading_number,
-        heading_title,
-        sub_heading,
-        description,
-        now,
-        now
-    ))
-    conn.commit()
+    _add_sections(conn, [(cursor.lastrowid, sub_heading)])
+    _commit(conn)
     return cursor.lastrowid
 
-def update_heading(conn: sqlite3.Connection, book_id: int, heading_title: str, summary: Optional[str] = None, content: Optional[str] = None, before_notes: Optional[str] = None, after_notes: Optional[str] = None):
+def update_heading(conn: sqlite3.Connection, book_id: int, heading_title: str, summary: Optional[str] = None, content: Optional[str] = None, before_notes: Optional[str] = None, after_notes: Optional[str] = None, input_fingerprint: Optional[str] = None,
+                   record_revision: bool = True):
     cursor = conn.cursor()
+    previous = None
+    if record_revision and (summary is not None or content is not None):
+        previous = cursor.execute("""
+        SELECT id, content, summary, input_fingerprint FROM headings WHERE book_id = ? AND heading_title = ?
+        """, (book_id, heading_title)).fetchone()
     fields = []
     values = []
-    cursor.execute("SELECT ref_table FROM books WHERE id = ?", (book_id,))
-    row = cursor.fetchone()
-    if not row:
-        raise ValueError(f"No book found with id {book_id}")
-    table_name = row['ref_table']
     for field, value in {
         "summary": summary,
         "content": content,
         "before_notes": before_notes,
-        "after_notes": after_notes
+        "after_notes": after_notes,
+        "input_fingerprint": input_fingerprint
         }.items():
         if value is not None:
             fields.append(f"{field} = ?")
             values.append(value)
     fields.append("updated_at = ?")
     values.append(datetime.utcnow().isoformat())
-    values.append(heading_title)
+    values.extend([book_id, heading_title])
     cursor.execute(f"""
-    UPDATE {table_name}
+    UPDATE headings
     SET {', '.join(fields)}
-    WHERE heading_title = ?
+    WHERE book_id = ? AND heading_title = ?
     """, values)
-    conn.commit()
+    if previous is not None:
+        _record_revision(conn, dict(previous), content, summary, input_fingerprint)
+    _commit(conn)
+
+def add_headings_bulk(conn: sqlite3.Connection, book_id: int, headings: Iterable[Dict]) -> int:
+    # one executemany in one transaction instead of a commit per heading
+    now = datetime.utcnow().isoformat()
+    rows = [(
+        book_id,
+        heading["heading_number"],
+        heading["heading_title"],
+        heading.get("sub_heading"),
+        heading.get("description"),
+        now,
+        now
+    ) for heading in headings]
+    with transaction(conn):
+        try:
+            conn.executemany("""
+            INSERT INTO headings (
+                book_id, heading_number, heading_title,
+                sub_heading, description, created_at, updated_at
+            )
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, rows)
+        except sqlite3.IntegrityError:
+            raise ValueError(f"No book found with id {book_id}")
+        _add_sections(conn, conn.execute("""
+        SELECT h.id, h.sub_heading FROM headings h
+        WHERE h.book_id = ? AND NOT EXISTS (SELECT 1 FROM sections s WHERE s.heading_id = h.id)
+        """, (book_id,)).fetchall())
+    return len(rows)
 
 def get_headings_by_book(conn: sqlite3.Connection, book_id: int) -> List[Dict]:
     cursor = conn.cursor()
-    cursor.execute("SELECT ref_table FROM books WHERE id = ?", (book_id,))
-    row = cursor.fetchone()
+    cursor.execute("""
+    SELECT id, heading_number, heading_title, sub_heading, description, summary, content,
+        before_notes, after_notes, input_fingerprint
+    FROM headings
+    WHERE book_id = ?
+    ORDER BY heading_number, id
+    """, (book_id,))
+    rows = cursor.fetchall()
+    return [dict(r) for r in rows]
+
+def iter_headings_by_book(conn: sqlite3.Connection, book_id: int, columns: Iterable[str] = ("heading_number", "heading_title", "content")) -> Iterator[Dict]:
+    # streams rows off the cursor one at a time instead of fetchall()
+    cursor = conn.cursor()
+    cursor.execute(f"""
+    SELECT {', '.join(columns)}
+    FROM headings
+    WHERE book_id = ?
+    ORDER BY heading_number, id
+    """, (book_id,))
+    for row in cursor:
+        yield dict(row)
+
+def iter_library_headings(conn: sqlite3.Connection, book_title: Optional[str] = None,
+                          columns: Iterable[str] = ("content", "summary")) -> Iterator[Dict]:
+    # every written heading of every book (or one book), with its book title
+    cursor = conn.cursor()
+    cursor.execute(f"""
+    SELECT b.title AS book_title, h.heading_number, h.heading_title{''.join(f', h.{c}' for c in columns)}
+    FROM headings h
+    JOIN books b ON b.id = h.book_id
+    WHERE h.content IS NOT NULL AND (? IS NULL OR b.title = ?)
+    ORDER BY b.id, h.heading_number, h.id
+    """, (book_title, book_title))
+    for row in cursor:
+        yield dict(row)
+
+# =========================
+# Sections Table Handlers
+# =========================
+# Sections come from the outline (headings.sub_heading, one per line).
+# Their content is only set for chapters written section by section.
+def section_titles(sub_heading: Optional[str]) -> List[str]:
+    return [line.strip() for line in (sub_heading or "").splitlines() if line.strip()]
+
+def _add_sections(conn: sqlite3.Connection, headings: Iterable[tuple]):
+    # headings: (heading_id, sub_heading) pairs
+    now = datetime.utcnow().isoformat()
+    conn.executemany("""
+    INSERT INTO sections (heading_id, section_number, section_title, updated_at)
+    VALUES (?, ?, ?, ?)
+    """, [
+        (heading_id, number, title, now)
+        for heading_id, sub_heading in headings
+        for number, title in enumerate(section_titles(sub_heading), 1)
+    ])
+
+def get_sections(conn: sqlite3.Connection, heading_id: int) -> List[Dict]:
+    cursor = conn.cursor()
+    cursor.execute("""
+    SELECT section_number, section_title, content, updated_at
+    FROM sections
+    WHERE heading_id = ?
+    ORDER BY section_number
+    """, (heading_id,))
+    return [dict(r) for r in cursor.fetchall()]
+
+def save_sections(conn: sqlite3.Connection, heading_id: int, contents: Optional[List[str]]):
+    # contents in section order; None clears them, e.g. after a whole-chapter rewrite
+    now = datetime.utcnow().isoformat()
+    if contents is None:
+        conn.execute("UPDATE sections SET content = NULL, updated_at = ? WHERE heading_id = ? AND content IS NOT NULL",
+                     (now, heading_id))
+    else:
+        conn.executemany("UPDATE sections SET content = ?, updated_at = ? WHERE heading_id = ? AND section_number = ?",
+                         [(content, now, heading_id, number) for number, content in enumerate(contents, 1)])
+    _commit(conn)
+
+def update_section(conn: sqlite3.Connection, heading_id: int, section_number: int, content: str):
+    conn.execute("UPDATE sections SET content = ?, updated_at = ? WHERE heading_id = ? AND section_number = ?",
+                 (content, datetime.utcnow().isoformat(), heading_id, section_number))
+    _commit(conn)
+
+# =========================
+# Drafts Table Handlers
+# =========================
+# status: provisional -> promoted (used as the chapter) | discarded (inputs changed)
+def add_draft(conn: sqlite3.Connection, heading_id: int, input_fingerprint: str, content: str, summary: Optional[str],
+              sections: Optional[List[str]] = None, tokens: Optional[int] = None, seconds: Optional[float] = None) -> int:
+    now = datetime.utcnow().isoformat()
+    cursor = conn.execute("""
+    INSERT INTO drafts (heading_id, input_fingerprint, content, sections, summary, tokens, seconds, created_at, updated_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, (heading_id, input_fingerprint, content, json.dumps(sections) if sections is not None else None,
+          summary, tokens, seconds, now, now))
+    _commit(conn)
+    return cursor.lastrowid
+
+def get_draft(conn: sqlite3.Connection, heading_id: int, input_fingerprint: str) -> Optional[Dict]:
+    row = conn.execute("""
+    SELECT id, content, sections, summary, tokens, seconds
+    FROM drafts
+    WHERE heading_id = ? AND input_fingerprint = ? AND status = 'provisional'
+    ORDER BY id DESC LIMIT 1
+    """, (heading_id, input_fingerprint)).fetchone()
     if not row:
-        raise ValueError(f"No book found with id {book_id}")
-    table_name = row['ref_table']
+        return None
+    draft = dict(row)
+    draft["sections"] = json.loads(draft["sections"]) if draft["sections"] else None
+    return draft
+
+def set_draft_status(conn: sqlite3.Connection, draft_id: int, status: str):
+    conn.execute("UPDATE drafts SET status = ?, updated_at = ? WHERE id = ?",
+                 (status, datetime.utcnow().isoformat(), draft_id))
+    _commit(conn)
+
+def discard_drafts(conn: sqlite3.Connection, heading_id: int, keep_fingerprint: Optional[str] = None) -> int:
+    # provisional drafts written from inputs the heading no longer has
+    cursor = conn.execute("""
+    UPDATE drafts SET status = 'discarded', updated_at = ?
+    WHERE heading_id = ? AND status = 'provisional' AND input_fingerprint IS NOT ?
+    """, (datetime.utcnow().isoformat(), heading_id, keep_fingerprint))
+    _commit(conn)
+    return cursor.rowcount
+
+def get_draft_stats(conn: sqlite3.Connection) -> Dict:
+    stats = {status: {"drafts": 0, "tokens": 0} for status in ("provisional", "promoted", "discarded")}
+    for row in conn.execute("SELECT status, COUNT(*), COALESCE(SUM(tokens), 0) FROM drafts GROUP BY status"):
+        stats[row[0]] = {"drafts": row[1], "tokens": row[2]}
+    return stats
+
+# =========================
+# Revision History Handlers
+# =========================
+# Every change to a heading's content or summary is appended to revisions.
+# Content is zlib-compressed, stored whole or as a line delta against the
+# revision before it, whichever is smaller, with a whole copy at least every
+# REVISION_KEYFRAME_INTERVAL revisions so a lookup never replays a long
+# chain. The latest text stays in headings, reading the current book is
+# unchanged.
+REVISION_KEYFRAME_INTERVAL = 10
+
+def _compress(text: Optional[str]) -> Optional[bytes]:
+    return zlib.compress(text.encode("utf-8"), 6) if text is not None else None
+
+def _decompress(blob: Optional[bytes]) -> Optional[str]:
+    return zlib.decompress(blob).decode("utf-8") if blob is not None else None
+
+def _text_hash(text: Optional[str]) -> Optional[str]:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest() if text is not None else None
+
+def encode_delta(base: str, text: str) -> list:
+    # [start, end] copies lines of the base, a string is inserted as is
+    a, b = base.splitlines(keepends=True), text.splitlines(keepends=True)
+    ops = []
+    for tag, i1, i2, j1, j2 in SequenceMatcher(None, a, b, autojunk=False).get_opcodes():
+        if tag == "equal":
+            ops.append([i1, i2])
+        elif j2 > j1:
+            ops.append("".join(b[j1:j2]))
+    return ops
+
+def apply_delta(base: str, ops: list) -> str:
+    lines = base.splitlines(keepends=True)
+    return "".join("".join(lines[op[0]:op[1]]) if isinstance(op, list) else op for op in ops)
+
+def _insert_revision(conn: sqlite3.Connection, heading_id: int, revision: int, base: Optional[Dict], content: Optional[str],
+                     summary: Optional[str], input_fingerprint: Optional[str], created_at: Optional[str] = None):
+    # base: {"keyframe", "content"} of the revision before, None starts a new chain
+    blob, delta, keyframe = _compress(content), False, revision
+    if (base is not None and base["content"] is not None and content is not None
+            and revision - base["keyframe"] < REVISION_KEYFRAME_INTERVAL):
+        delta_blob = zlib.compress(json.dumps(encode_delta(base["content"], content), ensure_ascii=False).encode("utf-8"), 6)
+        if len(delta_blob) < len(blob):
+            blob, delta, keyframe = delta_blob, True, base["keyframe"]
+    conn.execute("""
+    INSERT INTO revisions (heading_id, revision, keyframe, delta, content, content_hash, summary, input_fingerprint, created_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, (heading_id, revision, keyframe, int(delta), blob, _text_hash(content), _compress(summary), input_fingerprint,
+          created_at or datetime.utcnow().isoformat()))
+    return keyframe
+
+def _record_revision(conn: sqlite3.Connection, previous: Dict, content: Optional[str], summary: Optional[str],
+                     input_fingerprint: Optional[str]):
+    # previous: the heading row before the update
+    content = previous["content"] if content is None else content
+    summary = previous["summary"] if summary is None else summary
+    if content == previous["content"] and summary == previous["summary"]:
+        return
+    last = conn.execute("""
+    SELECT revision, keyframe, content_hash FROM revisions WHERE heading_id = ? ORDER BY revision DESC LIMIT 1
+    """, (previous["id"],)).fetchone()
+    base = None
+    # only delta against the stored text if it really is the last revision
+    if last and last["content_hash"] == _text_hash(previous["content"]):
+        base = {"keyframe": last["keyframe"], "content": previous["content"]}
+    _insert_revision(conn, previous["id"], last["revision"] + 1 if last else 1, base, content, summary,
+                     input_fingerprint or previous["input_fingerprint"])
+
+def _replay(rows: Iterable, text: Optional[str] = None) -> Optional[str]:
+    # rows from a keyframe onwards, or deltas on top of `text`
+    for row in rows:
+        text = apply_delta(text, json.loads(_decompress(row["content"]))) if row["delta"] else _decompress(row["content"])
+    return text
+
+def get_revision(conn: sqlite3.Connection, heading_id: int, revision: Optional[int] = None, at: Optional[str] = None) -> Optional[Dict]:
+    # one revision by number, the latest as of `at` (ISO timestamp, UTC), or the latest
+    if revision is not None:
+        target = conn.execute("SELECT revision, keyframe FROM revisions WHERE heading_id = ? AND revision = ?",
+                              (heading_id, revision)).fetchone()
+    else:
+        target = conn.execute("""
+        SELECT revision, keyframe FROM revisions
+        WHERE heading_id = ? AND (? IS NULL OR created_at <= ?)
+        ORDER BY revision DESC LIMIT 1
+        """, (heading_id, at, at)).fetchone()
+    if not target:
+        return None
+    rows = conn.execute("""
+    SELECT revision, delta, content, summary, input_fingerprint, created_at FROM revisions
+    WHERE heading_id = ? AND revision BETWEEN ? AND ?
+    ORDER BY revision
+    """, (heading_id, target["keyframe"], target["revision"])).fetchall()
+    return {
+        "revision": target["revision"],
+        "content": _replay(rows),
+        "summary": _decompress(rows[-1]["summary"]),
+        "input_fingerprint": rows[-1]["input_fingerprint"],
+        "created_at": rows[-1]["created_at"],
+    }
+
+def list_revisions(conn: sqlite3.Connection, heading_id: int) -> List[Dict]:
+    cursor = conn.execute("""
+    SELECT revision, delta, created_at, input_fingerprint,
+        COALESCE(LENGTH(content), 0) + COALESCE(LENGTH(summary), 0) AS stored_bytes
+    FROM revisions WHERE heading_id = ? ORDER BY revision
+    """, (heading_id,))
+    return [dict(r) for r in cursor.fetchall()]
+
+def get_book_at(conn: sqlite3.Connection, book_id: int, at: str) -> List[Dict]:
+    # every heading of the book as it stood at `at`; headings not written yet have no content
+    book = []
+    for heading in conn.execute("""
+    SELECT id, heading_number, heading_title FROM headings WHERE book_id = ? ORDER BY heading_number, id
+    """, (book_id,)).fetchall():
+        revision = get_revision(conn, heading["id"], at=at) or {"revision": None, "content": None, "summary": None}
+        book.append({"heading_number": heading["heading_number"], "heading_title": heading["heading_title"],
+                     "revision": revision["revision"], "content": revision["content"], "summary": revision["summary"]})
+    return book
+
+def compact_revisions(conn: sqlite3.Connection, heading_id: int, keep_last: int = 10, keep_daily: Optional[int] = 30,
+                      now: Optional[datetime] = None) -> int:
+    # Retention: the newest `keep_last` revisions, plus the last revision of
+    # each day for the `keep_daily` days before them (None: every day,
+    # 0: none). Kept revisions keep their numbers and are re-encoded as
+    # fresh delta chains. Returns the number of revisions removed.
+    cutoff = ((now or datetime.utcnow()) - timedelta(days=keep_daily or 0)).date().isoformat()
+    with transaction(conn):
+        rows = conn.execute("""
+        SELECT revision, delta, content, summary, input_fingerprint, created_at FROM revisions
+        WHERE heading_id = ? ORDER BY revision
+        """, (heading_id,)).fetchall()
+        older = rows[:-keep_last] if keep_last else rows[:-1]
+        last_of_day = {row["created_at"][:10]: row["revision"] for row in older}
+        keep = {row["revision"] for row in rows[len(older):]}
+        keep |= {revision for day, revision in last_of_day.items() if keep_daily is None or (keep_daily and day >= cutoff)}
+        if len(keep) == len(rows):
+            return 0
+        kept, text = [], None
+        for row in rows:
+            text = _replay([row], text)
+            if row["revision"] in keep:
+                kept.append((row, text))
+        conn.execute("DELETE FROM revisions WHERE heading_id = ?", (heading_id,))
+        base = None
+        for row, content in kept:
+            keyframe = _insert_revision(conn, heading_id, row["revision"], base, content, _decompress(row["summary"]),
+                                        row["input_fingerprint"], row["created_at"])
+            base = {"keyframe": keyframe, "content": content}
+    return len(rows) - len(kept)
+
+# =========================
+# Export Renders Handlers
+# =========================
+def get_stale_export_headings(conn: sqlite3.Connection, book_id: int, formats: Iterable[str], force: bool = False) -> List[Dict]:
+    # headings missing a render in any format, or edited since it was rendered
+    formats = list(formats)
+    cursor = conn.cursor()
     cursor.execute(f"""
-    SELECT heading_number, heading_title, sub_heading, description, summary, content from {table_name}
+    SELECT h.id, h.heading_number, h.heading_title, h.updated_at
+    FROM headings h
+    WHERE h.book_id = ? AND (? OR (
+        SELECT COUNT(*) FROM export_renders r
+        WHERE r.heading_id = h.id AND r.source_updated_at = h.updated_at
+        AND r.format IN ({', '.join('?' * len(formats))})
+    ) < ?)
+    ORDER BY h.heading_number, h.id
+    """, (book_id, force, *formats, len(formats)))
+    return [dict(r) for r in cursor.fetchall()]
+
+def get_heading_content(conn: sqlite3.Connection, heading_id: int) -> Optional[str]:
+    row = conn.execute("SELECT content FROM headings WHERE id = ?", (heading_id,)).fetchone()
+    return row[0] if row else None
+
+def save_export_renders(conn: sqlite3.Connection, renders: Iterable[tuple]):
+    # renders: (heading_id, format, source_updated_at, body)
+    with transaction(conn):
+        conn.executemany("""
+        INSERT OR REPLACE INTO export_renders (heading_id, format, source_updated_at, body)
+        VALUES (?, ?, ?, ?)
+        """, renders)
+
+def iter_export_renders(conn: sqlite3.Connection, book_id: int, format: str) -> Iterator[str]:
+    cursor = conn.cursor()
+    cursor.execute("""
+    SELECT r.body
+    FROM headings h JOIN export_renders r ON r.heading_id = h.id AND r.format = ?
+    WHERE h.book_id = ?
+    ORDER BY h.heading_number, h.id
+    """, (format, book_id))
+    for row in cursor:
+        yield row[0]
+
+# =========================
+# Job Queue Handlers
+# =========================
+# Task kinds: outline -> (content, summary) per heading -> export. A task is
+# only claimable once every earlier task (lower seq) of its job is done, so
+# a job resumes from exactly the last completed step.
+JOB_TASK_KINDS = ("outline", "content", "summary", "export")
+
+def add_job(conn: sqlite3.Connection, book_title: str, notes: str, heading_notes: Optional[Dict] = None,
+            output_stem: Optional[str] = None, export_formats: Iterable[str] = ("docx",), max_attempts: int = 3) -> int:
+    now = datetime.utcnow().isoformat()
+    with transaction(conn):
+        cursor = conn.execute("""
+        INSERT INTO jobs (book_title, notes, heading_notes, output_stem, export_formats, created_at, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, (book_title, notes, json.dumps(heading_notes or {}), output_stem, json.dumps(list(export_formats)), now, now))
+        job_id = cursor.lastrowid
+        add_job_tasks(conn, job_id, [{"seq": 0, "kind": "outline"}], max_attempts)
+    return job_id
+
+def add_job_tasks(conn: sqlite3.Connection, job_id: int, tasks: Iterable[Dict], max_attempts: int = 3):
+    now = datetime.utcnow().isoformat()
+    with transaction(conn):
+        conn.executemany("""
+        INSERT INTO job_tasks (job_id, seq, kind, heading_title, max_attempts, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+        """, [(job_id, task["seq"], task["kind"], task.get("heading_title"), max_attempts, now) for task in tasks])
+
+def get_job(conn: sqlite3.Connection, job_id: int) -> Optional[Dict]:
+    row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    if not row:
+        return None
+    job = dict(row)
+    job["heading_notes"] = json.loads(job["heading_notes"] or "{}")
+    job["export_formats"] = json.loads(job["export_formats"] or "[]")
+    return job
+
+def get_job_progress(conn: sqlite3.Connection, job_id: int) -> Dict:
+    # {"status": job status, "tasks": {task status: count}}
+    job = conn.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    counts = conn.execute("SELECT status, COUNT(*) FROM job_tasks WHERE job_id = ? GROUP BY status", (job_id,)).fetchall()
+    return {"status": job[0] if job else None, "tasks": {status: count for status, count in counts}}
+
+def claim_task(conn: sqlite3.Connection, worker_id: str, lease_seconds: float) -> Optional[Dict]:
+    # next runnable task: pending and due, or running under an expired lease
+    # (its worker died). BEGIN IMMEDIATE makes the claim atomic across processes.
+    with transaction(conn):
+        while True:
+            now = time.time()
+            row = conn.execute("""
+            SELECT t.* FROM job_tasks t
+            WHERE ((t.status = 'pending' AND t.available_at <= ?) OR (t.status = 'running' AND t.lease_expires_at < ?))
+            AND NOT EXISTS (
+                SELECT 1 FROM job_tasks p WHERE p.job_id = t.job_id AND p.seq < t.seq AND p.status != 'done'
+            )
+            ORDER BY t.job_id, t.seq
+            LIMIT 1
+            """, (now, now)).fetchone()
+            if not row:
+                return None
+            task = dict(row)
+            if task["attempts"] >= task["max_attempts"]:
+                # its last attempt crashed mid-task
+                _fail_job(conn, task, task["error"] or "lease expired on final attempt")
+                continue
+            conn.execute("""
+            UPDATE job_tasks
+            SET status = 'running', attempts = attempts + 1, lease_owner = ?, lease_expires_at = ?, updated_at = ?
+            WHERE id = ?
+            """, (worker_id, now + lease_seconds, datetime.utcnow().isoformat(), task["id"]))
+            conn.execute("UPDATE jobs SET status = 'running', updated_at = ? WHERE id = ? AND status = 'pending'",
+                         (datetime.utcnow().isoformat(), task["job_id"]))
+            task.update(status="running", attempts=task["attempts"] + 1, lease_owner=worker_id)
+            return task
+
+def renew_lease(conn: sqlite3.Connection, task_id: int, worker_id: str, lease_seconds: float) -> bool:
+    # False once another worker has taken the task over
+    cursor = conn.execute("""
+    UPDATE job_tasks SET lease_expires_at = ?
+    WHERE id = ? AND lease_owner = ? AND status = 'running'
+    """, (time.time() + lease_seconds, task_id, worker_id))
+    _commit(conn)
+    return cursor.rowcount == 1
+
+def complete_task(conn: sqlite3.Connection, task: Dict, worker_id: str) -> bool:
+    # only the current lease holder may complete; run it in the same
+    # transaction as the task's writes so both land or neither does
+    now = datetime.utcnow().isoformat()
+    with transaction(conn):
+        cursor = conn.execute("""
+        UPDATE job_tasks SET status = 'done', lease_owner = NULL, lease_expires_at = NULL, error = NULL, updated_at = ?
+        WHERE id = ? AND lease_owner = ? AND status = 'running'
+        """, (now, task["id"], worker_id))
+        if cursor.rowcount != 1:
+            return False
+        conn.execute("""
+        UPDATE jobs SET status = 'done', updated_at = ?
+        WHERE id = ? AND NOT EXISTS (SELECT 1 FROM job_tasks WHERE job_id = ? AND status != 'done')
+        """, (now, task["job_id"], task["job_id"]))
+    return True
+
+def fail_task(conn: sqlite3.Connection, task: Dict, worker_id: str, error: str, retry_backoff: float = 30.0) -> bool:
+    # back to pending with exponential backoff, or failed (with its job) once out of attempts
+    with transaction(conn):
+        row = conn.execute("SELECT attempts, max_attempts FROM job_tasks WHERE id = ? AND lease_owner = ?",
+                           (task["id"], worker_id)).fetchone()
+        if not row:
+            return False
+        attempts, max_attempts = row
+        if attempts >= max_attempts:
+            _fail_job(conn, task, error)
+            return True
+        conn.execute("""
+        UPDATE job_tasks
+        SET status = 'pending', available_at = ?, lease_owner = NULL, lease_expires_at = NULL, error = ?, updated_at = ?
+        WHERE id = ?
+        """, (time.time() + retry_backoff * 2 ** (attempts - 1), error, datetime.utcnow().isoformat(), task["id"]))
+    return True
+
+def _fail_job(conn: sqlite3.Connection, task: Dict, error: str):
+    now = datetime.utcnow().isoformat()
+    conn.execute("""
+    UPDATE job_tasks SET status = 'failed', lease_owner = NULL, lease_expires_at = NULL, error = ?, updated_at = ?
+    WHERE id = ?
+    """, (error, now, task["id"]))
+    conn.execute("UPDATE jobs SET status = 'failed', error = ?, updated_at = ? WHERE id = ?", (error, now, task["job_id"]))
+
+def count_open_tasks(conn: sqlite3.Connection) -> int:
+    # tasks that still need a worker: pending (maybe backing off) or running
+    return conn.execute("SELECT COUNT(*) FROM job_tasks WHERE status IN ('pending', 'running')").fetchone()[0]
+
+def retry_job(conn: sqlite3.Connection, job_id: int):
+    # give a failed job a fresh set of attempts from the step that failed
+    now = datetime.utcnow().isoformat()
+    with transaction(conn):
+        conn.execute("""
+        UPDATE job_tasks SET status = 'pending', attempts = 0, available_at = 0, updated_at = ?
+        WHERE job_id = ? AND status = 'failed'
+        """, (now, job_id))
+        conn.execute("UPDATE jobs SET status = 'running', error = NULL, updated_at = ? WHERE id = ?", (now, job_id))
+
+# =========================
+# LLM Call Telemetry Handlers
+# =========================
+LLM_CALL_COLUMNS = (
+    "ts", "book_title", "book_id", "heading", "stage", "model", "ok", "cached", "streamed", "latency", "ttfb",
+    "retries", "prompt_tokens", "completion_tokens", "estimated_prompt_tokens", "cost", "error"
+)
+
+def add_llm_calls(conn: sqlite3.Connection, records: Iterable[Dict]):
+    with transaction(conn):
+        conn.executemany(f"""
+        INSERT INTO llm_calls ({', '.join(LLM_CALL_COLUMNS)})
+        VALUES ({', '.join('?' * len(LLM_CALL_COLUMNS))})
+        """, [tuple(record.get(column) for column in LLM_CALL_COLUMNS) for record in records])
+
+def get_llm_calls(conn: sqlite3.Connection, book_title: str) -> List[Dict]:
+    cursor = conn.execute(f"SELECT {', '.join(LLM_CALL_COLUMNS)} FROM llm_calls WHERE book_title = ? ORDER BY id", (book_title,))
+    return [dict(r) for r in cursor.fetchall()]
+
+# =========================
+# Notification Queue Handlers
+# =========================
+# pending -> sending (leased by one dispatcher) -> sent, or back to pending
+# with backoff on a failed delivery, failed once out of attempts
+def add_notification(conn: sqlite3.Connection, event: str, book_title: Optional[str] = None, payload: Optional[Dict] = None) -> int:
+    # inside a transaction() the event only exists if the stage's writes commit
+    cursor = conn.execute("""
+    INSERT INTO notifications (event, book_title, payload, created_at) VALUES (?, ?, ?, ?)
+    """, (event, book_title, json.dumps(payload or {}), time.time()))
+    _commit(conn)
+    return cursor.lastrowid
+
+def claim_notifications(conn: sqlite3.Connection, owner: str, limit: int, lease_seconds: float, min_age: float = 0.0) -> List[Dict]:
+    # Due notifications (or ones whose dispatcher died mid-send), oldest first.
+    # Nothing is claimed until the oldest has waited `min_age` seconds, so
+    # events arriving close together go out as one digest.
+    with transaction(conn):
+        now = time.time()
+        oldest = conn.execute("""
+        SELECT MIN(created_at) FROM notifications
+        WHERE (status = 'pending' AND available_at <= ?) OR (status = 'sending' AND lease_expires_at < ?)
+        """, (now, now)).fetchone()[0]
+        if oldest is None or now - oldest < min_age:
+            return []
+        rows = [dict(r) for r in conn.execute("""
+        SELECT * FROM notifications
+        WHERE (status = 'pending' AND available_at <= ?) OR (status = 'sending' AND lease_expires_at < ?)
+        ORDER BY id LIMIT ?
+        """, (now, now, limit)).fetchall()]
+        conn.executemany("""
+        UPDATE notifications SET status = 'sending', attempts = attempts + 1, lease_owner = ?, lease_expires_at = ? WHERE id = ?
+        """, [(owner, now + lease_seconds, row["id"]) for row in rows])
+    for row in rows:
+        row["payload"] = json.loads(row["payload"] or "{}")
+        row["attempts"] += 1
+    return rows
+
+def mark_notifications_sent(conn: sqlite3.Connection, ids: Iterable[int], owner: str):
+    with transaction(conn):
+        conn.executemany("""
+        UPDATE notifications SET status = 'sent', sent_at = ?, lease_owner = NULL, lease_expires_at = NULL, error = NULL
+        WHERE id = ? AND lease_owner = ?
+        """, [(time.time(), notification_id, owner) for notification_id in ids])
+
+def fail_notifications(conn: sqlite3.Connection, rows: Iterable[Dict], owner: str, error: str,
+                       max_attempts: int = 5, retry_backoff: float = 30.0):
+    # exponential backoff per notification, failed for good after max_attempts
+    now = time.time()
+    with transaction(conn):
+        for row in rows:
+            if row["attempts"] >= max_attempts:
+                conn.execute("""
+                UPDATE notifications SET status = 'failed', lease_owner = NULL, lease_expires_at = NULL, error = ?
+                WHERE id = ? AND lease_owner = ?
+                """, (error, row["id"], owner))
+            else:
+                conn.execute("""
+                UPDATE notifications SET status = 'pending', available_at = ?, lease_owner = NULL, lease_expires_at = NULL, error = ?
+                WHERE id = ? AND lease_owner = ?
+                """, (now + retry_backoff * 2 ** (row["attempts"] - 1), error, row["id"], owner))
+
+def get_notification_stats(conn: sqlite3.Connection) -> Dict:
+    # queue depth per status and how long the oldest undelivered event has waited
+    counts = dict(conn.execute("SELECT status, COUNT(*) FROM notifications GROUP BY status").fetchall())
+    oldest = conn.execute("SELECT MIN(created_at) FROM notifications WHERE status IN ('pending', 'sending')").fetchone()[0]
+    return {
+        "pending": counts.get("pending", 0),
+        "sending": counts.get("sending", 0),
+        "sent": counts.get("sent", 0),
+        "failed": counts.get("failed", 0),
+        "oldest_pending_age": round(time.time() - oldest, 3) if oldest is not None else None,
+    }
+
+# =========================
+# Search Index Handlers
+# =========================
+# headings_fts is an external-content FTS5 index over headings; triggers keep
+# it in step with every insert, update and delete (add_heading, update_heading,
+# bulk inserts, cascading book deletes), in the writer's own transaction.
+SEARCH_COLUMNS = ("content", "summary", "description")
+# bm25 weight per column: a hit in a summary or description says more about
+# the chapter than one somewhere in its full text
+SEARCH_WEIGHTS = (1.0, 2.0, 2.0)
+
+def _fts5_available(conn: sqlite3.Connection) -> bool:
+    try:
+        conn.execute("CREATE VIRTUAL TABLE temp._fts5_probe USING fts5(x)")
+        conn.execute("DROP TABLE temp._fts5_probe")
+        return True
+    except sqlite3.OperationalError:
+        return False
+
+def _create_search_index(conn: sqlite3.Connection):
+    columns = ", ".join(SEARCH_COLUMNS)
+    old_values = ", ".join(f"old.{column}" for column in SEARCH_COLUMNS)
+    new_values = ", ".join(f"new.{column}" for column in SEARCH_COLUMNS)
+    conn.execute(f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS headings_fts USING fts5(
+        {columns}, content='headings', content_rowid='id', tokenize='porter unicode61'
+    )
     """)
-    rows = cursor.fetchall()
-    return [dict(r) for r in rows]
+    conn.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS headings_fts_insert AFTER INSERT ON headings BEGIN
+        INSERT INTO headings_fts (rowid, {columns}) VALUES (new.id, {new_values});
+    END
+    """)
+    conn.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS headings_fts_delete AFTER DELETE ON headings BEGIN
+        INSERT INTO headings_fts (headings_fts, rowid, {columns}) VALUES ('delete', old.id, {old_values});
+    END
+    """)
+    # only the indexed columns, notes and fingerprint updates cost nothing
+    conn.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS headings_fts_update AFTER UPDATE OF {columns} ON headings BEGIN
+        INSERT INTO headings_fts (headings_fts, rowid, {columns}) VALUES ('delete', old.id, {old_values});
+        INSERT INTO headings_fts (rowid, {columns}) VALUES (new.id, {new_values});
+    END
+    """)
+
+def rebuild_search_index(conn: sqlite3.Connection):
+    # creates the index if this database predates FTS5 support, then reindexes everything
+    if not _fts5_available(conn):
+        raise RuntimeError("This SQLite build has no FTS5, full-text search is unavailable")
+    with transaction(conn):
+        _create_search_index(conn)
+        conn.execute("INSERT INTO headings_fts (headings_fts) VALUES ('rebuild')")
+
+def optimize_search_index(conn: sqlite3.Connection):
+    # merges index segments, worth running after generating many books
+    with transaction(conn):
+        conn.execute("INSERT INTO headings_fts (headings_fts) VALUES ('optimize')")
+
+def fts_query(text: str) -> str:
+    # plain words -> FTS5 query matching all of them, punctuation can't break the syntax
+    terms = re.findall(r"\w+", text)
+    return " ".join(f'"{term}"' for term in terms)
+
+def search_headings(conn: sqlite3.Connection, query: str, book_title: Optional[str] = None,
+                    columns: Optional[Iterable[str]] = None, limit: int = 20, offset: int = 0,
+                    raw: bool = False, snippet_tokens: int = 16) -> List[Dict]:
+    # Ranked (bm25, best first) chapters matching `query`, with a snippet of
+    # the best-matching column. Plain words by default; raw=True passes FTS5
+    # syntax through (phrases, OR / NOT, NEAR, prefix*).
+    match = query if raw else fts_query(query)
+    if not match:
+        return []
+    if columns:
+        unknown = set(columns) - set(SEARCH_COLUMNS)
+        if unknown:
+            raise ValueError(f"Unknown search columns {sorted(unknown)}, expected some of {SEARCH_COLUMNS}")
+        match = f"{{{' '.join(columns)}}} : ({match})"
+    weights = ", ".join(str(weight) for weight in SEARCH_WEIGHTS)
+    # rank and snippet inside the FTS table alone, then look up only the
+    # returned page; joining every match before the sort costs more than ranking
+    scope, params = "", [snippet_tokens, match]
+    if book_title is not None:
+        scope = " AND rowid IN (SELECT h.id FROM headings h JOIN books b ON b.id = h.book_id WHERE b.title = ?)"
+        params.append(book_title)
+    params.extend([limit, offset])
+    try:
+        ranked = conn.execute(f"""
+        SELECT rowid, bm25(headings_fts, {weights}) AS score, snippet(headings_fts, -1, '[', ']', '...', ?) AS snippet
+        FROM headings_fts WHERE headings_fts MATCH ?{scope} ORDER BY score LIMIT ? OFFSET ?
+        """, params).fetchall()
+    except sqlite3.OperationalError as e:
+        if "no such table: headings_fts" in str(e):
+            raise RuntimeError("Search index is missing, run rebuild_search_index() on this database")
+        raise ValueError(f"Invalid search query {query!r}: {e}")
+    if not ranked:
+        return []
+    headings = {r["heading_id"]: dict(r) for r in conn.execute(f"""
+    SELECT b.title AS book_title, h.book_id, h.id AS heading_id, h.heading_number, h.heading_title
+    FROM headings h JOIN books b ON b.id = h.book_id
+    WHERE h.id IN ({', '.join('?' * len(ranked))})
+    """, [r[0] for r in ranked]).fetchall()}
+    return [{**headings[r[0]], "score": r[1], "snippet": r[2]} for r in ranked]
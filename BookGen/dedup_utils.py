@@ -0,0 +1,231 @@
+import re, zlib
+from typing import Dict, Hashable, Iterable, List, Optional, Tuple
+
+DEDUP_ACTIONS = ("flag", "regenerate")
+_WORD = re.compile(r"\w+")
+
+def _numpy():
+    # optional dependency, only imported once duplicate detection is used
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError("Duplicate detection needs NumPy (pip install numpy)")
+    return numpy
+
+# =========================
+# MinHash Signatures
+# =========================
+class MinHasher:
+    # Word k-shingles hashed to 64 bits and reduced to `num_perm` minimums,
+    # one per multiply-shift hash function. The share of equal positions
+    # between two signatures estimates the Jaccard similarity of the texts.
+    # Shingling, hashing and the min-reduction are all NumPy array ops.
+    def __init__(self, num_perm: int = 120, shingle_size: int = 5, seed: int = 1, chunk_shingles: int = 20_000):
+        np = _numpy()
+        self.np = np
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.chunk_shingles = chunk_shingles
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, 2 ** 63, num_perm, dtype=np.uint64) | np.uint64(1)
+        self._b = rng.integers(0, 2 ** 63, num_perm, dtype=np.uint64)
+        self._word_ids: Dict[str, int] = {}
+
+    def _word_hashes(self, text: str):
+        ids = self._word_ids
+        words = _WORD.findall((text or "").lower())
+        for word in set(words).difference(ids):
+            ids[word] = zlib.crc32(word.encode("utf-8"))
+        return self.np.fromiter(map(ids.__getitem__, words), dtype=self.np.uint64, count=len(words))
+
+    def shingles(self, text: str):
+        # polynomial rolling hash over each window of `shingle_size` words, wrapping at 2**64
+        np = self.np
+        words = self._word_hashes(text)
+        k = min(self.shingle_size, len(words))
+        if k == 0:
+            return words
+        n = len(words) - k + 1
+        hashes = words[:n].copy()
+        with np.errstate(over="ignore"):
+            for j in range(1, k):
+                hashes = hashes * np.uint64(1099511628211) + words[j:n + j]
+        return np.unique(hashes)
+
+    def _permuted(self, shingles):
+        # (a * x + b) >> 32 for every shingle and hash function, in one buffer
+        np = self.np
+        hashed = np.empty((len(shingles), self.num_perm), dtype=np.uint64)
+        with np.errstate(over="ignore"):
+            np.multiply(shingles[:, None], self._a, out=hashed)
+            hashed += self._b
+        hashed >>= np.uint64(32)
+        return hashed
+
+    def _minimums(self, shingles):
+        return self._permuted(shingles).min(axis=0)
+
+    def signature(self, text: str):
+        # None for text without words
+        shingles = self.shingles(text)
+        return self.signature_from_shingles(shingles) if len(shingles) else None
+
+    def signature_from_shingles(self, shingles):
+        # at most `chunk_shingles` x num_perm hashes are held at once
+        step = self.chunk_shingles
+        return self.np.minimum.reduce([self._minimums(shingles[i:i + step]) for i in range(0, len(shingles), step)])
+
+    def signatures(self, texts: Iterable[str]) -> List:
+        # Batch form of signature(): shingles of many texts are hashed in one
+        # array and reduced per text with minimum.reduceat, chunk by chunk.
+        np = self.np
+        shingle_sets = [self.shingles(text) for text in texts]
+        result = [None] * len(shingle_sets)
+        batch, size = [], 0
+        def flush():
+            if not batch:
+                return
+            offsets = np.cumsum([0] + [len(shingle_sets[i]) for i in batch[:-1]])
+            hashed = self._permuted(np.concatenate([shingle_sets[i] for i in batch]))
+            for i, minimums in zip(batch, np.minimum.reduceat(hashed, offsets, axis=0)):
+                result[i] = minimums
+        for i, shingles in enumerate(shingle_sets):
+            if not len(shingles):
+                continue
+            if len(shingles) > self.chunk_shingles:
+                result[i] = self.signature_from_shingles(shingles)
+                continue
+            if size + len(shingles) > self.chunk_shingles:
+                flush()
+                batch, size = [], 0
+            batch.append(i)
+            size += len(shingles)
+        flush()
+        return result
+
+    def similarity(self, a, b) -> float:
+        return float((a == b).mean())
+
+# =========================
+# LSH Index
+# =========================
+class DuplicateIndex:
+    # Banded locality-sensitive hashing over MinHash signatures: texts that
+    # share any band of `rows` values become candidates, candidates are then
+    # checked against the full signature. 40 bands of 3 rows surface pairs
+    # down to ~0.3 similarity, so anything at the usual 0.5+ is almost never missed.
+    def __init__(self, hasher: MinHasher, bands: int = 40, max_bucket: int = 1000):
+        self.hasher = hasher
+        self.bands = bands
+        self.rows = hasher.num_perm // bands
+        self.max_bucket = max_bucket
+        self._signatures: Dict[Hashable, object] = {}
+        self._buckets: Dict[Tuple[int, bytes], List[Hashable]] = {}
+
+    def __len__(self):
+        return len(self._signatures)
+
+    def _band_keys(self, signature):
+        return list(enumerate(map(bytes, signature[:self.bands * self.rows].reshape(self.bands, self.rows))))
+
+    def add(self, key: Hashable, signature):
+        if signature is None:
+            return
+        self._signatures[key] = signature
+        for band_key in self._band_keys(signature):
+            bucket = self._buckets.setdefault(band_key, [])
+            # very common bands (boilerplate) stop growing instead of going quadratic
+            if len(bucket) < self.max_bucket:
+                bucket.append(key)
+
+    def query(self, signature, threshold: float, exclude=None) -> List[Tuple[Hashable, float]]:
+        # indexed keys at least `threshold` similar, most similar first
+        if signature is None:
+            return []
+        candidates = set()
+        for band_key in self._band_keys(signature):
+            candidates.update(self._buckets.get(band_key, ()))
+        matches = []
+        for key in candidates:
+            if exclude and exclude(key):
+                continue
+            similarity = self.hasher.similarity(signature, self._signatures[key])
+            if similarity >= threshold:
+                matches.append((key, similarity))
+        return sorted(matches, key=lambda match: -match[1])
+
+    def pairs(self, threshold: float) -> List[Tuple[Hashable, Hashable, float]]:
+        # every indexed pair at least `threshold` similar
+        seen, found = set(), []
+        for bucket in self._buckets.values():
+            for i, a in enumerate(bucket):
+                for b in bucket[i + 1:]:
+                    pair = (a, b)
+                    if pair in seen:
+                        continue
+                    seen.add(pair)
+                    similarity = self.hasher.similarity(self._signatures[a], self._signatures[b])
+                    if similarity >= threshold:
+                        found.append((a, b, similarity))
+        return sorted(found, key=lambda pair: -pair[2])
+
+def paragraph_items(key: Hashable, text: Optional[str], min_words: int = 40) -> List[Tuple[Tuple[Hashable, int], str]]:
+    # ((key, paragraph index), paragraph) for paragraphs long enough to compare
+    paragraphs = re.split(r"\n\s*\n", text or "")
+    return [((key, i), p) for i, p in enumerate(paragraphs) if len(_WORD.findall(p)) >= min_words]
+
+def find_duplicates(items: Iterable[Tuple[Hashable, str]], threshold: float = 0.5, hasher: Optional[MinHasher] = None,
+                    bands: int = 40, exclude=None) -> List[Tuple[Hashable, Hashable, float]]:
+    # Batch audit: near-duplicate pairs among (key, text) items, most similar
+    # first. exclude(a, b) drops pairs that should not count (same chapter).
+    hasher = hasher or MinHasher()
+    items = list(items)
+    index = DuplicateIndex(hasher, bands)
+    for (key, _), signature in zip(items, hasher.signatures(text for _, text in items)):
+        index.add(key, signature)
+    return [pair for pair in index.pairs(threshold) if not (exclude and exclude(pair[0], pair[1]))]
+
+# =========================
+# Per-Book Tracker
+# =========================
+class DuplicateTracker:
+    # Chapters of one book as they are generated: each new chapter's content,
+    # summary and long paragraphs are compared with the chapters before it.
+    def __init__(self, threshold: float = 0.5, paragraph_threshold: Optional[float] = None, min_paragraph_words: int = 40):
+        self.threshold = threshold
+        self.paragraph_threshold = paragraph_threshold or max(threshold, 0.6)
+        self.min_paragraph_words = min_paragraph_words
+        self.hasher = MinHasher()
+        # summaries are short, smaller shingles keep their signatures meaningful
+        self.summary_hasher = MinHasher(shingle_size=3)
+        self.content = DuplicateIndex(self.hasher)
+        self.summaries = DuplicateIndex(self.summary_hasher)
+        self.paragraphs = DuplicateIndex(self.hasher)
+        self.summary_text: Dict[str, str] = {}
+
+    def add(self, title: str, content: Optional[str], summary: Optional[str]):
+        self.content.add(title, self.hasher.signature(content or ""))
+        self.summaries.add(title, self.summary_hasher.signature(summary or ""))
+        items = paragraph_items(title, content, self.min_paragraph_words)
+        for (key, _), signature in zip(items, self.hasher.signatures(p for _, p in items)):
+            self.paragraphs.add(key, signature)
+        self.summary_text[title] = summary or ""
+
+    def add_many(self, chapters: Iterable[Tuple[str, Optional[str], Optional[str]]]):
+        for title, content, summary in chapters:
+            self.add(title, content, summary)
+
+    def check(self, title: str, content: Optional[str], summary: Optional[str]) -> List[Dict]:
+        # findings against earlier chapters, nothing is indexed here
+        findings = []
+        not_self = lambda key: key == title
+        for other, similarity in self.content.query(self.hasher.signature(content or ""), self.threshold, not_self):
+            findings.append({"heading": title, "other": other, "level": "chapter", "similarity": round(similarity, 3)})
+        for other, similarity in self.summaries.query(self.summary_hasher.signature(summary or ""), self.threshold, not_self):
+            findings.append({"heading": title, "other": other, "level": "summary", "similarity": round(similarity, 3)})
+        items = paragraph_items(title, content, self.min_paragraph_words)
+        for ((_, i), _), signature in zip(items, self.hasher.signatures(p for _, p in items)):
+            for (other, j), similarity in self.paragraphs.query(signature, self.paragraph_threshold, lambda key: key[0] == title)[:1]:
+                findings.append({"heading": title, "other": other, "level": "paragraph", "paragraph": i,
+                                 "other_paragraph": j, "similarity": round(similarity, 3)})
+        return findings
@@ -0,0 +1,137 @@
+import threading, time
+from typing import Dict, Optional
+from urllib.parse import urlparse
+
+GENERATION_MODES = ("sequential", "pipelined", "parallel")
+# "section": each outline section is its own call, run in parallel and stitched
+GRANULARITIES = ("chapter", "section")
+
+# =========================
+# Rate Limiting
+# =========================
+class RateLimiter:
+    # Token bucket shared by every worker talking to the same provider.
+    # requests_per_minute=None only caps concurrency.
+    def __init__(self, requests_per_minute: Optional[float] = None, max_concurrent: Optional[int] = None):
+        self.requests_per_minute = requests_per_minute
+        self.max_concurrent = max_concurrent
+        self._capacity = max(1.0, requests_per_minute / 60.0) if requests_per_minute else None
+        self._tokens = self._capacity
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+        self._active = 0
+        self._slot_freed = threading.Condition(threading.Lock())
+
+    def tighten(self, requests_per_minute: Optional[float] = None, max_concurrent: Optional[int] = None):
+        # keep the strictest of the current and requested limits; None means no limit
+        with self._lock:
+            if requests_per_minute and (not self.requests_per_minute or requests_per_minute < self.requests_per_minute):
+                now = time.monotonic()
+                if self.requests_per_minute:
+                    self._refill(now)
+                self.requests_per_minute = requests_per_minute
+                self._capacity = max(1.0, requests_per_minute / 60.0)
+                self._tokens = min(self._capacity, self._capacity if self._tokens is None else self._tokens)
+                self._updated = now
+        with self._slot_freed:
+            if max_concurrent and (not self.max_concurrent or max_concurrent < self.max_concurrent):
+                # calls already running keep their slot, new ones wait until under the cap
+                self.max_concurrent = max_concurrent
+
+    def _refill(self, now: float):
+        rate = self.requests_per_minute / 60.0
+        self._tokens = min(self._capacity, self._tokens + (now - self._updated) * rate)
+        self._updated = now
+
+    def acquire(self):
+        with self._slot_freed:
+            while self.max_concurrent and self._active >= self.max_concurrent:
+                self._slot_freed.wait()
+            self._active += 1
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                wait = self._blocked_until - now
+                if wait <= 0 and self.requests_per_minute:
+                    self._refill(now)
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    wait = (1 - self._tokens) * 60.0 / self.requests_per_minute
+                elif wait <= 0:
+                    return
+            time.sleep(wait)
+
+    def release(self):
+        with self._slot_freed:
+            self._active -= 1
+            self._slot_freed.notify()
+
+    def block_for(self, seconds: float):
+        # provider told us to back off (429 / Retry-After), pause every worker
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+
+class InstanceLimiter:
+    # One BookGen instance's calls in flight on top of the provider's shared
+    # bucket: max_workers sizes this instance's pool, it is not a provider limit.
+    def __init__(self, limiter: RateLimiter, max_concurrent: Optional[int] = None):
+        self.limiter = limiter
+        self.max_concurrent = max_concurrent
+        self._slots = threading.BoundedSemaphore(max_concurrent) if max_concurrent else None
+
+    @property
+    def requests_per_minute(self) -> Optional[float]:
+        return self.limiter.requests_per_minute
+
+    def acquire(self):
+        if self._slots:
+            self._slots.acquire()
+        try:
+            self.limiter.acquire()
+        except BaseException:
+            self.release_slot()
+            raise
+
+    def release_slot(self):
+        if self._slots:
+            self._slots.release()
+
+    def release(self):
+        self.limiter.release()
+        self.release_slot()
+
+    def block_for(self, seconds: float):
+        self.limiter.block_for(seconds)
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+
+_rate_limiters: Dict[str, RateLimiter] = {}
+_rate_limiters_lock = threading.Lock()
+
+def get_rate_limiter(url: str, requests_per_minute: Optional[float] = None, max_concurrent: Optional[int] = None) -> RateLimiter:
+    # one limiter per provider host, shared by all BookGen instances in the process;
+    # a later instance asking for tighter limits tightens them for everyone.
+    # max_concurrent here is a provider-wide ceiling, per-instance caps go in InstanceLimiter
+    provider = urlparse(url).netloc or url
+    with _rate_limiters_lock:
+        limiter = _rate_limiters.get(provider)
+        if limiter is None:
+            limiter = RateLimiter(requests_per_minute, max_concurrent)
+            _rate_limiters[provider] = limiter
+        else:
+            limiter.tighten(requests_per_minute, max_concurrent)
+        return limiter
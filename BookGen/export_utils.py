@@ -0,0 +1,395 @@
+import re, uuid, zipfile
+from collections import deque
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from xml.sax.saxutils import escape
+
+# =========================
+# Text Helpers
+# =========================
+_INVALID_XML_CHARS = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+_PARAGRAPH_BREAK = re.compile(r"\n[ \t]*\n+")
+
+def split_paragraphs(text: str) -> Iterator[str]:
+    # blank lines separate paragraphs; walks the text without copying it whole
+    start = 0
+    for match in _PARAGRAPH_BREAK.finditer(text):
+        paragraph = text[start:match.start()].strip()
+        if paragraph:
+            yield paragraph
+        start = match.end()
+    paragraph = text[start:].strip()
+    if paragraph:
+        yield paragraph
+
+def xml_text(text: str) -> str:
+    return escape(_INVALID_XML_CHARS.sub("", text))
+
+# =========================
+# Streaming DOCX Writer
+# =========================
+W_NS = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+
+CONTENT_TYPES_XML = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">
+<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>
+<Default Extension="xml" ContentType="application/xml"/>
+<Override PartName="/word/document.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>
+<Override PartName="/word/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.styles+xml"/>
+</Types>"""
+
+ROOT_RELS_XML = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="word/document.xml"/>
+</Relationships>"""
+
+DOCUMENT_RELS_XML = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>
+</Relationships>"""
+
+def _style(style_id, name, size, bold=False, outline=None, spacing_before=0):
+    outline_xml = f'<w:outlineLvl w:val="{outline}"/>' if outline is not None else ""
+    return (
+        f'<w:style w:type="paragraph" w:styleId="{style_id}"><w:name w:val="{name}"/>'
+        f'<w:basedOn w:val="Normal"/><w:next w:val="Normal"/><w:qFormat/>'
+        f'<w:pPr><w:keepNext/><w:spacing w:before="{spacing_before}" w:after="120"/>{outline_xml}</w:pPr>'
+        f'<w:rPr>{"<w:b/>" if bold else ""}<w:sz w:val="{size}"/></w:rPr></w:style>'
+    )
+
+# Times New Roman 12pt body text, same look as the python-docx export had
+STYLES_XML = (
+    f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n<w:styles xmlns:w="{W_NS}">'
+    '<w:docDefaults><w:rPrDefault><w:rPr>'
+    '<w:rFonts w:ascii="Times New Roman" w:hAnsi="Times New Roman" w:cs="Times New Roman" w:eastAsia="Times New Roman"/>'
+    '<w:sz w:val="24"/></w:rPr></w:rPrDefault>'
+    '<w:pPrDefault><w:pPr><w:spacing w:after="160"/></w:pPr></w:pPrDefault></w:docDefaults>'
+    '<w:style w:type="paragraph" w:default="1" w:styleId="Normal"><w:name w:val="Normal"/><w:qFormat/></w:style>'
+    + _style("Title", "Title", 56, spacing_before=0)
+    + _style("Heading1", "heading 1", 32, bold=True, outline=0, spacing_before=480)
+    + _style("Heading2", "heading 2", 26, bold=True, outline=1, spacing_before=200)
+    + _style("Heading3", "heading 3", 24, bold=True, outline=2, spacing_before=200)
+    + '</w:styles>'
+)
+
+DOCUMENT_HEADER = (
+    f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    f'<w:document xmlns:w="{W_NS}"><w:body>'
+)
+DOCUMENT_FOOTER = (
+    '<w:sectPr><w:pgSz w:w="12240" w:h="15840"/>'
+    '<w:pgMar w:top="1440" w:right="1440" w:bottom="1440" w:left="1440" w:header="720" w:footer="720" w:gutter="0"/>'
+    '</w:sectPr></w:body></w:document>'
+)
+
+def docx_paragraph(text: str, style: Optional[str] = None) -> str:
+    style_xml = f'<w:pPr><w:pStyle w:val="{style}"/></w:pPr>' if style else ""
+    # single newlines inside a paragraph become line breaks
+    runs = "<w:br/>".join(
+        f'<w:t xml:space="preserve">{xml_text(line)}</w:t>' for line in text.split("\n")
+    )
+    return f"<w:p>{style_xml}<w:r>{runs}</w:r></w:p>"
+
+def docx_heading(text: str, level: int = 1) -> str:
+    return docx_paragraph(text, "Title" if level == 0 else f"Heading{min(level, 3)}")
+
+class DocxStreamWriter:
+    # Writes a .docx (WordprocessingML zip) paragraph by paragraph straight
+    # into the compressed document.xml entry, so memory does not grow with
+    # the length of the book.
+    def __init__(self, output_path: str):
+        self.output_path = output_path
+        self._zip = zipfile.ZipFile(output_path, "w", compression=zipfile.ZIP_DEFLATED)
+        self._zip.writestr("[Content_Types].xml", CONTENT_TYPES_XML)
+        self._zip.writestr("_rels/.rels", ROOT_RELS_XML)
+        self._zip.writestr("word/_rels/document.xml.rels", DOCUMENT_RELS_XML)
+        self._zip.writestr("word/styles.xml", STYLES_XML)
+        self._document = self._zip.open("word/document.xml", "w", force_zip64=True)
+        self._write(DOCUMENT_HEADER)
+
+    def _write(self, xml: str):
+        self._document.write(xml.encode("utf-8"))
+
+    def write_xml(self, xml: str):
+        # pre-rendered body XML, e.g. from docx_paragraph()
+        self._write(xml)
+
+    def add_paragraph(self, text: str, style: Optional[str] = None):
+        self._write(docx_paragraph(text, style))
+
+    def add_heading(self, text: str, level: int = 1):
+        self._write(docx_heading(text, level))
+
+    def close(self):
+        if self._document is None:
+            return
+        self._write(DOCUMENT_FOOTER)
+        self._document.close()
+        self._document = None
+        self._zip.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+# =========================
+# Exporters
+# =========================
+class Exporter:
+    # One output format. render_chapter() is a pure function of the heading
+    # row so it can run in a worker process; the instance then assembles the
+    # rendered chapters into the output file in heading_number order.
+    name = ""
+    extension = ""
+
+    @staticmethod
+    def render_chapter(number: int, title: str, content: Optional[str]) -> str:
+        raise NotImplementedError
+
+    def __init__(self, output_path: str, title: str, chapters: List[Tuple[int, str]]):
+        # chapters: (heading_number, heading_title) for tables of contents
+        self.output_path = output_path
+        self.title = title
+        self.chapters = chapters
+
+    def write_chapter(self, rendered: str):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+class TextExporter(Exporter):
+    # single text file: header, chapters as rendered, footer
+    def __init__(self, output_path: str, title: str, chapters: List[Tuple[int, str]]):
+        super().__init__(output_path, title, chapters)
+        self._file = open(output_path, "w", encoding="utf-8")
+        self._file.write(self.header())
+
+    def header(self) -> str:
+        return ""
+
+    def footer(self) -> str:
+        return ""
+
+    def write_chapter(self, rendered: str):
+        self._file.write(rendered)
+
+    def close(self):
+        if self._file is None:
+            return
+        self._file.write(self.footer())
+        self._file.close()
+        self._file = None
+
+class MarkdownExporter(TextExporter):
+    name = "markdown"
+    extension = ".md"
+
+    @staticmethod
+    def render_chapter(number, title, content):
+        body = "\n\n".join(split_paragraphs(content or ""))
+        return f"## {number}. {title}\n\n{body}\n\n"
+
+    def header(self):
+        return f"# {self.title}\n\n"
+
+class PlainTextExporter(TextExporter):
+    name = "txt"
+    extension = ".txt"
+
+    @staticmethod
+    def render_chapter(number, title, content):
+        heading = f"{number}. {title}"
+        body = "\n\n".join(split_paragraphs(content or ""))
+        return f"{heading}\n{'=' * len(heading)}\n\n{body}\n\n\n"
+
+    def header(self):
+        return f"{self.title.upper()}\n\n\n"
+
+def html_paragraphs(content: Optional[str]) -> str:
+    return "".join(
+        f"<p>{xml_text(paragraph).replace(chr(10), '<br/>')}</p>\n"
+        for paragraph in split_paragraphs(content or "")
+    )
+
+class HTMLExporter(TextExporter):
+    name = "html"
+    extension = ".html"
+
+    @staticmethod
+    def render_chapter(number, title, content):
+        return (
+            f'<section id="chapter-{number}">\n<h2>{xml_text(f"{number}. {title}")}</h2>\n'
+            f"{html_paragraphs(content)}</section>\n"
+        )
+
+    def header(self):
+        toc = "".join(
+            f'<li><a href="#chapter-{number}">{xml_text(f"{number}. {title}")}</a></li>\n'
+            for number, title in self.chapters
+        )
+        return (
+            '<!DOCTYPE html>\n<html>\n<head>\n<meta charset="utf-8"/>\n'
+            f"<title>{xml_text(self.title)}</title>\n"
+            "<style>body{max-width:40em;margin:auto;font-family:'Times New Roman',serif;line-height:1.5}</style>\n"
+            f"</head>\n<body>\n<h1>{xml_text(self.title)}</h1>\n<nav>\n<ol>\n{toc}</ol>\n</nav>\n"
+        )
+
+    def footer(self):
+        return "</body>\n</html>\n"
+
+EPUB_CONTAINER_XML = """<?xml version="1.0" encoding="UTF-8"?>
+<container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">
+<rootfiles><rootfile full-path="OEBPS/content.opf" media-type="application/oebps-package+xml"/></rootfiles>
+</container>"""
+
+def xhtml_document(title: str, body: str) -> str:
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>\n<!DOCTYPE html>\n'
+        '<html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops">\n'
+        f"<head><title>{xml_text(title)}</title></head>\n<body>\n{body}</body>\n</html>\n"
+    )
+
+class EPUBExporter(Exporter):
+    # EPUB 3: one XHTML file per chapter, package document and nav written last
+    name = "epub"
+    extension = ".epub"
+
+    @staticmethod
+    def render_chapter(number, title, content):
+        heading = f"{number}. {title}"
+        return xhtml_document(heading, f"<h2>{xml_text(heading)}</h2>\n{html_paragraphs(content)}")
+
+    def __init__(self, output_path: str, title: str, chapters: List[Tuple[int, str]]):
+        super().__init__(output_path, title, chapters)
+        self._zip = zipfile.ZipFile(output_path, "w", compression=zipfile.ZIP_DEFLATED)
+        # the mimetype entry must come first and be stored uncompressed
+        self._zip.writestr("mimetype", "application/epub+zip", compress_type=zipfile.ZIP_STORED)
+        self._zip.writestr("META-INF/container.xml", EPUB_CONTAINER_XML)
+        self._count = 0
+
+    def write_chapter(self, rendered: str):
+        self._count += 1
+        self._zip.writestr(f"OEBPS/chapter-{self._count:05d}.xhtml", rendered)
+
+    def close(self):
+        if self._zip is None:
+            return
+        files = [f"chapter-{i:05d}.xhtml" for i in range(1, self._count + 1)]
+        titles = [f"{number}. {title}" for number, title in self.chapters[:self._count]]
+        nav = "".join(f'<li><a href="{f}">{xml_text(t)}</a></li>\n' for f, t in zip(files, titles))
+        self._zip.writestr("OEBPS/nav.xhtml", xhtml_document(
+            self.title, f'<nav epub:type="toc" id="toc">\n<h1>{xml_text(self.title)}</h1>\n<ol>\n{nav}</ol>\n</nav>\n'
+        ))
+        manifest = "".join(
+            f'<item id="c{i}" href="{f}" media-type="application/xhtml+xml"/>\n' for i, f in enumerate(files, 1)
+        )
+        spine = "".join(f'<itemref idref="c{i}"/>\n' for i in range(1, len(files) + 1))
+        book_id = uuid.uuid5(uuid.NAMESPACE_URL, f"bookgen:{self.title}")
+        modified = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+        self._zip.writestr("OEBPS/content.opf", (
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<package xmlns="http://www.idpf.org/2007/opf" version="3.0" unique-identifier="book-id">\n'
+            '<metadata xmlns:dc="http://purl.org/dc/elements/1.1/">\n'
+            f'<dc:identifier id="book-id">urn:uuid:{book_id}</dc:identifier>\n'
+            f"<dc:title>{xml_text(self.title)}</dc:title>\n<dc:language>en</dc:language>\n"
+            f'<meta property="dcterms:modified">{modified}</meta>\n</metadata>\n'
+            f'<manifest>\n<item id="nav" href="nav.xhtml" media-type="application/xhtml+xml" properties="nav"/>\n{manifest}</manifest>\n'
+            f"<spine>\n{spine}</spine>\n</package>\n"
+        ))
+        self._zip.close()
+        self._zip = None
+
+class DocxExporter(Exporter):
+    name = "docx"
+    extension = ".docx"
+
+    @staticmethod
+    def render_chapter(number, title, content):
+        return docx_heading(f"{number}. {title}", level=1) + "".join(
+            docx_paragraph(paragraph) for paragraph in split_paragraphs(content or "")
+        )
+
+    def __init__(self, output_path: str, title: str, chapters: List[Tuple[int, str]]):
+        super().__init__(output_path, title, chapters)
+        self._doc = DocxStreamWriter(output_path)
+        self._doc.add_heading(title, level=0)
+
+    def write_chapter(self, rendered: str):
+        self._doc.write_xml(rendered)
+
+    def close(self):
+        self._doc.close()
+
+EXPORTERS: Dict[str, type] = {
+    exporter.name: exporter
+    for exporter in (MarkdownExporter, HTMLExporter, EPUBExporter, PlainTextExporter, DocxExporter)
+}
+DEFAULT_EXPORT_FORMATS = ("markdown", "html", "epub", "txt")
+
+def register_exporter(exporter: type):
+    # plug in a new format; render_chapter must be picklable (module level)
+    EXPORTERS[exporter.name] = exporter
+
+def get_exporter(name: str) -> type:
+    try:
+        return EXPORTERS[name]
+    except KeyError:
+        raise ValueError(f"Unknown export format {name!r}, expected one of {sorted(EXPORTERS)}")
+
+# =========================
+# Outline JSON
+# =========================
+def book_outline(book: Dict, headings: Iterable[Dict]) -> Dict:
+    # the stored book in the outline layout, with summaries and content
+    return {
+        "book_title": book["title"],
+        "outline": [{
+            "chapter_number": heading["heading_number"],
+            "chapter_title": heading["heading_title"],
+            "chapter_description": heading["description"],
+            "sections": heading["sub_heading"],
+            "summary": heading["summary"],
+            "content": heading["content"]
+        } for heading in headings]
+    }
+
+# =========================
+# Parallel Rendering
+# =========================
+def render_chapter_formats(renderers: Tuple[Tuple[str, Callable], ...], number: int, title: str, content: Optional[str]) -> Dict[str, str]:
+    # every requested format from one read of the row
+    return {name: render(number, title, content) for name, render in renderers}
+
+def render_chapters(rows: Iterable[Dict], formats: Iterable[str], max_workers: Optional[int] = None, window: int = 64) -> Iterator[Tuple[Dict, Dict[str, str]]]:
+    # Renders rows in a process pool, yielding (row, {format: rendered}) in
+    # input order. Only `window` rows are in flight, so memory stays bounded.
+    # max_workers=1 renders inline without a pool.
+    renderers = tuple((name, get_exporter(name).render_chapter) for name in formats)
+    def job(row):
+        return (renderers, row["heading_number"], row["heading_title"], row.get("content"))
+    if max_workers == 1:
+        for row in rows:
+            yield row, render_chapter_formats(*job(row))
+        return
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers) as pool:
+        pending = deque()
+        for row in rows:
+            pending.append((row, pool.submit(render_chapter_formats, *job(row))))
+            # the row's content is no longer needed once it was sent to a worker
+            row.pop("content", None)
+            if len(pending) >= window:
+                done, future = pending.popleft()
+                yield done, future.result()
+        while pending:
+            done, future = pending.popleft()
+            yield done, future.result()
@@ -0,0 +1,310 @@
+import json, random, threading, time, logging
+from collections import deque
+from email.utils import parsedate_to_datetime
+from typing import AsyncIterator, Dict, Iterator, Optional, Tuple
+
+logger = logging.getLogger("BookGen")
+
+def _requests():
+    # imported on the first HTTP call, DB / export-only processes never pay for it
+    import requests
+    return requests
+
+RETRYABLE_STATUS = {408, 425, 429, 500, 502, 503, 504}
+
+class TransportError(RuntimeError):
+    def __init__(self, message: str, status: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+
+class CircuitOpenError(TransportError):
+    pass
+
+# =========================
+# Circuit Breaker
+# =========================
+class CircuitBreaker:
+    # closed -> open after `failure_threshold` consecutive failed calls,
+    # open -> half-open after `reset_timeout` seconds, one trial call decides.
+    # While the trial is in flight every other call is turned away.
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_started = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        # True when the caller is the half-open trial
+        with self._lock:
+            if self.state == "closed":
+                return False
+            now = time.monotonic()
+            if self.state == "open" and now - self._opened_at < self.reset_timeout:
+                raise CircuitOpenError("Circuit open: LLM backend is failing, not sending request")
+            # a trial that never reported back (e.g. an abandoned stream) is replaced after reset_timeout
+            if self.state == "half-open" and now - self._trial_started < self.reset_timeout:
+                raise CircuitOpenError("Circuit half-open: waiting on the trial request, not sending request")
+            self.state = "half-open"
+            self._trial_started = now
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self._failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == "half-open" or self._failures >= self.failure_threshold:
+                if self.state != "open":
+                    logger.warning(f"Circuit breaker opened after {self._failures} failures")
+                self.state = "open"
+                self._opened_at = time.monotonic()
+
+# =========================
+# Metrics
+# =========================
+class TransportMetrics:
+    def __init__(self, window: int = 1000):
+        self.calls = 0
+        self.failures = 0
+        self.retries = 0
+        self.latencies = deque(maxlen=window)
+        self.ttfts = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, latency: float, retries: int, ok: bool, ttft: Optional[float] = None):
+        with self._lock:
+            self.calls += 1
+            self.retries += retries
+            self.failures += 0 if ok else 1
+            self.latencies.append(latency)
+            if ttft is not None:
+                self.ttfts.append(ttft)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            latencies = sorted(self.latencies)
+            ttfts = sorted(self.ttfts)
+            calls, failures, retries = self.calls, self.failures, self.retries
+        def pct(values, p):
+            return values[min(len(values) - 1, int(p * len(values)))] if values else None
+        return {
+            "calls": calls,
+            "failures": failures,
+            "retries": retries,
+            "latency_p50": pct(latencies, 0.50),
+            "latency_p95": pct(latencies, 0.95),
+            "latency_max": latencies[-1] if latencies else None,
+            "ttft_p50": pct(ttfts, 0.50),
+            "ttft_p95": pct(ttfts, 0.95),
+        }
+
+# =========================
+# Transport
+# =========================
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+async def aiter_thread(iterator: Iterator) -> AsyncIterator:
+    # drain a blocking iterator on a worker thread into the event loop
+    import asyncio
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    done = object()
+    def pump():
+        try:
+            for item in iterator:
+                loop.call_soon_threadsafe(queue.put_nowait, item)
+            loop.call_soon_threadsafe(queue.put_nowait, done)
+        except BaseException as e:
+            loop.call_soon_threadsafe(queue.put_nowait, e)
+    worker = loop.run_in_executor(None, pump)
+    while True:
+        item = await queue.get()
+        if item is done:
+            break
+        if isinstance(item, BaseException):
+            raise item
+        yield item
+    await worker
+
+class LLMTransport:
+    # Pooled keep-alive session for chat-completion calls, with timeouts,
+    # exponential backoff (full jitter, Retry-After aware) and a circuit breaker.
+    def __init__(self, api_url: str, api_key: str, connect_timeout: float = 10.0, read_timeout: float = 300.0,
+                 max_retries: int = 4, backoff_base: float = 1.0, backoff_max: float = 60.0, pool_size: int = 10,
+                 failure_threshold: int = 5, reset_timeout: float = 30.0, rate_limiter=None):
+        self.api_url = api_url
+        self._api_key = api_key
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.rate_limiter = rate_limiter
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.metrics = TransportMetrics()
+        self.pool_size = pool_size
+        self._session = None
+        self._session_lock = threading.Lock()
+
+    @property
+    def session(self):
+        # built on first use, constructing a transport stays free of network setup
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    requests = _requests()
+                    session = requests.Session()
+                    adapter = requests.adapters.HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+                    session.mount("https://", adapter)
+                    session.mount("http://", adapter)
+                    session.headers.update({"Content-Type": "application/json"})
+                    if self._api_key:
+                        # local / mock endpoints may run without a key
+                        session.headers["Authorization"] = f"Bearer {self._api_key}"
+                    self._session = session
+        return self._session
+
+    def backoff_delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        if retry_after is not None:
+            return min(retry_after, self.backoff_max)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def _post_once(self, body: str, stream: bool) -> "requests.Response":
+        if self.rate_limiter:
+            with self.rate_limiter:
+                return self.session.post(self.api_url, data=body, timeout=self.timeout, stream=stream)
+        return self.session.post(self.api_url, data=body, timeout=self.timeout, stream=stream)
+
+    def _request(self, payload: Dict, stream: bool = False) -> Tuple["requests.Response", int]:
+        # retry loop shared by plain and streamed calls, returns (response, retries)
+        requests = _requests()
+        trial = self.breaker.allow()
+        body = json.dumps(payload)
+        start = time.perf_counter()
+        retries = 0
+        while True:
+            retry_after = None
+            try:
+                response = self._post_once(body, stream)
+                if response.status_code < 400:
+                    return response, retries
+                error = TransportError(f"OpenRouter returned HTTP {response.status_code}: {response.text[:500]}", response.status_code)
+                if response.status_code not in RETRYABLE_STATUS:
+                    # the backend is up, it rejected this request
+                    self.breaker.record_success()
+                    self.metrics.record(time.perf_counter() - start, retries, False)
+                    raise error
+                retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                if response.status_code == 429 and self.rate_limiter:
+                    self.rate_limiter.block_for(self.backoff_delay(retries, retry_after))
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = TransportError(f"OpenRouter request failed: {e}")
+            if retries >= self.max_retries:
+                # one failure per call, once its retries are used up
+                self.breaker.record_failure()
+                self.metrics.record(time.perf_counter() - start, retries, False)
+                raise error
+            delay = self.backoff_delay(retries, retry_after)
+            retries += 1
+            logger.warning(f"{error} - retry {retries}/{self.max_retries} in {delay:.1f}s")
+            time.sleep(delay)
+            if not trial:
+                # stop retrying if the circuit opened meanwhile
+                trial = self.breaker.allow()
+
+    def send(self, payload: Dict) -> Tuple[Dict, Dict]:
+        # returns (response json, call stats)
+        start = time.perf_counter()
+        response, retries = self._request(payload)
+        try:
+            data = response.json()
+        except ValueError as e:
+            # e.g. an HTML error page from a proxy with status 200
+            self.breaker.record_failure()
+            self.metrics.record(time.perf_counter() - start, retries, False)
+            raise TransportError(f"OpenRouter returned a non-JSON body: {response.text[:500]}", response.status_code) from e
+        self.breaker.record_success()
+        stats = {
+            "latency": time.perf_counter() - start,
+            "retries": retries,
+            "status": response.status_code,
+            # time until the response headers of the final attempt arrived
+            "ttfb": response.elapsed.total_seconds(),
+            "usage": data.get("usage") if isinstance(data, dict) else None,
+        }
+        self.metrics.record(stats["latency"], retries, True)
+        return data, stats
+
+    def stream(self, payload: Dict, stats: Optional[Dict] = None) -> Iterator[str]:
+        # Server-sent events from a `stream: true` completion, yields content
+        # deltas as they arrive. `stats` is filled in (ttft, latency, retries).
+        stats = {} if stats is None else stats
+        start = time.perf_counter()
+        response, retries = self._request({**payload, "stream": True}, stream=True)
+        stats.update({"retries": retries, "status": response.status_code, "ttft": None})
+        ok = False
+        try:
+            for line in response.iter_lines(decode_unicode=True):
+                # blank lines separate events, ':' lines are keep-alive comments
+                if not line or line.startswith(":") or not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    break
+                try:
+                    event = json.loads(data)
+                except ValueError as e:
+                    raise TransportError(f"OpenRouter sent a malformed stream event: {data[:500]}") from e
+                if "error" in event:
+                    raise TransportError(f"OpenRouter stream error: {event['error']}")
+                if event.get("usage"):
+                    stats["usage"] = event["usage"]
+                choices = event.get("choices") or [{}]
+                delta = choices[0].get("delta", {}).get("content")
+                if delta:
+                    if stats["ttft"] is None:
+                        stats["ttft"] = time.perf_counter() - start
+                    yield delta
+            ok = True
+        except GeneratorExit:
+            # consumer stopped early (e.g. it already has what it needs)
+            ok = True
+            raise
+        except _requests().RequestException as e:
+            raise TransportError(f"OpenRouter stream interrupted: {e}")
+        finally:
+            response.close()
+            stats["latency"] = time.perf_counter() - start
+            if ok:
+                self.breaker.record_success()
+            else:
+                self.breaker.record_failure()
+            self.metrics.record(stats["latency"], retries, ok, stats["ttft"])
+
+    async def asend(self, payload: Dict) -> Tuple[Dict, Dict]:
+        # async callers share the same pooled session via a worker thread
+        import asyncio
+        return await asyncio.to_thread(self.send, payload)
+
+    async def astream(self, payload: Dict, stats: Optional[Dict] = None) -> AsyncIterator[str]:
+        async for chunk in aiter_thread(self.stream(payload, stats)):
+            yield chunk
+
+    def close(self):
+        if self._session is not None:
+            self._session.close()
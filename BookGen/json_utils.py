@@ -0,0 +1,213 @@
+import json, re
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+# =========================
+# Incremental Scanner
+# =========================
+class JSONObjectScanner:
+    # Finds balanced {...} spans in LLM output as it arrives. Braces inside
+    # JSON strings and inside <think>...</think> reasoning are ignored. Every
+    # closed span is a candidate (inner ones first), so a stray "{" in prose
+    # cannot swallow the real object.
+    def __init__(self):
+        self.text = ""
+        self._pos = 0
+        self._stack: List[int] = []
+        self._in_string = False
+        self._escaped = False
+        self._thinking = False
+
+    def feed(self, chunk: str) -> Iterator[str]:
+        self.text += chunk
+        text = self.text
+        for i in range(self._pos, len(text)):
+            char = text[i]
+            if self._thinking:
+                if char == ">" and text.endswith("</think>", 0, i + 1):
+                    self._thinking = False
+                continue
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+            if char == '"' and self._stack:
+                self._in_string = True
+            elif char == "{":
+                self._stack.append(i)
+            elif char == "}" and self._stack:
+                yield text[self._stack.pop():i + 1]
+            elif char == ">" and text.endswith("<think>", 0, i + 1):
+                self._thinking = True
+                self._stack.clear()
+        self._pos = len(text)
+
+# =========================
+# Repair
+# =========================
+_LITERALS = {"True": "true", "False": "false", "None": "null"}
+_SMART_QUOTES = "“”"
+_WORD = re.compile(r"[A-Za-z]+")
+
+def _ends_value(text: str, i: int) -> bool:
+    # a quote closes a key or value when only ':' ',' '}' ']' or the end can follow
+    j = i + 1
+    while j < len(text) and text[j].isspace():
+        j += 1
+    return j >= len(text) or text[j] in ":,}]"
+
+def repair_json(text: str) -> str:
+    # common LLM defects: trailing commas, Python literals, smart quotes
+    # around keys/values, raw newlines and tabs inside strings. Smart quotes
+    # inside a string are prose and stay as they are.
+    out = []
+    in_string = escaped = smart = False
+    i = 0
+    while i < len(text):
+        char = text[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif smart and char in _SMART_QUOTES + '"' and _ends_value(text, i):
+                # a string opened with a smart quote ends at the quote before a delimiter
+                in_string = False
+                char = '"'
+            elif char == '"':
+                if smart:
+                    char = '\\"'
+                else:
+                    in_string = False
+            elif char == "\n":
+                char = "\\n"
+            elif char == "\t":
+                char = "\\t"
+            out.append(char)
+        elif char == '"' or char in _SMART_QUOTES:
+            in_string = True
+            smart = char != '"'
+            out.append('"')
+        elif char == ",":
+            j = i + 1
+            while j < len(text) and text[j].isspace():
+                j += 1
+            if j >= len(text) or text[j] not in "}]":
+                out.append(char)
+        else:
+            word = _WORD.match(text, i) if char.isalpha() else None
+            if word:
+                out.append(_LITERALS.get(word.group(), word.group()))
+                i += len(word.group())
+                continue
+            out.append(char)
+        i += 1
+    return "".join(out)
+
+def loads_lenient(text: str):
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        return json.loads(repair_json(text))
+
+# =========================
+# Outline Schema
+# =========================
+OUTLINE_JSON_MODES = ("schema", "object", None)
+
+OUTLINE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "book_title": {"type": "string"},
+        "outline": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "chapter_number": {"type": "integer"},
+                    "chapter_title": {"type": "string"},
+                    "chapter_description": {"type": "string"},
+                    "sections": {"type": "array", "items": {"type": "string"}},
+                },
+                "required": ["chapter_number", "chapter_title", "chapter_description", "sections"],
+                "additionalProperties": False,
+            },
+        },
+    },
+    "required": ["book_title", "outline"],
+    "additionalProperties": False,
+}
+
+def validate_outline(data) -> Dict:
+    # raises ValueError naming every problem; coerces harmless variations
+    # ("3" -> 3, a single section string -> [string])
+    if not isinstance(data, dict) or not isinstance(data.get("outline"), list):
+        raise ValueError("expected an object with an 'outline' list")
+    if not data["outline"]:
+        raise ValueError("outline has no chapters")
+    problems = []
+    for index, chapter in enumerate(data["outline"], 1):
+        if not isinstance(chapter, dict):
+            problems.append(f"chapter {index} is not an object")
+            continue
+        number = chapter.get("chapter_number")
+        if isinstance(number, str) and number.strip().isdigit():
+            chapter["chapter_number"] = number = int(number)
+        if not isinstance(number, int) or isinstance(number, bool):
+            problems.append(f"chapter {index}: chapter_number must be an integer")
+        for field in ("chapter_title", "chapter_description"):
+            if not isinstance(chapter.get(field), str) or (field == "chapter_title" and not chapter[field].strip()):
+                problems.append(f"chapter {index}: {field} must be a non-empty string" if field == "chapter_title"
+                                else f"chapter {index}: {field} must be a string")
+        sections = chapter.get("sections")
+        if isinstance(sections, str):
+            chapter["sections"] = sections = [sections]
+        if not isinstance(sections, list) or not all(isinstance(s, str) for s in sections):
+            problems.append(f"chapter {index}: sections must be a list of strings")
+    if problems:
+        raise ValueError("; ".join(problems[:5]) + (f" (+{len(problems) - 5} more)" if len(problems) > 5 else ""))
+    return data
+
+# =========================
+# Extraction
+# =========================
+def _accept(candidate: str, validate: Optional[Callable]) -> Tuple[Optional[object], Optional[str]]:
+    try:
+        data = loads_lenient(candidate)
+    except json.JSONDecodeError as e:
+        return None, f"invalid JSON: {e}"
+    try:
+        return (validate(data) if validate else data), None
+    except ValueError as e:
+        return None, str(e)
+
+def extract_json_stream(chunks: Iterable[str], validate: Optional[Callable] = None) -> Tuple[object, str]:
+    # First candidate that parses (after repair) and validates, returned with
+    # the text read so far as soon as it closes: the caller can stop the
+    # stream there. Raises ValueError with the last problem seen.
+    scanner = JSONObjectScanner()
+    error = "No JSON found in response"
+    for chunk in chunks:
+        for candidate in scanner.feed(chunk):
+            data, problem = _accept(candidate, validate)
+            if problem is None:
+                return data, scanner.text
+            error = problem
+    raise ValueError(error)
+
+def extract_json(text: str, validate: Optional[Callable] = None):
+    # with the whole response at hand take the last valid candidate: models
+    # that draft before answering put the final answer last
+    result, error = None, "No JSON found in response"
+    for candidate in JSONObjectScanner().feed(text):
+        data, problem = _accept(candidate, validate)
+        if problem is None:
+            result = data
+        else:
+            error = problem
+    if result is None:
+        raise ValueError(error)
+    return result
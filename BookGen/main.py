@@ -1,150 +1,360 @@
-import os, requests, json, re, logging
-from dotenv import load_dotenv
+import os, json, re, logging, difflib
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 from .utils import *
 from .db_utils import *
-from logging.handlers import RotatingFileHandler
-from docx import Document
-from docx.shared import Pt
+from .prompt_utils import *
+from .exec_utils import *
+from .http_utils import *
+from .cache_utils import *
+from .export_utils import *
+from .telemetry_utils import *
+from .routing_utils import *
+from .json_utils import *
+from .config_utils import *
+from .dedup_utils import *
+from .notify_utils import *
+from .speculate_utils import *
+from contextlib import closing
 
 # ------------------------------------------------------------------
-# Environment
+# Logging
 # ------------------------------------------------------------------
-load_dotenv()
-OPENROUTER_API_KEY = os.environ["OPENROUTER_API_KEY"]
-
-# ------------------------------------------------------------------
-# Logging Configuration
-# ------------------------------------------------------------------
-LOG_LEVEL = os.getenv("BOOKGEN_LOG_LEVEL", "INFO").upper()
-LOG_DIR = os.getenv("BOOKGEN_LOG_DIR", "logs")
-LOG_FILE = os.path.join(LOG_DIR, "bookgen.log")
-
-os.makedirs(LOG_DIR, exist_ok=True)
-
+# handlers are attached by configure_logging() when the first BookGen is
+# created, importing the package has no side effects
 logger = logging.getLogger("BookGen")
-logger.setLevel(LOG_LEVEL)
-
-formatter = logging.Formatter(
-    "%(asctime)s | %(levelname)s | %(name)s | %(message)s",
-    datefmt="%Y-%m-%d %H:%M:%S"
-)
-
-# ---------------- Console Handler ----------------
-console_handler = logging.StreamHandler()
-console_handler.setLevel(LOG_LEVEL)
-console_handler.setFormatter(formatter)
-
-# ---------------- File Handler ----------------
-file_handler = RotatingFileHandler(
-    LOG_FILE,
-    maxBytes=10 * 1024 * 1024,  # 10 MB
-    backupCount=5,
-    encoding="utf-8"
-)
-file_handler.setLevel(logging.DEBUG)  # capture everything in file
-file_handler.setFormatter(formatter)
-
-# ---------------- Attach Handlers ----------------
-logger.handlers.clear()      # avoid duplicate logs
-logger.addHandler(console_handler)
-logger.addHandler(file_handler)
-logger.propagate = False
 
 # ------------------------------------------------------------------
 # BookGen Class
 # ------------------------------------------------------------------
 class BookGen:
-    def __init__(self, OPENROUTER_API_KEY=OPENROUTER_API_KEY, model="deepseek/deepseek-r1-0528:free"):
+    def __init__(self, OPENROUTER_API_KEY=None, model="deepseek/deepseek-r1-0528:free", max_prompt_tokens=32000,
+                 generation_mode="sequential", max_workers=4, requests_per_minute=None, api_url=None,
+                 connect_timeout=10.0, read_timeout=300.0, max_retries=4, sampling_params=None,
+                 cache_path=None, cache_ttl=None, cache_max_entries=10000, cache_max_bytes=None, stream=False,
+                 db_path="bookgen.db", db_wal=True, db_synchronous="NORMAL", db_busy_timeout=30.0,
+                 context_token_budget=4000, context_recent_chapters=3, telemetry="db", routes=None,
+                 outline_json_mode="object", config=None, db_read_only=False, dedup_threshold=None, dedup_action="flag",
+                 notify=None, notify_batch_window=5.0, granularity="chapter", speculate=False,
+                 speculation_token_budget=None, speculation_workers=2):
+        if generation_mode not in GENERATION_MODES:
+            raise ValueError(f"Unknown generation mode {generation_mode!r}, expected one of {GENERATION_MODES}")
+        if granularity not in GRANULARITIES:
+            raise ValueError(f"Unknown granularity {granularity!r}, expected one of {GRANULARITIES}")
+        if outline_json_mode not in OUTLINE_JSON_MODES:
+            raise ValueError(f"Unknown outline JSON mode {outline_json_mode!r}, expected one of {OUTLINE_JSON_MODES}")
+        if dedup_action not in DEDUP_ACTIONS:
+            raise ValueError(f"Unknown dedup action {dedup_action!r}, expected one of {DEDUP_ACTIONS}")
+        # explicit arguments win over the config, which defaults to .env / the environment
+        self.config = config or get_config()
+        configure_logging(self.config)
+        OPENROUTER_API_KEY = OPENROUTER_API_KEY or self.config.api_key
+        api_url = api_url or self.config.api_url
+        if not OPENROUTER_API_KEY and api_url == OPENROUTER_DEFAULT_URL:
+            # DB and export work offline; LLM calls will get HTTP 401 from OpenRouter
+            logger.warning("OPENROUTER_API_KEY is not set, OpenRouter calls will be rejected")
         self.model = model
         self._api_key = OPENROUTER_API_KEY
-        self.outline_template = None
-        self.content_template = None
-        self.summarize_template = None
-        self.conn = get_db_connection()
+        self.api_url = api_url
+        self.max_prompt_tokens = max_prompt_tokens
+        self.last_prompt_tokens = 0
+        self.context_token_budget = context_token_budget
+        self.context_recent_chapters = context_recent_chapters
+        # compressed previous-chapter context, extended summary by summary across prompts
+        self.summary_context = RollingSummaryContext()
+        self.prompt_token_usage = {}
+        self.generation_mode = generation_mode
+        # "section": chapters with outline sections are written one section per
+        # call, in parallel, and single sections can be rewritten later
+        self.granularity = granularity
+        self.sampling_params = sampling_params or {}
+        self.stream = stream
+        # "schema": structured output against OUTLINE_SCHEMA, "object": JSON mode,
+        # None: prompt only. Providers without support ignore the parameter.
+        self.outline_json_mode = outline_json_mode
+        self.last_stream_stats = None
+        self.max_workers = max_workers
+        # the provider's request rate is shared process-wide, calls in flight are capped per instance
+        self.rate_limiter = InstanceLimiter(get_rate_limiter(api_url, requests_per_minute), max_workers)
+        self.transport = LLMTransport(
+            api_url,
+            OPENROUTER_API_KEY,
+            connect_timeout=connect_timeout,
+            read_timeout=read_timeout,
+            max_retries=max_retries,
+            pool_size=max(max_workers, 2),
+            rate_limiter=self.rate_limiter
+        )
+        # per-stage model pools with failover; stages without a route use `model`
+        self.routes = routes
+        self.router = build_router(
+            Backend(model, self.transport), routes, api_url, OPENROUTER_API_KEY,
+            transport_options={"connect_timeout": connect_timeout, "read_timeout": read_timeout,
+                               "max_retries": max_retries, "pool_size": max(max_workers, 2)},
+            max_concurrent=max_workers
+        )
+        # opt-in: completions are nondeterministic, so caching must be asked for
+        self.cache = ResponseCache(cache_path, cache_max_entries, cache_max_bytes, cache_ttl) if cache_path else None
+        self.bypass_cache = False
+        # connections open on first use; read-only never writes or migrates the file
+        self.db = ConnectionManager(db_path, wal=db_wal, synchronous=db_synchronous, busy_timeout=db_busy_timeout,
+                                    read_only=db_read_only)
+        # per-call telemetry: "db" (llm_calls table), a .jsonl path, or None
+        if telemetry == "db" and db_read_only:
+            self.telemetry = None
+        elif telemetry:
+            self.telemetry = get_telemetry_recorder(telemetry, self.db)
+        else:
+            self.telemetry = None
+        # near-duplicate chapters (MinHash, needs NumPy): None is off, "flag"
+        # records them in duplicate_findings, "regenerate" also rewrites the
+        # offending heading once with the overlap spelled out in its notes
+        self.dedup_threshold = dedup_threshold
+        self.dedup_action = dedup_action
+        self.duplicate_findings = []
+        # stage events go to the notifications table, a background dispatcher
+        # mails them out in digests; None: on when SMTP is configured
+        if notify and not self.config.notifications_enabled:
+            raise ValueError("Notifications need an SMTP host and at least one recipient in the config")
+        if notify is None:
+            notify = self.config.notifications_enabled and not db_read_only
+        self.notifier = NotificationDispatcher(
+            self.db, SMTPTransport.from_config(self.config), self.config.notify_from, self.config.notify_to,
+            batch_window=notify_batch_window
+        ) if notify else None
+        # opt-in: draft chapters in the background while a saved outline is
+        # under review, see speculate_utils.Speculator
+        if speculate and (db_read_only or db_path == ":memory:"):
+            raise ValueError("Speculative drafting needs a writable database file shared by its threads")
+        self.speculator = Speculator(self, speculation_token_budget, speculation_workers) if speculate else None
         logger.info("BookGen initialized")
         logger.info(f"Using model: {self.model}")
+        if routes:
+            logger.info(f"Model routes: {self.router.describe()}")
+        logger.info(f"Generation mode: {self.generation_mode} (max_workers={self.max_workers}, granularity={self.granularity})")
+
+    @property
+    def conn(self):
+        # each thread (worker, UI callback) gets its own connection to the store
+        return self.db.connection()
 
     # ------------------------------------------------------------------
     # Prompt Templates
     # ------------------------------------------------------------------
-    def get_outline_template(self):
+    # Each call builds a fresh [system, user] message list, nothing is carried
+    # over between chapters, retries or books.
+    def get_outline_template(self, prompt):
         logger.debug("Loading OUTLINE system prompt")
-        return [{"role": "system", "content": OUTLINE_SYS_PROMPT}]
+        return build_messages(OUTLINE_SYS_PROMPT, prompt, self.max_prompt_tokens)
 
-    def get_content_template(self):
+    def get_content_template(self, prompt):
         logger.debug("Loading CONTENT system prompt")
-        return [{"role": "system", "content": CONTENT_SYS_PROMPT}]
+        return build_messages(CONTENT_SYS_PROMPT, prompt, self.max_prompt_tokens)
     
-    def get_summarize_template(self):
+    def get_summarize_template(self, prompt):
         logger.debug("Loading SUMMARIZE system prompt")
-        return [{"role": "system", "content": SUMMARIZE_SYS_PROMPT}]
+        return build_messages(SUMMARIZE_SYS_PROMPT, prompt, self.max_prompt_tokens)
 
     # ------------------------------------------------------------------
     # LLM JSON Parsing
     # ------------------------------------------------------------------
-    def parse_llm_json(self, response_text: str) -> dict:
+    def parse_llm_json(self, response_text: str, validate=None) -> dict:
+        # balanced-brace scan with repair, see json_utils; `validate` rejects
+        # well-formed JSON of the wrong shape so the next candidate is tried
         logger.debug("Parsing JSON from LLM response")
-        match = re.search(r'\{.*\}', response_text, re.DOTALL)
-        if not match:
-            logger.error("No JSON detected in LLM response")
-            logger.debug(f"RAW RESPONSE:\n{response_text}")
-            raise ValueError("No JSON found in response")
         try:
-            parsed = json.loads(match.group())
-            logger.debug("JSON parsed successfully")
-            return parsed
-        except json.JSONDecodeError as e:
+            parsed = extract_json(response_text, validate)
+        except ValueError as e:
             logger.error(f"JSON parsing error: {e}")
-            logger.debug(f"RAW RESPONSE:\n{response_text}")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("RAW RESPONSE:\n%s", response_text)
             raise ValueError(f"Invalid JSON format: {e}")
+        logger.debug("JSON parsed successfully")
+        return parsed
+
+    def outline_params(self):
+        if self.outline_json_mode == "schema":
+            return {"response_format": {"type": "json_schema", "json_schema": {"name": "book_outline", "strict": True, "schema": OUTLINE_SCHEMA}}}
+        if self.outline_json_mode == "object":
+            return {"response_format": {"type": "json_object"}}
+        return None
 
     # ------------------------------------------------------------------
     # LLM Call
     # ------------------------------------------------------------------
-    def call_model(self, message):
-        logger.debug(
-            "Users Prompt:\n%s",
-            message[-1]["content"] if len(message[-1]["content"]) < 8000 else message[-1]["content"][:8000] + "\n--- TRUNCATED ---"
-        )
-        logger.info("Calling OpenRouter LLM API")
-        response = requests.post(
-            url="https://openrouter.ai/api/v1/chat/completions",
-            headers={
-                "Authorization": f"Bearer {self._api_key}",
-                "Content-Type": "application/json",
-            },
-            data=json.dumps({
-                "model": self.model,
-                "messages": message,
-            })
+    def _lookup_cache(self, message, use_cache, params=None):
+        # a bypassed lookup still refreshes the cache with the new completion
+        # keyed on the stage's whole model pool, any of its backends may have answered
+        cache_key = make_cache_key(
+            self.router.route_key(current_context().get("stage")), message, {**self.sampling_params, **(params or {})}
+        ) if self.cache else None
+        if cache_key and use_cache and not self.bypass_cache:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                logger.info("LLM response served from cache")
+                return cache_key, cached
+        return cache_key, None
+
+    def _log_request(self, message):
+        # prompt dumps are only built when DEBUG is actually enabled
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                "Users Prompt:\n%s",
+                message[-1]["content"] if len(message[-1]["content"]) < 8000 else message[-1]["content"][:8000] + "\n--- TRUNCATED ---"
+            )
+        self.last_prompt_tokens = prompt_tokens = count_message_tokens(message)
+        logger.info(f"Calling OpenRouter LLM API (~{prompt_tokens} prompt tokens)")
+        return prompt_tokens
+
+    def _log_response(self, llm_output):
+        # Log full LLM response (truncate only if extremely large)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                "LLM RESPONSE:\n%s",
+                llm_output if len(llm_output) < 8000 else llm_output[:8000] + "\n--- TRUNCATED ---"
+            )
+
+    def _payload(self, message, model, params=None):
+        payload = {**self.sampling_params, **(params or {}), "model": model, "messages": message}
+        if self.telemetry:
+            # ask OpenRouter for token counts and cost in `usage`
+            payload["usage"] = {"include": True}
+        return payload
+
+    def _record_call(self, stats=None, cached=False, streamed=False, error=None, call_context=None, prompt_tokens=None, model=None):
+        if not self.telemetry:
+            return
+        stats = stats or {}
+        usage = stats.get("usage") or {}
+        self.telemetry.record(
+            **(call_context or {}),
+            model=model or self.model,
+            ok=error is None,
+            cached=cached,
+            streamed=streamed,
+            latency=stats.get("latency", 0.0 if cached else None),
+            ttfb=stats.get("ttfb", stats.get("ttft")),
+            retries=stats.get("retries", 0),
+            prompt_tokens=usage.get("prompt_tokens"),
+            completion_tokens=usage.get("completion_tokens"),
+            estimated_prompt_tokens=prompt_tokens,
+            cost=usage.get("cost"),
+            error=None if error is None else f"{type(error).__name__}: {error}"[:500],
         )
-        response_data = response.json()
+
+    def call_model(self, message, use_cache=True, on_chunk=None, params=None):
+        # params: extra request fields for this call (e.g. response_format)
+        if on_chunk is not None or self.stream:
+            chunks = []
+            for chunk in self.stream_model(message, use_cache, params=params):
+                chunks.append(chunk)
+                if on_chunk:
+                    on_chunk(chunk)
+            return "".join(chunks)
+        cache_key, cached = self._lookup_cache(message, use_cache, params)
+        if cached is not None:
+            self._record_call(cached=True, call_context=current_context())
+            return cached
+        call_context = current_context()
+        prompt_tokens = self._log_request(message)
+        error = None
+        # next backend of the stage's pool on failure, the last error if all fail
+        for backend in self.router.candidates(call_context.get("stage")):
+            try:
+                response_data, stats = backend.transport.send(self._payload(message, backend.model, params))
+            except TransportError as e:
+                backend.record_failure(e)
+                self._record_call(error=e, call_context=call_context, prompt_tokens=prompt_tokens, model=backend.model)
+                error = e
+                continue
+            backend.record_success(stats["latency"])
+            break
+        else:
+            raise error
+        logger.debug("LLM call took %.2fs with %d retries", stats["latency"], stats["retries"])
         if "choices" not in response_data:
             logger.error("Invalid OpenRouter response structure")
             logger.error(response_data)
-            raise RuntimeError("Invalid response from OpenRouter")
+            error = RuntimeError("Invalid response from OpenRouter")
+            self._record_call(stats, error=error, call_context=call_context, prompt_tokens=prompt_tokens, model=backend.model)
+            raise error
+        self._record_call(stats, call_context=call_context, prompt_tokens=prompt_tokens, model=backend.model)
         llm_output = response_data["choices"][0]["message"]["content"]
-        # Log full LLM response (truncate only if extremely large)
-        logger.debug(
-            "LLM RESPONSE:\n%s",
-            llm_output if len(llm_output) < 8000 else llm_output[:8000] + "\n--- TRUNCATED ---"
-        )
+        self._log_response(llm_output)
+        if cache_key:
+            self.cache.put(cache_key, backend.model, llm_output)
         return llm_output
 
+    # ------------------------------------------------------------------
+    # Streaming LLM Call
+    # ------------------------------------------------------------------
+    def stream_model(self, message, use_cache=True, call_context=None, params=None):
+        # yields content chunks as OpenRouter produces them (SSE `stream: true`)
+        call_context = {**current_context(), **(call_context or {})}
+        cache_key, cached = self._lookup_cache(message, use_cache, params)
+        if cached is not None:
+            self._record_call(cached=True, streamed=True, call_context=call_context)
+            yield cached
+            return
+        prompt_tokens = self._log_request(message)
+        chunks = []
+        candidates = self.router.candidates(call_context.get("stage"))
+        for i, backend in enumerate(candidates):
+            stats = {}
+            stream = backend.transport.stream(self._payload(message, backend.model, params), stats)
+            try:
+                for chunk in stream:
+                    chunks.append(chunk)
+                    yield chunk
+            except GeneratorExit:
+                # the consumer stopped early (e.g. it already has a complete outline)
+                stream.close()
+                backend.record_success(stats["latency"])
+                self._record_call(stats, streamed=True, call_context=call_context, prompt_tokens=prompt_tokens, model=backend.model)
+                raise
+            except TransportError as e:
+                backend.record_failure(e)
+                self._record_call(stats, streamed=True, error=e, call_context=call_context, prompt_tokens=prompt_tokens, model=backend.model)
+                # once text has reached the caller the stream cannot switch backends
+                if chunks or i + 1 == len(candidates):
+                    raise
+                continue
+            backend.record_success(stats["latency"])
+            break
+        self._record_call(stats, streamed=True, call_context=call_context, prompt_tokens=prompt_tokens, model=backend.model)
+        ttft = f"{stats['ttft']:.2f}s" if stats.get("ttft") is not None else "n/a"
+        logger.info(f"LLM stream finished in {stats['latency']:.2f}s (time to first token {ttft}, {stats['retries']} retries)")
+        self.last_stream_stats = stats
+        llm_output = "".join(chunks)
+        self._log_response(llm_output)
+        if cache_key:
+            self.cache.put(cache_key, backend.model, llm_output)
+
+    async def astream_model(self, message, use_cache=True):
+        async for chunk in aiter_thread(self.stream_model(message, use_cache)):
+            yield chunk
+
+
     # ------------------------------------------------------------------
     # Outline Generation
     # ------------------------------------------------------------------
-    def generate_outline(self, title, notes):
+    def generate_outline(self, title, notes, force_regenerate=False):
         logger.info(f"Generating outline for book: {title}")
         prompt = OUTLINE_PROMPT.replace("__BOOK_TITLE__", title)\
                                .replace("__EDITORIAL_NOTES__", notes)
-        self.outline_template = self.get_outline_template() if not self.outline_template else self.outline_template
+        messages = self.get_outline_template(prompt)
+        params = self.outline_params()
         for attempt in range(1, 4):
             try:
                 logger.info(f"Outline attempt {attempt}")
-                self.outline_template.append({"role": "user", "content": prompt})
-                outline = self.call_model(self.outline_template)
-                parsed_outline = self.parse_llm_json(outline)
+                # a cached reply that failed to parse must not be served again
+                use_cache = attempt == 1 and not force_regenerate
+                with telemetry_context(stage="outline", book_title=title):
+                    if self.stream:
+                        parsed_outline = self.stream_outline(messages, use_cache, params)
+                    else:
+                        outline = self.call_model(messages, use_cache=use_cache, params=params)
+                        parsed_outline = self.parse_llm_json(outline, validate_outline)
                 logger.info("Outline generated successfully")
                 return json.dumps(parsed_outline, indent=2)
             except ValueError as e:
@@ -152,141 +362,698 @@ class BookGen:
         logger.critical("Outline generation failed after retries")
         raise RuntimeError("Failed to generate a valid outline")
 
+    def stream_outline(self, messages, use_cache=True, params=None):
+        # stops reading the stream as soon as a valid outline object closes;
+        # unlike parse_llm_json this takes the first valid outline, not the last
+        with closing(self.stream_model(messages, use_cache, params=params)) as chunks:
+            parsed, text = extract_json_stream(chunks, validate_outline)
+        if self.cache:
+            # an early stop skips stream_model's own cache write, keep what was read
+            cache_key, _ = self._lookup_cache(messages, False, params)
+            self.cache.put(cache_key, self.model, text)
+        return parsed
+
     # ------------------------------------------------------------------
     # Save Book & Outline
     # ------------------------------------------------------------------
     def save_book_and_outline(self, title, notes, outline_json):
         logger.info(f"Saving book: {title}")
-        if get_book(self.conn, title):
-            logger.warning(f"Book '{title}' exists. Overwriting.")
-            delete_book(self.conn, title)
-        book_id = add_book(self.conn, title, notes)
-        logger.info(f"Book saved with ID: {book_id}")
         outline_data = json.loads(outline_json)
-        for chapter in outline_data.get("outline", []):
-            add_heading(
-                self.conn,
-                book_id=book_id,
-                heading_title=chapter["chapter_title"],
-                heading_number=chapter["chapter_number"],
-                sub_heading="\n".join(chapter["sections"]),
-                description=chapter["chapter_description"]
-            )
-            logger.debug(f"Chapter saved: {chapter['chapter_title']}")
+        if self.speculator:
+            self.speculator.cancel(title)
+        # all or nothing: a failure part way leaves the previous book untouched
+        with transaction(self.conn):
+            if get_book(self.conn, title):
+                logger.warning(f"Book '{title}' exists. Overwriting.")
+                delete_book(self.conn, title)
+            book_id = add_book(self.conn, title, notes)
+            chapters = add_headings_bulk(self.conn, book_id, [{
+                "heading_number": chapter["chapter_number"],
+                "heading_title": chapter["chapter_title"],
+                "sub_heading": "\n".join(chapter["sections"]),
+                "description": chapter["chapter_description"]
+            } for chapter in outline_data.get("outline", [])])
+            self.notify("outline_ready", title, chapters=chapters)
+        logger.info(f"Book saved with ID: {book_id}")
         logger.info("All chapters saved successfully")
+        if self.speculator:
+            self.speculator.schedule(title)
         return book_id
 
     # ------------------------------------------------------------------
     # Content & Summary Generation
     # ------------------------------------------------------------------
-    def generate_heading_content(self, book_title, heading_notes=None, starting_heading_number=1):
-        logger.info(f"Generating content for book: {book_title}")
+    def heading_notes_for(self, heading, heading_notes=None):
+        # notes passed in for this run win over the stored regeneration notes
+        notes = (heading_notes or {}).get(heading["heading_title"])
+        return notes or heading.get("after_notes") or heading.get("before_notes") or ""
+
+    def heading_fingerprint(self, book, heading, context, heading_notes=None):
+        # everything that shapes this heading's prompts, including upstream summaries
+        return fingerprint({
+            "model": self.model,
+            **({"routes": self.router.describe()} if self.routes else {}),
+            "params": self.sampling_params,
+            "prompts": [CONTENT_SYS_PROMPT, CONTENT_PROMPT, SUMMARIZE_SYS_PROMPT, SUMMARIZE_PROMPT]
+                       + ([SECTION_PROMPT] if self.granularity == "section" else []),
+            "book": book["title"],
+            "heading": [heading["heading_title"], heading["sub_heading"], heading["description"]],
+            "notes": self.heading_notes_for(heading, heading_notes),
+            "context": context,
+        })
+
+    def build_content_prompt(self, book, heading, context, heading_notes=None):
+        notes = self.heading_notes_for(heading, heading_notes)
+        return CONTENT_PROMPT.replace(
+            "__BOOK_TITLE__", book["title"]
+        ).replace(
+            "__HEADING_TITLE__", heading["heading_title"]
+        ).replace(
+            "__SUB_HEADINGS__", heading["sub_heading"] or ""
+        ).replace(
+            "__PREVIOUS_HEADINGS_SUMMARY_DICT__", json.dumps(
+                self.summary_context.render(context, self.context_token_budget, self.context_recent_chapters)
+            )
+        ).replace(
+            "__HEADING_NOTES__", notes
+        )
+
+    def build_section_prompt(self, book, heading, titles, index, context, heading_notes=None, section_notes=None):
+        notes = "\n".join(filter(None, [self.heading_notes_for(heading, heading_notes), section_notes]))
+        return SECTION_PROMPT.replace(
+            "__BOOK_TITLE__", book["title"]
+        ).replace(
+            "__HEADING_TITLE__", heading["heading_title"]
+        ).replace(
+            "__SECTION_TITLE__", titles[index]
+        ).replace(
+            "__OTHER_SECTIONS__", "\n".join(title for i, title in enumerate(titles) if i != index)
+        ).replace(
+            "__PREVIOUS_HEADINGS_SUMMARY_DICT__", json.dumps(
+                self.summary_context.render(context, self.context_token_budget, self.context_recent_chapters)
+            )
+        ).replace(
+            "__HEADING_NOTES__", notes
+        )
+
+    def build_summary_prompt(self, book, heading, content, heading_notes=None):
+        notes = self.heading_notes_for(heading, heading_notes)
+        return SUMMARIZE_PROMPT.replace(
+            "__BOOK_TITLE__", book["title"]
+        ).replace(
+            "__HEADING_TITLE__", heading["heading_title"]
+        ).replace(
+            "__EDITORIAL_NOTES__", notes
+        ).replace(
+            "__INPUT_TEXT__", content
+        )
+
+    def _stage_context(self, stage, book, heading):
+        return {"stage": stage, "book_title": book["title"], "book_id": book["id"], "heading": heading["heading_title"]}
+
+    def generate_content(self, book, heading, context, heading_notes=None, on_chunk=None):
+        # on_chunk(heading_title, chunk) receives the draft as it streams in
+        draft = self.speculator.take(book, heading, heading_notes) if self.speculator else None
+        if draft is not None:
+            if on_chunk:
+                on_chunk(heading["heading_title"], draft)
+            return draft
+        return self._generate_content(book, heading, context, heading_notes, on_chunk)
+
+    def _generate_content(self, book, heading, context, heading_notes=None, on_chunk=None):
+        if self.granularity == "section" and section_titles(heading["sub_heading"]):
+            return self.generate_sections(book, heading, context, heading_notes, on_chunk)
+        messages = self.get_content_template(self.build_content_prompt(book, heading, context, heading_notes))
+        prompt_tokens = count_message_tokens(messages)
+        self.prompt_token_usage[heading["heading_title"]] = prompt_tokens
+        logger.info(f"Content prompt for '{heading['heading_title']}': ~{prompt_tokens} tokens")
+        for attempt in range(1, 4):
+            try:
+                logger.debug("Content generation attempt %d", attempt)
+                with telemetry_context(**self._stage_context("content", book, heading)):
+                    return self.call_model(
+                        messages,
+                        use_cache=attempt == 1,
+                        on_chunk=(lambda chunk: on_chunk(heading["heading_title"], chunk)) if on_chunk else None
+                    )
+            except TransportError:
+                raise
+            except Exception as e:
+                logger.warning(f"Content generation failed (attempt {attempt}): {e}")
+        raise RuntimeError(f"Failed to generate content for heading {heading['heading_title']}")
+
+    def generate_summary(self, book, heading, content, heading_notes=None):
+        summary = self.speculator.take_summary(book, heading, content) if self.speculator else None
+        return summary or self._generate_summary(book, heading, content, heading_notes)
+
+    def _generate_summary(self, book, heading, content, heading_notes=None):
+        summary_prompt = self.build_summary_prompt(book, heading, content, heading_notes)
+        for attempt in range(1, 4):
+            try:
+                logger.debug("Summary generation attempt %d", attempt)
+                with telemetry_context(**self._stage_context("summary", book, heading)):
+                    return self.call_model(self.get_summarize_template(summary_prompt), use_cache=attempt == 1)
+            except TransportError:
+                raise
+            except Exception as e:
+                logger.warning(f"Summary generation failed (attempt {attempt}): {e}")
+        raise RuntimeError(f"Failed to generate summary for heading {heading['heading_title']}")
+
+    def save_heading_content(self, book, heading, content, summary, input_fingerprint=None):
+        if self.speculator:
+            # a promoted draft was written from outline descriptions, not from the
+            # summaries in input_fingerprint: keep its own so the chapter is re-checked
+            input_fingerprint = self.speculator.promoted_fingerprint(book, heading, content) or input_fingerprint
+        with transaction(self.conn):
+            update_heading(
+                self.conn,
+                book_id=book["id"],
+                heading_title=heading["heading_title"],
+                summary=summary,
+                content=content,
+                input_fingerprint=input_fingerprint
+            )
+            # section texts are kept only while they still add up to the chapter
+            sections = getattr(content, "sections", None)
+            if sections is not None or content != heading.get("content"):
+                save_sections(self.conn, heading["id"], sections)
+        logger.info(f"Completed heading: {heading['heading_title']}")
+
+    def generate_heading_content(self, book_title, heading_notes=None, starting_heading_number=1, mode=None, force_regenerate=False,
+                                 on_chunk=None):
+        mode = mode or self.generation_mode
+        if mode not in GENERATION_MODES:
+            raise ValueError(f"Unknown generation mode {mode!r}, expected one of {GENERATION_MODES}")
+        logger.info(f"Generating content for book: {book_title} ({mode})")
         book = get_book(self.conn, book_title)
         if not book:
             logger.error(f"Book not found: {book_title}")
             raise ValueError(f"No book found with title {book_title}")
         headings = get_headings_by_book(self.conn, book["id"])
         previous_summary = {}
-        self.content_template = self.get_content_template() if not self.content_template else self.content_template
-        self.summarize_template = self.get_summarize_template() if not self.summarize_template else self.summarize_template
         for i in range(starting_heading_number - 1):
             previous_summary[headings[i]["heading_title"]] = headings[i]["summary"]
-        for i in range(starting_heading_number - 1, len(headings)):
-            heading = headings[i]
+        pending = headings[starting_heading_number - 1:]
+        dedup = self.duplicate_tracker(headings[:starting_heading_number - 1])
+        self.duplicate_findings = []
+        bypass_cache, self.bypass_cache = self.bypass_cache, self.bypass_cache or force_regenerate
+        try:
+            if mode == "sequential":
+                self._generate_sequential(book, pending, previous_summary, heading_notes, on_chunk, dedup)
+            elif mode == "pipelined":
+                self._generate_pipelined(book, pending, previous_summary, heading_notes, on_chunk, dedup)
+            else:
+                self._generate_parallel(book, pending, previous_summary, heading_notes, on_chunk, dedup)
+        except Exception as e:
+            self.notify("error", book_title, stage="content", error=str(e)[:500])
+            raise
+        finally:
+            self.bypass_cache = bypass_cache
+        self.notify("content_completed", book_title, chapters=len(pending),
+                    **({"duplicates_flagged": len(self.duplicate_findings)} if dedup else {}))
+
+    # Content N needs the summaries of 1..N-1, summary N needs content N.
+    # All DB writes stay on the calling thread, workers only talk to the LLM.
+    # Every mode fingerprints a heading from the upstream summaries as saved,
+    # so regenerate_changed sees the same inputs whichever mode wrote the book.
+    def _generate_sequential(self, book, headings, previous_summary, heading_notes, on_chunk=None, dedup=None):
+        for heading in headings:
             logger.info(f"Processing heading: {heading['heading_title']}")
-            content_prompt = CONTENT_PROMPT.replace(
-                "__BOOK_TITLE__", book["title"]
-            ).replace(
-                "__HEADING_TITLE__", heading["heading_title"]
-            ).replace(
-                "__SUB_HEADINGS__", heading["sub_heading"]
-            ).replace(
-                "__PREVIOUS_HEADINGS_SUMMARY_DICT__", json.dumps(previous_summary)
-            )
-            if heading_notes and heading["heading_title"] in heading_notes:
-                content_prompt = content_prompt.replace(
-                    "__EDITORIAL_NOTES__", heading_notes[heading["heading_title"]]
-                )
-            # Generate content
-            for attempt in range(1, 4):
-                try:
-                    logger.debug(f"Content generation attempt {attempt}")
-                    self.content_template.append({"role": "user", "content": content_prompt})
-                    content = self.call_model(self.content_template)
-                    break
-                except Exception as e:
-                    logger.warning(f"Content generation failed (attempt {attempt}): {e}")
-            # Generate summary
-            summary_prompt = SUMMARIZE_PROMPT.replace(
-                "__BOOK_TITLE__", book["title"]
-            ).replace(
-                "__HEADING_TITLE__", heading["heading_title"]
-            ).replace(
-                "__INPUT_TEXT__", content
-            )
-            if heading_notes and heading["heading_title"] in heading_notes:
-                summary_prompt = summary_prompt.replace(
-                    "__EDITORIAL_NOTES__", heading_notes[heading["heading_title"]]
-                )
-            for attempt in range(1, 4):
-                try:
-                    logger.debug(f"Summary generation attempt {attempt}")
-                    self.summarize_template.append({"role": "user", "content": summary_prompt})
-                    summary = self.call_model(self.summarize_template)
-                    break
-                except Exception as e:
-                    logger.warning(f"Summary generation failed (attempt {attempt}): {e}")
-            update_heading(
-                self.conn,
-                book_id=book["id"],
-                heading_title=heading["heading_title"],
-                summary=summary,
-                content=content
-            )
+            input_fingerprint = self.heading_fingerprint(book, heading, previous_summary, heading_notes)
+            content = self.generate_content(book, heading, previous_summary, heading_notes, on_chunk)
+            summary = self.generate_summary(book, heading, content, heading_notes)
+            content, summary = self.check_duplicates(dedup, book, heading, content, summary, previous_summary, heading_notes)
+            self.save_heading_content(book, heading, content, summary, input_fingerprint)
             previous_summary[heading["heading_title"]] = summary
-            logger.info(f"Completed heading: {heading['heading_title']}")
+
+    def _generate_pipelined(self, book, headings, previous_summary, heading_notes, on_chunk=None, dedup=None):
+        # summary N runs alongside content N+1; content N+1 sees the outline
+        # description of chapter N instead of its (not yet written) summary
+        if not headings:
+            return
+        with ThreadPoolExecutor(max_workers=max(2, self.max_workers)) as pool:
+            context = dict(previous_summary)
+            content_future = pool.submit(self.generate_content, book, headings[0], context, heading_notes, on_chunk)
+            for i, heading in enumerate(headings):
+                logger.info(f"Processing heading: {heading['heading_title']}")
+                input_fingerprint = self.heading_fingerprint(book, heading, previous_summary, heading_notes)
+                content = content_future.result()
+                summary_future = pool.submit(self.generate_summary, book, heading, content, heading_notes)
+                if i + 1 < len(headings):
+                    context = dict(previous_summary)
+                    context[heading["heading_title"]] = heading["description"]
+                    content_future = pool.submit(self.generate_content, book, headings[i + 1], context, heading_notes, on_chunk)
+                summary = summary_future.result()
+                content, summary = self.check_duplicates(dedup, book, heading, content, summary, previous_summary, heading_notes)
+                self.save_heading_content(book, heading, content, summary, input_fingerprint)
+                previous_summary[heading["heading_title"]] = summary
+
+    def _generate_parallel(self, book, headings, previous_summary, heading_notes, on_chunk=None, dedup=None):
+        # every draft is written from the outline descriptions of the chapters
+        # before it, then all summaries run at once
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            context = dict(previous_summary)
+            content_futures = []
+            contexts = []
+            for heading in headings:
+                contexts.append(dict(context))
+                content_futures.append(pool.submit(self.generate_content, book, heading, contexts[-1], heading_notes, on_chunk))
+                context[heading["heading_title"]] = heading["description"]
+            summary_futures = [
+                pool.submit(self.generate_summary, book, heading, future.result(), heading_notes)
+                for heading, future in zip(headings, content_futures)
+            ]
+            for heading, content_future, summary_future, heading_context in zip(
+                    headings, content_futures, summary_futures, contexts):
+                logger.info(f"Processing heading: {heading['heading_title']}")
+                input_fingerprint = self.heading_fingerprint(book, heading, previous_summary, heading_notes)
+                content, summary = self.check_duplicates(dedup, book, heading, content_future.result(), summary_future.result(),
+                                                         heading_context, heading_notes)
+                self.save_heading_content(book, heading, content, summary, input_fingerprint)
+                previous_summary[heading["heading_title"]] = summary
+
+    def stream_heading(self, book_title, heading_number, heading_notes=None):
+        # Streams one chapter's draft to the caller (UI, incremental saves).
+        # The summary is generated and everything stored once the draft is complete.
+        book = get_book(self.conn, book_title)
+        if not book:
+            logger.error(f"Book not found: {book_title}")
+            raise ValueError(f"No book found with title {book_title}")
+        headings = get_headings_by_book(self.conn, book["id"])
+        previous_summary = {}
+        for heading in headings:
+            if heading["heading_number"] == heading_number:
+                break
+            previous_summary[heading["heading_title"]] = heading["summary"]
+        else:
+            raise ValueError(f"No heading {heading_number} in book {book_title}")
+        logger.info(f"Streaming heading: {heading['heading_title']}")
+        content_prompt = self.build_content_prompt(book, heading, previous_summary, heading_notes)
+        chunks = []
+        for chunk in self.stream_model(self.get_content_template(content_prompt), call_context=self._stage_context("content", book, heading)):
+            chunks.append(chunk)
+            yield chunk
+        content = "".join(chunks)
+        summary = self.generate_summary(book, heading, content, heading_notes)
+        self.save_heading_content(book, heading, content, summary, self.heading_fingerprint(book, heading, previous_summary, heading_notes))
 
     # ------------------------------------------------------------------
-    # Retrieve Book
+    # Section Generation
     # ------------------------------------------------------------------
-    def get_book_and_outline(self, book_title):
-        logger.info(f"Fetching book: {book_title}")
+    def generate_section(self, book, heading, titles, index, context, heading_notes=None, section_notes=None, on_chunk=None):
+        messages = self.get_content_template(
+            self.build_section_prompt(book, heading, titles, index, context, heading_notes, section_notes)
+        )
+        for attempt in range(1, 4):
+            try:
+                logger.debug("Section generation attempt %d", attempt)
+                with telemetry_context(**self._stage_context("content", book, heading)):
+                    return self.call_model(messages, use_cache=attempt == 1, on_chunk=on_chunk)
+            except TransportError:
+                raise
+            except Exception as e:
+                logger.warning(f"Section generation failed (attempt {attempt}): {e}")
+        raise RuntimeError(f"Failed to generate section {titles[index]!r} of heading {heading['heading_title']}")
+
+    def generate_sections(self, book, heading, context, heading_notes=None, on_chunk=None):
+        # every section of the chapter at once, stitched back in outline order;
+        # on_chunk gets "<heading> / <section>" as its title
+        titles = section_titles(heading["sub_heading"])
+        self.prompt_token_usage[heading["heading_title"]] = sum(
+            count_message_tokens(self.get_content_template(
+                self.build_section_prompt(book, heading, titles, i, context, heading_notes)
+            )) for i in range(len(titles))
+        )
+        logger.info(f"Content prompts for '{heading['heading_title']}': {len(titles)} section(s), "
+                    f"~{self.prompt_token_usage[heading['heading_title']]} tokens")
+        with ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(titles)))) as pool:
+            futures = [
+                pool.submit(
+                    self.generate_section, book, heading, titles, i, context, heading_notes, None,
+                    (lambda chunk, title=title: on_chunk(f"{heading['heading_title']} / {title}", chunk)) if on_chunk else None
+                )
+                for i, title in enumerate(titles)
+            ]
+            return stitch_sections([future.result() for future in futures])
+
+    def regenerate_section(self, book_title, heading_number, section_number, section_notes=None, heading_notes=None,
+                           resummarize="auto", resummarize_threshold=0.2):
+        # Rewrites one section of a chapter written section by section and
+        # restitches the chapter. The summary is only regenerated when the
+        # rewrite changed at least `resummarize_threshold` of the chapter's
+        # words ("auto"), always (True) or never (False). The chapter's input
+        # fingerprint is left alone, so regenerate_changed keeps the edit.
         book = get_book(self.conn, book_title)
         if not book:
             logger.error(f"Book not found: {book_title}")
             raise ValueError(f"No book found with title {book_title}")
-        headings = get_headings_by_book(self.conn, book["id"])
-        outline = {
-            "book_title": book["title"],
-            "outline": []
+        previous_summary = {}
+        for heading in get_headings_by_book(self.conn, book["id"]):
+            if heading["heading_number"] == heading_number:
+                break
+            previous_summary[heading["heading_title"]] = heading["summary"]
+        else:
+            raise ValueError(f"No heading {heading_number} in book {book_title}")
+        sections = get_sections(self.conn, heading["id"])
+        if not 1 <= section_number <= len(sections):
+            raise ValueError(f"No section {section_number} in heading {heading['heading_title']!r} ({len(sections)} section(s))")
+        if any(section["content"] is None for section in sections):
+            raise ValueError(f"Heading {heading['heading_title']!r} was not written section by section, "
+                             f"regenerate it with granularity='section' first")
+        titles = [section["section_title"] for section in sections]
+        texts = [section["content"] for section in sections]
+        old = texts[section_number - 1]
+        logger.info(f"Regenerating section '{titles[section_number - 1]}' of heading: {heading['heading_title']}")
+        bypass_cache, self.bypass_cache = self.bypass_cache, True
+        try:
+            texts[section_number - 1] = self.generate_section(
+                book, heading, titles, section_number - 1, previous_summary, heading_notes, section_notes
+            ).strip()
+        finally:
+            self.bypass_cache = bypass_cache
+        content = stitch_sections(texts)
+        change = section_change(old, texts[section_number - 1], heading["content"] or content)
+        summary = heading["summary"]
+        resummarized = resummarize is True or (resummarize == "auto" and change >= resummarize_threshold) or not summary
+        if resummarized:
+            summary = self.generate_summary(book, heading, content, heading_notes)
+            if normalize_text(summary) == normalize_text(heading["summary"]):
+                # keep the stored wording so downstream fingerprints stay valid
+                summary = heading["summary"]
+        with transaction(self.conn):
+            update_heading(self.conn, book["id"], heading["heading_title"], summary=summary, content=content)
+            update_section(self.conn, heading["id"], section_number, texts[section_number - 1])
+        logger.info(f"Section rewritten ({change:.0%} of the chapter changed), "
+                    f"summary {'regenerated' if resummarized else 'kept'}")
+        return {
+            "heading_title": heading["heading_title"],
+            "section_title": titles[section_number - 1],
+            "change": round(change, 3),
+            "summary_regenerated": resummarized,
+            "summary_changed": summary != heading["summary"],
         }
-        for heading in headings:
-            outline["outline"].append({
-                "chapter_number": heading["heading_number"],
-                "chapter_title": heading["heading_title"],
-                "chapter_description": heading["description"],
-                "sections": heading["sub_heading"],
-                "summary": heading["summary"],
-                "content": heading["content"]
-            })
+
+    # ------------------------------------------------------------------
+    # Speculative Drafting
+    # ------------------------------------------------------------------
+    def speculation_stats(self):
+        # hit rate, tokens spent and wasted, and the drafting time it hid
+        if not self.speculator:
+            raise RuntimeError("Speculative drafting is disabled for this BookGen instance")
+        return self.speculator.stats()
+
+    def close_speculation(self, wait=True):
+        if self.speculator:
+            self.speculator.close(wait)
+
+    # ------------------------------------------------------------------
+    # Duplicate Detection
+    # ------------------------------------------------------------------
+    def duplicate_tracker(self, written_headings=()):
+        # seeded with the chapters already written before this run starts
+        if self.dedup_threshold is None:
+            return None
+        tracker = DuplicateTracker(self.dedup_threshold)
+        tracker.add_many((h["heading_title"], h["content"], h["summary"]) for h in written_headings if h["content"])
+        return tracker
+
+    def dedup_notes(self, heading, findings, tracker, heading_notes=None):
+        others = list(dict.fromkeys(finding["other"] for finding in findings))
+        note = DEDUP_NOTE.replace(
+            "__OTHER_HEADINGS__", ", ".join(others)
+        ).replace(
+            "__OTHER_SUMMARIES__", "\n".join(f"- {title}: {tracker.summary_text.get(title, '')}" for title in others)
+        )
+        notes = self.heading_notes_for(heading, heading_notes)
+        return {**(heading_notes or {}), heading["heading_title"]: f"{notes}\n{note}".strip()}
+
+    def check_duplicates(self, tracker, book, heading, content, summary, context, heading_notes=None):
+        # compares a finished chapter with the earlier ones, optionally
+        # rewrites it once, and indexes whatever ends up being saved
+        if tracker is None:
+            return content, summary
+        findings = tracker.check(heading["heading_title"], content, summary)
+        if findings and self.dedup_action == "regenerate":
+            logger.warning(f"'{heading['heading_title']}' duplicates {sorted({f['other'] for f in findings})}, regenerating it")
+            notes = self.dedup_notes(heading, findings, tracker, heading_notes)
+            content = self.generate_content(book, heading, context, notes)
+            summary = self.generate_summary(book, heading, content, notes)
+            for finding in findings:
+                finding["regenerated"] = True
+            remaining = tracker.check(heading["heading_title"], content, summary)
+            for finding in remaining:
+                finding["after_regeneration"] = True
+            findings += remaining
+        for finding in findings:
+            if self.dedup_action == "flag" or finding.get("after_regeneration"):
+                logger.warning(f"Near-duplicate {finding['level']}: '{finding['heading']}' ~ '{finding['other']}' ({finding['similarity']:.2f})")
+        self.duplicate_findings.extend({"book_title": book["title"], **finding} for finding in findings)
+        tracker.add(heading["heading_title"], content, summary)
+        return content, summary
+
+    def audit_duplicates(self, book_title=None, threshold=0.5, paragraphs=True, min_paragraph_words=40):
+        # Batch pass over every written chapter in the library (or one book):
+        # near-duplicate chapter pairs and, optionally, repeated paragraphs,
+        # most similar first. Pairs within the same chapter are not reported.
+        with self.db.snapshot() as conn:
+            rows = list(iter_library_headings(conn, book_title, ("content",)))
+        keys = [(row["book_title"], row["heading_title"]) for row in rows]
+        def pair(a, b, similarity):
+            return {"a_book": a[0], "a_heading": a[1], "b_book": b[0], "b_heading": b[1], "similarity": round(similarity, 3)}
+        findings = [
+            {"level": "chapter", **pair(a, b, similarity)}
+            for a, b, similarity in find_duplicates(zip(keys, (row["content"] for row in rows)), threshold)
+        ]
+        if paragraphs:
+            items = [item for key, row in zip(keys, rows) for item in paragraph_items(key, row["content"], min_paragraph_words)]
+            findings += [
+                {"level": "paragraph", **pair(a[0], b[0], similarity), "a_paragraph": a[1], "b_paragraph": b[1]}
+                for a, b, similarity in find_duplicates(items, max(threshold, 0.6), exclude=lambda a, b: a[0] == b[0])
+            ]
+        logger.info(f"Duplicate audit over {len(rows)} chapter(s): {len(findings)} finding(s)")
+        return findings
+
+    # ------------------------------------------------------------------
+    # Incremental Regeneration
+    # ------------------------------------------------------------------
+    def regenerate_changed(self, book_title, heading_notes=None):
+        # Rewrites only headings whose input fingerprint changed. A rewritten
+        # heading only invalidates later ones if its summary actually differs,
+        # because upstream summaries are part of every downstream fingerprint.
+        logger.info(f"Regenerating changed headings for book: {book_title}")
+        book = get_book(self.conn, book_title)
+        if not book:
+            logger.error(f"Book not found: {book_title}")
+            raise ValueError(f"No book found with title {book_title}")
+        previous_summary = {}
+        regenerated = []
+        for heading in get_headings_by_book(self.conn, book["id"]):
+            input_fingerprint = self.heading_fingerprint(book, heading, previous_summary, heading_notes)
+            if heading["content"] and heading["input_fingerprint"] == input_fingerprint:
+                logger.debug(f"Heading unchanged, skipping: {heading['heading_title']}")
+                previous_summary[heading["heading_title"]] = heading["summary"]
+                continue
+            logger.info(f"Heading changed, regenerating: {heading['heading_title']}")
+            content = self.generate_content(book, heading, previous_summary, heading_notes)
+            summary = self.generate_summary(book, heading, content, heading_notes)
+            if normalize_text(summary) == normalize_text(heading["summary"]):
+                # keep the stored wording so downstream fingerprints stay valid
+                summary = heading["summary"]
+            self.save_heading_content(book, heading, content, summary, input_fingerprint)
+            previous_summary[heading["heading_title"]] = summary
+            regenerated.append(heading["heading_title"])
+        logger.info(f"Regenerated {len(regenerated)} heading(s)")
+        return regenerated
+
+    # ------------------------------------------------------------------
+    # Revision History
+    # ------------------------------------------------------------------
+    # update_heading appends every content/summary change to the revisions
+    # table; these read it back, roll back and prune it.
+    def _book_heading(self, conn, book_title, heading_number):
+        book = get_book(conn, book_title)
+        if not book:
+            logger.error(f"Book not found: {book_title}")
+            raise ValueError(f"No book found with title {book_title}")
+        for heading in get_headings_by_book(conn, book["id"]):
+            if heading["heading_number"] == heading_number:
+                return book, heading
+        raise ValueError(f"No heading {heading_number} in book {book_title}")
+
+    def heading_history(self, book_title, heading_number):
+        with self.db.snapshot() as conn:
+            _, heading = self._book_heading(conn, book_title, heading_number)
+            return list_revisions(conn, heading["id"])
+
+    def heading_revision(self, book_title, heading_number, revision=None, at=None):
+        # `at`: datetime or ISO timestamp (UTC), the revision current at that time
+        with self.db.snapshot() as conn:
+            _, heading = self._book_heading(conn, book_title, heading_number)
+            found = get_revision(conn, heading["id"], revision, at.isoformat() if isinstance(at, datetime) else at)
+        if not found:
+            raise ValueError(f"No revision {revision or at} of heading {heading_number} in book {book_title}")
+        return found
+
+    def diff_revisions(self, book_title, heading_number, a, b=None):
+        # unified diff of revision a against b (default: the latest)
+        old = self.heading_revision(book_title, heading_number, a)
+        new = self.heading_revision(book_title, heading_number, b)
+        return "".join(difflib.unified_diff(
+            (old["content"] or "").splitlines(keepends=True), (new["content"] or "").splitlines(keepends=True),
+            fromfile=f"revision {old['revision']}", tofile=f"revision {new['revision']}"
+        ))
+
+    def rollback_heading(self, book_title, heading_number, revision):
+        # restores an old revision as a new one, the history stays append-only
+        book, heading = self._book_heading(self.conn, book_title, heading_number)
+        old = self.heading_revision(book_title, heading_number, revision)
+        self.save_heading_content(book, heading, old["content"], old["summary"], old["input_fingerprint"])
+        logger.info(f"Rolled back '{heading['heading_title']}' to revision {revision}")
+
+    def book_at(self, book_title, at):
+        # point-in-time view of the whole book: every heading as it stood at `at`
+        with self.db.snapshot() as conn:
+            book = get_book(conn, book_title)
+            if not book:
+                logger.error(f"Book not found: {book_title}")
+                raise ValueError(f"No book found with title {book_title}")
+            return get_book_at(conn, book["id"], at.isoformat() if isinstance(at, datetime) else at)
+
+    def compact_history(self, book_title=None, keep_last=10, keep_daily=30, vacuum=False):
+        # applies the retention policy of compact_revisions to one book or the library
+        conn = self.conn
+        rows = conn.execute("""
+        SELECT h.id FROM headings h JOIN books b ON b.id = h.book_id WHERE ? IS NULL OR b.title = ?
+        """, (book_title, book_title)).fetchall()
+        removed = sum(compact_revisions(conn, row[0], keep_last, keep_daily) for row in rows)
+        if vacuum and removed:
+            conn.execute("VACUUM")
+        logger.info(f"Compacted revision history: {removed} revision(s) removed")
+        return removed
+
+    # ------------------------------------------------------------------
+    # Job Queue
+    # ------------------------------------------------------------------
+    # Books queued here are generated by `python -m BookGen.worker` processes.
+    def enqueue_book(self, title, notes, heading_notes=None, output_stem=None, export_formats=("docx",), max_attempts=3):
+        job_id = add_job(self.conn, title, notes, heading_notes, output_stem, export_formats, max_attempts)
+        logger.info(f"Queued book '{title}' as job {job_id}")
+        return job_id
+
+    def job_progress(self, job_id):
+        return get_job_progress(self.conn, job_id)
+
+    # ------------------------------------------------------------------
+    # Telemetry
+    # ------------------------------------------------------------------
+    def backend_stats(self):
+        # per stage pool: health, call counts and latency of every backend
+        return self.router.stats()
+
+    def telemetry_report(self, book_title):
+        # where generation time, tokens and money went for one book
+        if not self.telemetry:
+            raise RuntimeError("Telemetry is disabled for this BookGen instance")
+        return summarize_calls(self.telemetry.rows(book_title))
+
+    # ------------------------------------------------------------------
+    # Notifications
+    # ------------------------------------------------------------------
+    def notify(self, event, book_title=None, **payload):
+        # one INSERT on the caller's connection (part of its transaction, if
+        # any); delivery happens on the dispatcher thread
+        if not self.notifier:
+            return None
+        notification_id = add_notification(self.conn, event, book_title, payload)
+        self.notifier.wake()
+        return notification_id
+
+    def notification_stats(self):
+        # queue depth, oldest undelivered event, delivery latency and failures
+        if not self.notifier:
+            return get_notification_stats(self.conn)
+        return self.notifier.stats()
+
+    def close_notifications(self, flush=True):
+        # delivers what is due (unless flush=False) and stops the dispatcher;
+        # anything left stays queued for the next process
+        if self.notifier:
+            self.notifier.stop(flush)
+
+    # ------------------------------------------------------------------
+    # Search
+    # ------------------------------------------------------------------
+    def search(self, query, book_title=None, limit=20, offset=0, raw=False, columns=None):
+        # chapters across every book (or one) whose content, summary or
+        # description match, best first, each with a highlighted snippet
+        results = search_headings(self.conn, query, book_title, columns, limit, offset, raw)
+        logger.info(f"Search {query!r}: {len(results)} result(s)")
+        return results
+
+    # ------------------------------------------------------------------
+    # Retrieve Book
+    # ------------------------------------------------------------------
+    def get_book_and_outline(self, book_title):
+        logger.info(f"Fetching book: {book_title}")
+        with self.db.snapshot() as conn:
+            book = get_book(conn, book_title)
+            if not book:
+                logger.error(f"Book not found: {book_title}")
+                raise ValueError(f"No book found with title {book_title}")
+            headings = get_headings_by_book(conn, book["id"])
         logger.info("Book outline retrieved successfully")
-        return json.dumps(outline, indent=2)
+        return json.dumps(book_outline(book, headings), indent=2)
     
     def book_gen(self, title, output_path):
-        doc = Document()
-        # Basic document styling
-        style = doc.styles['Normal']
-        font = style.font
-        font.name = 'Times New Roman'
-        font.size = Pt(12)
-        doc.add_heading(title.title(), level=0)
+        # streams chapters from the DB into the .docx, one paragraph at a time
         logger.info(f"Fetching book: {title}")
-        book = get_book(self.conn, title)
-        headings = get_headings_by_book(self.conn, book["id"])
-        for heading in headings:
-            doc.add_heading(f"{heading['heading_number']}. {heading['heading_title']}", level=1)
-            doc.add_paragraph(heading["content"])
-        doc.save(output_path)
+        with self.db.snapshot() as conn:
+            book = get_book(conn, title)
+            if not book:
+                logger.error(f"Book not found: {title}")
+                raise ValueError(f"No book found with title {title}")
+            with DocxStreamWriter(output_path) as doc:
+                doc.add_heading(title.title(), level=0)
+                for heading in iter_headings_by_book(conn, book["id"]):
+                    doc.add_heading(f"{heading['heading_number']}. {heading['heading_title']}", level=1)
+                    for paragraph in split_paragraphs(heading["content"] or ""):
+                        doc.add_paragraph(paragraph)
+        logger.info(f"Book exported to {output_path}")
+        self.notify("book_exported", title, path=output_path)
+
+    def export_book(self, title, output_stem, formats=DEFAULT_EXPORT_FORMATS, max_workers=None, incremental=True):
+        # One pass renders every format per chapter in a process pool; only
+        # chapters edited since the last export are re-rendered, the rest come
+        # from export_renders. Returns {format: output path}.
+        exporters = {name: get_exporter(name) for name in formats}
+        conn = self.conn
+        book = get_book(conn, title)
+        if not book:
+            logger.error(f"Book not found: {title}")
+            raise ValueError(f"No book found with title {title}")
+        stale = get_stale_export_headings(conn, book["id"], exporters, force=not incremental)
+        rows = ({**heading, "content": get_heading_content(conn, heading["id"])} for heading in stale)
+        batch = []
+        for heading, rendered in render_chapters(rows, exporters, max_workers):
+            batch.extend((heading["id"], name, heading["updated_at"], body) for name, body in rendered.items())
+            if len(batch) >= 256:
+                save_export_renders(conn, batch)
+                batch = []
+        if batch:
+            save_export_renders(conn, batch)
+        logger.info(f"Rendered {len(stale)} chapter(s) for {', '.join(exporters)}")
+
+        paths = {}
+        with self.db.snapshot() as snapshot:
+            chapters = [(h["heading_number"], h["heading_title"]) for h in iter_headings_by_book(snapshot, book["id"], ("heading_number", "heading_title"))]
+            for name, exporter in exporters.items():
+                paths[name] = output_stem + exporter.extension
+                with exporter(paths[name], title.title(), chapters) as out:
+                    for body in iter_export_renders(snapshot, book["id"], name):
+                        out.write_chapter(body)
+        logger.info(f"Book exported to {', '.join(paths.values())}")
+        self.notify("book_exported", title, paths=", ".join(paths.values()))
+        return paths
 
 # ------------------------------------------------------------------
 # Entry Point
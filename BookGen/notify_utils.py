@@ -0,0 +1,223 @@
+import os, socket, threading, time, uuid, logging
+from collections import Counter, deque
+from typing import Dict, List, Optional
+from .db_utils import claim_notifications, mark_notifications_sent, fail_notifications, get_notification_stats
+
+logger = logging.getLogger("BookGen")
+
+NOTIFICATION_EVENTS = ("outline_ready", "content_completed", "book_exported", "error")
+EVENT_TITLES = {
+    "outline_ready": "Outline ready for review",
+    "content_completed": "Chapters generated",
+    "book_exported": "Book exported",
+    "error": "Generation failed",
+}
+
+# =========================
+# SMTP Transport
+# =========================
+class SMTPTransport:
+    # One SMTP connection reused across batches and closed after
+    # `idle_timeout` seconds without mail. A dropped connection is reopened
+    # once per send before the error is reported.
+    def __init__(self, host: str, port: int = 587, username: Optional[str] = None, password: Optional[str] = None,
+                 ssl: bool = False, starttls: bool = False, timeout: float = 30.0, idle_timeout: float = 60.0):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.ssl = ssl
+        self.starttls = starttls
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self.connections = 0
+        self._smtp = None
+        self._last_used = 0.0
+
+    @classmethod
+    def from_config(cls, config) -> "SMTPTransport":
+        return cls(config.smtp_host, config.smtp_port, config.smtp_user, config.smtp_password,
+                   ssl=config.smtp_ssl, starttls=config.smtp_starttls)
+
+    def _connect(self):
+        import smtplib
+        if self.ssl:
+            smtp = smtplib.SMTP_SSL(self.host, self.port, timeout=self.timeout)
+        else:
+            smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+            if self.starttls:
+                smtp.starttls()
+        if self.username:
+            smtp.login(self.username, self.password or "")
+        self.connections += 1
+        return smtp
+
+    def send(self, messages: List):
+        import smtplib
+        if self._smtp is not None and time.monotonic() - self._last_used > self.idle_timeout:
+            self.close()
+        for attempt in range(2):
+            try:
+                if self._smtp is None:
+                    self._smtp = self._connect()
+                for message in messages:
+                    self._smtp.send_message(message)
+                self._last_used = time.monotonic()
+                return
+            except (smtplib.SMTPServerDisconnected, ConnectionError):
+                # stale keep-alive connection: reconnect once
+                self._smtp = None
+                if attempt:
+                    raise
+
+    def close(self):
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except Exception:
+                pass
+            self._smtp = None
+
+# =========================
+# Digests
+# =========================
+def _event_line(row: Dict) -> str:
+    payload = row.get("payload") or {}
+    details = ", ".join(f"{key}: {value}" for key, value in payload.items())
+    when = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(row["created_at"]))
+    return f"[{when}] {EVENT_TITLES.get(row['event'], row['event'])}: {row.get('book_title') or '-'}" + (f" ({details})" if details else "")
+
+def render_digest(rows: List[Dict], sender: Optional[str], recipients: List[str]):
+    # one email for a whole batch; a single event keeps its own subject
+    from email.message import EmailMessage
+    message = EmailMessage()
+    if len(rows) == 1:
+        row = rows[0]
+        message["Subject"] = f"BookGen: {EVENT_TITLES.get(row['event'], row['event'])} - {row.get('book_title') or ''}".rstrip(" -")
+    else:
+        counts = Counter(row["event"] for row in rows)
+        message["Subject"] = "BookGen: " + ", ".join(
+            f"{count} x {EVENT_TITLES.get(event, event).lower()}" for event, count in counts.most_common()
+        )
+    message["From"] = sender or "bookgen@localhost"
+    message["To"] = ", ".join(recipients)
+    errors = [row for row in rows if row["event"] == "error"]
+    lines = ([f"{len(errors)} error(s) need attention.", ""] if errors else []) + [_event_line(row) for row in errors]
+    lines += [_event_line(row) for row in rows if row["event"] != "error"]
+    message.set_content("\n".join(lines) + "\n")
+    return message
+
+# =========================
+# Dispatcher
+# =========================
+class NotificationDispatcher:
+    # Delivers the notifications table from a background thread, so a slow
+    # or unreachable mail server never holds up generation. Events that
+    # arrive within `batch_window` seconds of each other go out as one
+    # digest. Several processes may dispatch from one database, claims are leased.
+    def __init__(self, db, transport: SMTPTransport, sender: Optional[str], recipients: List[str],
+                 batch_window: float = 5.0, max_batch: int = 100, poll_interval: float = 5.0,
+                 lease_seconds: float = 120.0, max_attempts: int = 5, retry_backoff: float = 30.0):
+        self.db = db
+        self.transport = transport
+        self.sender = sender
+        self.recipients = recipients
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.sent = 0
+        self.batches = 0
+        self.failures = 0
+        self.last_error = None
+        self._latencies = deque(maxlen=1000)
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        # the SMTP connection is shared by the thread and flush() callers
+        self._send_lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name="bookgen-notify", daemon=True)
+                self._thread.start()
+        return self
+
+    def wake(self):
+        # called after an event is enqueued in this process
+        self.start()
+        self._wake.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                delivered = self.dispatch_once()
+            except Exception as e:
+                logger.warning(f"Notification dispatch failed: {e}")
+                delivered = 0
+            if delivered:
+                continue
+            self._wake.wait(min(self.poll_interval, self.batch_window or self.poll_interval))
+            self._wake.clear()
+
+    def dispatch_once(self, min_age: Optional[float] = None) -> int:
+        # one batch: claim, render one digest, send, record; returns events delivered
+        conn = self.db.connection()
+        rows = claim_notifications(conn, self.owner, self.max_batch, self.lease_seconds,
+                                   self.batch_window if min_age is None else min_age)
+        if not rows:
+            return 0
+        try:
+            with self._send_lock:
+                self.transport.send([render_digest(rows, self.sender, self.recipients)])
+        except Exception as e:
+            self.failures += 1
+            self.last_error = str(e)
+            logger.warning(f"Could not deliver {len(rows)} notification(s): {e}")
+            fail_notifications(conn, rows, self.owner, str(e), self.max_attempts, self.retry_backoff)
+            return 0
+        mark_notifications_sent(conn, [row["id"] for row in rows], self.owner)
+        now = time.time()
+        self._latencies.extend(now - row["created_at"] for row in rows)
+        self.sent += len(rows)
+        self.batches += 1
+        return len(rows)
+
+    def flush(self, timeout: float = 30.0) -> bool:
+        # deliver everything due right now, without waiting out the batch window
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if not self.dispatch_once(min_age=0.0):
+                return get_notification_stats(self.db.connection())["pending"] == 0
+        return False
+
+    def stop(self, flush: bool = True):
+        if flush:
+            self.flush()
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+        with self._send_lock:
+            self.transport.close()
+
+    def stats(self) -> Dict:
+        # queue depth from the database, delivery latency (enqueue -> sent) from this process
+        latencies = sorted(self._latencies)
+        pick = lambda p: round(latencies[min(len(latencies) - 1, int(p * len(latencies)))], 3) if latencies else None
+        return {
+            **get_notification_stats(self.db.connection()),
+            "delivered": self.sent,
+            "batches": self.batches,
+            "delivery_failures": self.failures,
+            "smtp_connections": self.transport.connections,
+            "latency_p50": pick(0.5),
+            "latency_p95": pick(0.95),
+            "last_error": self.last_error,
+        }
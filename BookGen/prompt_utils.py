@@ -0,0 +1,218 @@
+import json, hashlib, re, threading
+from difflib import SequenceMatcher
+from typing import List, Dict, Optional
+
+# =========================
+# Token Accounting
+# =========================
+# OpenRouter fronts many tokenizers, so a character heuristic is used instead
+# of a model specific one. ~4 characters per token is close enough for budgets.
+CHARS_PER_TOKEN = 4
+MESSAGE_OVERHEAD_TOKENS = 4
+TRUNCATION_MARKER = "\n--- TRUNCATED ---\n"
+
+def estimate_tokens(text: str) -> int:
+    if not text:
+        return 0
+    return len(text) // CHARS_PER_TOKEN + 1
+
+def count_message_tokens(messages: List[Dict]) -> int:
+    return sum(estimate_tokens(m["content"]) + MESSAGE_OVERHEAD_TOKENS for m in messages)
+
+def payload_size(messages: List[Dict]) -> int:
+    # size in bytes of the messages as they go over the wire
+    return len(json.dumps(messages).encode("utf-8"))
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    # keep the head and the tail, templates put instructions at both ends
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    keep = max((max_tokens - 1) * CHARS_PER_TOKEN - len(TRUNCATION_MARKER), 0)
+    head = keep // 2
+    tail = keep - head
+    return text[:head] + TRUNCATION_MARKER + (text[-tail:] if tail else "")
+
+# =========================
+# Message Builder
+# =========================
+def build_messages(system_prompt: str, user_prompt: str, max_prompt_tokens: Optional[int] = None) -> List[Dict]:
+    # every call gets a fresh list: system prompt + the current request only
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt},
+    ]
+    if max_prompt_tokens is None or count_message_tokens(messages) <= max_prompt_tokens:
+        return messages
+    budget = max_prompt_tokens - count_message_tokens(messages[:1]) - MESSAGE_OVERHEAD_TOKENS
+    if budget <= 0:
+        raise ValueError(f"System prompt alone exceeds the prompt budget of {max_prompt_tokens} tokens")
+    messages[1]["content"] = truncate_to_tokens(user_prompt, budget)
+    return messages
+
+# =========================
+# Input Fingerprints
+# =========================
+def normalize_text(text: Optional[str]) -> str:
+    return re.sub(r"\s+", " ", text or "").strip()
+
+def fingerprint(inputs) -> str:
+    # stable hash of whatever went into a generation step
+    raw = json.dumps(inputs, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+# =========================
+# Previous-Chapter Context
+# =========================
+ARC_SUMMARY_KEY = "Earlier chapters (condensed)"
+
+def _lead(text: str, max_words: int) -> str:
+    return " ".join(normalize_text(text).split(" ")[:max_words])
+
+def _json_chars(text: str) -> int:
+    # characters `text` adds inside a JSON string; escaping is per character,
+    # so the lengths of joined parts add up
+    return len(json.dumps(text)) - 2
+
+class SummaryContext:
+    # Hierarchical context for CONTENT_PROMPT: the last `recent` summaries stay
+    # verbatim, older ones are folded into an arc summary. While over
+    # `token_budget`, the adjacent arc groups covering the fewest chapters are
+    # merged (oldest first) and their text halved, so the arc stays balanced.
+    # The size of the rendered JSON is kept up to date on every change, so
+    # adding a summary costs the same at chapter 1000 as at chapter 10.
+    def __init__(self, token_budget: Optional[int] = 4000, recent: int = 3, lead_words: int = 40):
+        self.token_budget = token_budget
+        self.recent = recent
+        self.lead_words = lead_words
+        self.arc: List[Dict] = []   # oldest first: {"first", "last", "span", "text", "chars"}
+        self.latest: Dict[str, str] = {}
+        self._arc_chars = 0
+        self._latest_chars = 0
+
+    def _entry_chars(self, title: str, text: str) -> int:
+        # '"title": "text"'
+        return _json_chars(title) + _json_chars(text) + 6
+
+    def _group(self, first: str, last: str, span: int, text: str) -> Dict:
+        rendered = f"[{first}] {text}" if span == 1 else f"[{first} to {last}] {text}"
+        return {"first": first, "last": last, "span": span, "text": text, "chars": _json_chars(rendered)}
+
+    def add(self, title: str, summary: Optional[str]):
+        if title in self.latest:
+            self._latest_chars -= self._entry_chars(title, self.latest.pop(title))
+        self.latest[title] = summary or ""
+        self._latest_chars += self._entry_chars(title, self.latest[title])
+        while len(self.latest) > self.recent:
+            old_title = next(iter(self.latest))
+            old_text = self.latest.pop(old_title)
+            self._latest_chars -= self._entry_chars(old_title, old_text)
+            self.arc.append(self._group(old_title, old_title, 1, _lead(old_text, self.lead_words)))
+            self._arc_chars += self.arc[-1]["chars"]
+        self._fit()
+
+    def _render_arc(self) -> str:
+        return " ".join(
+            f"[{g['first']}] {g['text']}" if g["span"] == 1 else f"[{g['first']} to {g['last']}] {g['text']}"
+            for g in self.arc
+        )
+
+    def render(self) -> Dict[str, str]:
+        context = {ARC_SUMMARY_KEY: self._render_arc()} if self.arc else {}
+        context.update(self.latest)
+        return context
+
+    def tokens(self) -> int:
+        # estimate_tokens(json.dumps(self.render())) without rendering
+        entries = len(self.latest) + (1 if self.arc else 0)
+        chars = 2 + self._latest_chars + 2 * max(entries - 1, 0)
+        if self.arc:
+            chars += self._entry_chars(ARC_SUMMARY_KEY, "") + self._arc_chars + len(self.arc) - 1
+        return chars // CHARS_PER_TOKEN + 1
+
+    def _recount(self):
+        self._arc_chars = sum(g["chars"] for g in self.arc)
+        self._latest_chars = sum(self._entry_chars(title, text) for title, text in self.latest.items())
+
+    def _merge_smallest_pair(self):
+        i = min(range(len(self.arc) - 1), key=lambda k: self.arc[k]["span"] + self.arc[k + 1]["span"])
+        left, right = self.arc[i], self.arc[i + 1]
+        words = max(4, len(left["text"].split(" ")) // 2)
+        merged = self._group(left["first"], right["last"], left["span"] + right["span"],
+                             f"{_lead(left['text'], words)} / {_lead(right['text'], words)}")
+        self._arc_chars += merged["chars"] - left["chars"] - right["chars"]
+        self.arc[i:i + 2] = [merged]
+
+    def _fit(self):
+        if self.token_budget is None:
+            return
+        while self.tokens() > self.token_budget and len(self.arc) > 1:
+            self._merge_smallest_pair()
+        # still too big: trim the arc, then the verbatim summaries
+        if self.tokens() > self.token_budget and self.arc:
+            first = self.arc[0]
+            self.arc[0] = self._group(first["first"], first["last"], first["span"],
+                                      truncate_to_tokens(first["text"], max(8, self.token_budget // 4)))
+            self._recount()
+        if self.tokens() > self.token_budget and self.latest:
+            share = max(16, self.token_budget // (len(self.latest) + 1))
+            self.latest = {title: truncate_to_tokens(text, share) for title, text in self.latest.items()}
+            self._recount()
+
+def build_summary_context(previous_summary: Dict[str, str], token_budget: Optional[int] = 4000, recent: int = 3) -> Dict[str, str]:
+    if token_budget is None:
+        return dict(previous_summary)
+    context = SummaryContext(token_budget, recent)
+    for title, summary in previous_summary.items():
+        context.add(title, summary)
+    return context.render()
+
+class RollingSummaryContext:
+    # One SummaryContext carried through a generation run instead of a fresh
+    # one per prompt: when a prompt's summaries extend the ones seen last,
+    # only the new summaries are added. Kept per thread, since pool threads
+    # take chapters in order; anything else (an earlier chapter, a changed
+    # summary) starts over.
+    def __init__(self):
+        self._local = threading.local()
+
+    def render(self, previous_summary: Dict[str, str], token_budget: Optional[int] = 4000, recent: int = 3) -> Dict[str, str]:
+        if token_budget is None:
+            return dict(previous_summary)
+        items = list(previous_summary.items())
+        state = getattr(self._local, "state", None)
+        if (state is None or state[0] != (token_budget, recent) or len(items) < len(state[1])
+                or items[:len(state[1])] != state[1]):
+            state = ((token_budget, recent), [], SummaryContext(token_budget, recent))
+            self._local.state = state
+        seen, context = state[1], state[2]
+        for title, summary in items[len(seen):]:
+            context.add(title, summary)
+        seen.extend(items[len(seen):])
+        return context.render()
+
+# =========================
+# Section Drafts
+# =========================
+SECTION_SEPARATOR = "\n\n"
+
+class ChapterDraft(str):
+    # A chapter stitched together from separately written sections. It is
+    # the chapter text everywhere a string is expected and keeps the parts
+    # so they can be stored in the sections table.
+    sections = None
+
+def stitch_sections(texts: List[str]) -> ChapterDraft:
+    parts = [text.strip() for text in texts]
+    draft = ChapterDraft(SECTION_SEPARATOR.join(parts))
+    draft.sections = parts
+    return draft
+
+def section_change(old: str, new: str, chapter: str) -> float:
+    # share of the chapter's words that a section rewrite actually changed
+    old_words, new_words = normalize_text(old).split(), normalize_text(new).split()
+    chapter_words = max(len(normalize_text(chapter).split()), len(old_words), 1)
+    if not old_words:
+        return min(1.0, len(new_words) / chapter_words)
+    matcher = SequenceMatcher(None, old_words, new_words, autojunk=False)
+    changed = max(len(old_words), len(new_words)) - sum(block.size for block in matcher.get_matching_blocks())
+    return min(1.0, changed / chapter_words)
@@ -0,0 +1,130 @@
+import random, threading, time, logging
+from typing import Dict, Iterable, List, Optional, Union
+from .http_utils import LLMTransport, TransportError
+from .exec_utils import InstanceLimiter, RateLimiter, get_rate_limiter
+
+logger = logging.getLogger("BookGen")
+
+STAGES = ("outline", "content", "summary")
+
+# =========================
+# Backends
+# =========================
+class Backend:
+    # One model behind one endpoint/key, with its own transport (so its
+    # circuit breaker and metrics are its own) and a health record the
+    # router uses to pick and fail over.
+    def __init__(self, model: str, transport: LLMTransport, weight: float = 1.0, cooldown: float = 30.0):
+        self.model = model
+        self.transport = transport
+        self.weight = weight
+        self.cooldown = cooldown
+        self.latency = None
+        self.calls = 0
+        self.failures = 0
+        self._consecutive_failures = 0
+        self._cooldown_until = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def healthy(self) -> bool:
+        return time.monotonic() >= self._cooldown_until and self.transport.breaker.state != "open"
+
+    def record_success(self, latency: float):
+        with self._lock:
+            self.calls += 1
+            self._consecutive_failures = 0
+            # EWMA so a backend that turns slow is demoted within a few calls
+            self.latency = latency if self.latency is None else 0.7 * self.latency + 0.3 * latency
+
+    def record_failure(self, error: Exception):
+        with self._lock:
+            self.calls += 1
+            self.failures += 1
+            self._consecutive_failures += 1
+            # rate limited or failing: sit out, longer each time it happens again
+            backoff = min(self.cooldown * 2 ** (self._consecutive_failures - 1), 600.0)
+            self._cooldown_until = time.monotonic() + backoff
+        logger.warning(f"Backend {self.model} failed ({error}), cooling down for {backoff:.0f}s")
+
+    def stats(self) -> Dict:
+        return {
+            "model": self.model,
+            "api_url": self.transport.api_url,
+            "weight": self.weight,
+            "healthy": self.healthy,
+            "latency_ewma": self.latency,
+            "calls": self.calls,
+            "failures": self.failures,
+            **{k: v for k, v in self.transport.metrics.snapshot().items() if k.startswith(("latency_p", "ttft_p"))},
+        }
+
+# =========================
+# Router
+# =========================
+class ModelRouter:
+    # Per-stage pools of backends. candidates() orders a stage's pool for
+    # one call: healthy backends first, drawn at random with probability
+    # proportional to weight / observed latency, then cooling-down ones as
+    # a last resort. Stages without a route use the default pool.
+    def __init__(self, default: List[Backend], routes: Optional[Dict[str, List[Backend]]] = None):
+        self.default = default
+        self.routes = routes or {}
+
+    def pool(self, stage: Optional[str]) -> List[Backend]:
+        return self.routes.get(stage) or self.default
+
+    def candidates(self, stage: Optional[str]) -> List[Backend]:
+        pool = self.pool(stage)
+        if len(pool) == 1:
+            return list(pool)
+        healthy = [backend for backend in pool if backend.healthy]
+        known = [backend.latency for backend in healthy if backend.latency]
+        typical = sum(known) / len(known) if known else 1.0
+        def draw(backend):
+            # weighted sampling without replacement (Efraimidis-Spirakis)
+            score = backend.weight / (backend.latency or typical)
+            return random.random() ** (1.0 / max(score, 1e-9))
+        ordered = sorted(healthy, key=draw, reverse=True)
+        return ordered + sorted((b for b in pool if not b.healthy), key=lambda b: b._cooldown_until)
+
+    def route_key(self, stage: Optional[str]) -> str:
+        # identifies the pool, e.g. for cache keys: any of its models may answer
+        return "|".join(sorted(backend.model for backend in self.pool(stage)))
+
+    def pools(self) -> Dict[str, List[Backend]]:
+        return {"default": self.default, **self.routes}
+
+    def describe(self) -> Dict[str, List[str]]:
+        return {stage: [b.model for b in pool] for stage, pool in self.pools().items()}
+
+    def stats(self) -> Dict[str, List[Dict]]:
+        return {stage: [b.stats() for b in pool] for stage, pool in self.pools().items()}
+
+BackendSpec = Union[str, Dict]
+
+def build_router(default: Backend, routes: Optional[Dict[str, Union[BackendSpec, Iterable[BackendSpec]]]],
+                 api_url: str, api_key: str, transport_options: Optional[Dict] = None, max_concurrent: Optional[int] = None) -> ModelRouter:
+    # routes: {"summary": "cheap/model", "content": [{"model": ..., "weight": 3}, {"model": ..., "api_key": ...}]}
+    # a spec may set model, api_url, api_key, weight, requests_per_minute, max_retries
+    transport_options = transport_options or {}
+    pools = {}
+    for stage, specs in (routes or {}).items():
+        if stage not in STAGES:
+            raise ValueError(f"Unknown routing stage {stage!r}, expected one of {STAGES}")
+        specs = [specs] if isinstance(specs, (str, dict)) else list(specs)
+        pool = []
+        for spec in specs:
+            spec = {"model": spec} if isinstance(spec, str) else dict(spec)
+            url = spec.get("api_url", api_url)
+            rpm = spec.get("requests_per_minute")
+            # a key with its own quota gets its own bucket, otherwise share the provider's
+            limiter = InstanceLimiter(RateLimiter(rpm) if rpm else get_rate_limiter(url), max_concurrent)
+            # in a pool, fail over to the next backend rather than backing off on this one
+            options = dict(transport_options)
+            if len(specs) > 1 or "max_retries" in spec:
+                options["max_retries"] = spec.get("max_retries", 0)
+            transport = LLMTransport(url, spec.get("api_key", api_key), rate_limiter=limiter, **options)
+            pool.append(Backend(spec["model"], transport, spec.get("weight", 1.0)))
+        pools[stage] = pool
+    return ModelRouter([default], pools)
@@ -0,0 +1,200 @@
+import threading, time, logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+from .db_utils import get_book, get_headings_by_book, add_draft, get_draft, set_draft_status, discard_drafts, get_draft_stats
+from .prompt_utils import estimate_tokens, stitch_sections
+
+logger = logging.getLogger("BookGen")
+
+# =========================
+# Speculative Drafting
+# =========================
+class Speculator:
+    # Drafts the chapters of a freshly saved outline in the background while
+    # it waits for review. Each draft is stored as a provisional version under
+    # a fingerprint of the outline entry, notes, model, prompts and the
+    # outline descriptions of the chapters before it (drafts are written
+    # before any summary exists). When generation later asks for a chapter with
+    # exactly those inputs the draft is promoted instead of calling the model,
+    # otherwise it is discarded. A promoted chapter is saved under the draft's
+    # fingerprint, not one over the real upstream summaries it never saw, so
+    # regenerate_changed still re-checks it.
+    def __init__(self, bookgen, token_budget: Optional[int] = None, max_workers: int = 2):
+        self.bookgen = bookgen
+        # estimated prompt + completion tokens for all drafts of this instance,
+        # reserved before each draft starts at the average cost so far
+        self.token_budget = token_budget
+        self.max_workers = max_workers
+        self.spent = 0
+        self.reserved = 0
+        self.scheduled = 0
+        self.drafted = 0
+        self.skipped = 0
+        self.hits = 0
+        self.misses = 0
+        self.hidden_seconds = 0.0
+        self.waited_seconds = 0.0
+        self._pool = None
+        self._lock = threading.Lock()
+        self._cost_known = threading.Condition(self._lock)
+        self._running = 0
+        # (book_id, heading_title) -> (input_fingerprint, future) until generation asks for it
+        self._pending = {}
+        # (book_id, heading_title) -> (content, summary, input_fingerprint) of promoted drafts
+        self._promoted = {}
+        self._costs = []
+
+    def _description_context(self, headings, heading_title):
+        context = {}
+        for heading in headings:
+            if heading["heading_title"] == heading_title:
+                break
+            context[heading["heading_title"]] = heading["description"]
+        return context
+
+    def schedule(self, book_title: str) -> int:
+        conn = self.bookgen.conn
+        book = get_book(conn, book_title)
+        if not book:
+            raise ValueError(f"No book found with title {book_title}")
+        headings = get_headings_by_book(conn, book["id"])
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="bookgen-speculate")
+            for heading in headings:
+                context = self._description_context(headings, heading["heading_title"])
+                input_fingerprint = self.bookgen.heading_fingerprint(book, heading, context)
+                future = self._pool.submit(self._draft, book, heading, context, input_fingerprint)
+                self._pending[(book["id"], heading["heading_title"])] = (input_fingerprint, future)
+            self.scheduled += len(headings)
+        logger.info(f"Speculatively drafting {len(headings)} chapter(s) of '{book_title}'")
+        return len(headings)
+
+    def _draft(self, book, heading, context, input_fingerprint):
+        with self._lock:
+            # under a budget the first draft runs alone, so there is a cost to go by
+            while self.token_budget is not None and not self._costs and self._running:
+                self._cost_known.wait()
+            expected = sum(self._costs) // len(self._costs) if self._costs else 0
+            if self.token_budget is not None and self.spent + self.reserved + expected > self.token_budget:
+                self.skipped += 1
+                return None
+            self.reserved += expected
+            self._running += 1
+        cost = 0
+        try:
+            start = time.monotonic()
+            content = self.bookgen._generate_content(book, heading, context)
+            summary = self.bookgen._generate_summary(book, heading, content)
+            seconds = time.monotonic() - start
+            # the content goes out twice: as the draft and inside the summary prompt
+            cost = (self.bookgen.prompt_token_usage.get(heading["heading_title"], 0)
+                    + 2 * estimate_tokens(content) + estimate_tokens(summary))
+            add_draft(self.bookgen.conn, heading["id"], input_fingerprint, content, summary,
+                      getattr(content, "sections", None), cost, seconds)
+            with self._lock:
+                self.drafted += 1
+            return True
+        except Exception as e:
+            # the book may have been overwritten meanwhile; speculation never fails generation
+            logger.warning(f"Speculative draft of '{heading['heading_title']}' failed: {e}")
+            return None
+        finally:
+            with self._lock:
+                self._running -= 1
+                self.reserved -= expected
+                self.spent += cost
+                if cost:
+                    self._costs.append(cost)
+                self._cost_known.notify_all()
+
+    def take(self, book, heading, heading_notes=None):
+        # the promoted draft's content, or None when there is nothing usable
+        key = (book["id"], heading["heading_title"])
+        with self._lock:
+            entry = self._pending.pop(key, None)
+        if entry is None:
+            return None
+        conn = self.bookgen.conn
+        context = self._description_context(get_headings_by_book(conn, book["id"]), heading["heading_title"])
+        input_fingerprint = self.bookgen.heading_fingerprint(book, heading, context, heading_notes)
+        waited = 0.0
+        if entry[0] == input_fingerprint:
+            # still being drafted: finishing it is faster than starting over
+            start = time.monotonic()
+            entry[1].result()
+            waited = time.monotonic() - start
+        else:
+            entry[1].cancel()
+        discarded = discard_drafts(conn, heading["id"], keep_fingerprint=input_fingerprint)
+        if discarded:
+            logger.info(f"Discarded {discarded} speculative draft(s) of '{heading['heading_title']}', its inputs changed")
+        draft = get_draft(conn, heading["id"], input_fingerprint)
+        with self._lock:
+            self.waited_seconds += waited
+            if draft is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.hidden_seconds += max(0.0, (draft["seconds"] or 0.0) - waited)
+        set_draft_status(conn, draft["id"], "promoted")
+        logger.info(f"Promoted speculative draft of '{heading['heading_title']}'")
+        content = stitch_sections(draft["sections"]) if draft["sections"] else draft["content"]
+        with self._lock:
+            self._promoted[key] = (content, draft["summary"], input_fingerprint)
+        return content
+
+    def take_summary(self, book, heading, content) -> Optional[str]:
+        # the promoted draft's summary, as long as its content is what gets summarized
+        with self._lock:
+            entry = self._promoted.get((book["id"], heading["heading_title"]))
+        if entry and entry[0] == content and entry[1]:
+            return entry[1]
+        return None
+
+    def promoted_fingerprint(self, book, heading, content) -> Optional[str]:
+        # the draft's own input fingerprint when `content` is a promoted draft being saved
+        with self._lock:
+            entry = self._promoted.pop((book["id"], heading["heading_title"]), None)
+        if entry and entry[0] == content:
+            return entry[2]
+        return None
+
+    def cancel(self, book_title: str):
+        # the outline is being replaced; its stored drafts go with the headings
+        book = get_book(self.bookgen.conn, book_title)
+        if not book:
+            return
+        with self._lock:
+            for key in [key for key in self._pending if key[0] == book["id"]]:
+                self._pending.pop(key)[1].cancel()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            decided = self.hits + self.misses
+            stats = {
+                "scheduled": self.scheduled,
+                "drafted": self.drafted,
+                "skipped_over_budget": self.skipped,
+                "in_flight": sum(1 for _, future in self._pending.values() if not future.done()),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / decided, 3) if decided else None,
+                "tokens_spent": self.spent,
+                "token_budget": self.token_budget,
+                "latency_hidden_s": round(self.hidden_seconds, 2),
+                "waited_s": round(self.waited_seconds, 2),
+            }
+        drafts = get_draft_stats(self.bookgen.conn)
+        stats["discarded"] = drafts["discarded"]["drafts"]
+        stats["tokens_wasted"] = drafts["discarded"]["tokens"]
+        return stats
+
+    def close(self, wait: bool = True):
+        with self._lock:
+            for _, future in self._pending.values():
+                future.cancel()
+            self._pending.clear()
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=wait)
@@ -0,0 +1,194 @@
+import os, json, queue, threading, time, weakref, logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterable, List, Optional
+from .db_utils import add_llm_calls, get_llm_calls
+
+logger = logging.getLogger("BookGen")
+
+# =========================
+# Call Context
+# =========================
+# stage / book / heading of the LLM calls made inside a `telemetry_context`
+# block; a ContextVar so worker threads and async tasks each see their own
+_call_context: ContextVar[Dict] = ContextVar("bookgen_call_context", default={})
+
+@contextmanager
+def telemetry_context(**fields):
+    token = _call_context.set({**_call_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _call_context.reset(token)
+
+def current_context() -> Dict:
+    return _call_context.get()
+
+# =========================
+# Sinks
+# =========================
+class JSONLTelemetrySink:
+    # one JSON object per LLM call, appended to a file
+    def __init__(self, path: str):
+        self.path = path
+
+    def write(self, records: List[Dict]):
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.writelines(json.dumps(record) + "\n" for record in records)
+
+    def rows(self, book_title: str) -> List[Dict]:
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                records = [json.loads(line) for line in f if line.strip()]
+        except FileNotFoundError:
+            return []
+        return [record for record in records if record.get("book_title") == book_title]
+
+class SQLiteTelemetrySink:
+    # llm_calls table in the BookGen database, written on the recorder's own connection
+    def __init__(self, db):
+        self.db = db
+
+    def write(self, records: List[Dict]):
+        add_llm_calls(self.db.connection(), records)
+
+    def rows(self, book_title: str) -> List[Dict]:
+        return get_llm_calls(self.db.connection(), book_title)
+
+# =========================
+# Recorder
+# =========================
+def _drain(records: queue.Queue, sink, batch_size: int):
+    # the writer thread; holds no reference to its recorder, so dropping the
+    # recorder is enough for the finalizer to stop it
+    while True:
+        batch = [records.get()]
+        while len(batch) < batch_size:
+            try:
+                batch.append(records.get_nowait())
+            except queue.Empty:
+                break
+        written = [record for record in batch if record is not None]
+        try:
+            if written:
+                sink.write(written)
+        except Exception as e:
+            logger.warning(f"Dropped {len(written)} telemetry record(s): {e}")
+        finally:
+            for _ in batch:
+                records.task_done()
+        if len(written) < len(batch):
+            return
+
+def _stop_writer(records: queue.Queue, writer: threading.Thread):
+    # records still queued are written first, also at interpreter exit
+    if writer.is_alive():
+        records.put(None)
+        if writer is not threading.current_thread():
+            writer.join()
+
+class TelemetryRecorder:
+    # record() only enqueues; a background thread batches records into the
+    # sink so the generation hot path never waits on disk. background=False
+    # keeps records until flush(), which writes them on the calling thread.
+    def __init__(self, sink, batch_size: int = 100, background: bool = True):
+        self.sink = sink
+        self.batch_size = batch_size
+        self._queue = queue.Queue()
+        self._pending: List[Dict] = []
+        self._lock = threading.Lock()
+        self._writer = None
+        if background:
+            self._writer = threading.Thread(target=_drain, args=(self._queue, sink, batch_size), name="bookgen-telemetry", daemon=True)
+            self._writer.start()
+            # runs on close(), when the recorder is collected, or at exit
+            self._finalizer = weakref.finalize(self, _stop_writer, self._queue, self._writer)
+
+    def record(self, **fields):
+        record = {"ts": time.time(), **current_context(), **fields}
+        if self._writer is None:
+            with self._lock:
+                self._pending.append(record)
+        else:
+            self._queue.put(record)
+
+    def flush(self):
+        if self._writer is None:
+            with self._lock:
+                records, self._pending = self._pending, []
+            if records:
+                self.sink.write(records)
+        else:
+            self._queue.join()
+
+    def close(self):
+        if self._writer is None:
+            self.flush()
+        else:
+            self._finalizer()
+
+    def rows(self, book_title: str) -> List[Dict]:
+        self.flush()
+        return self.sink.rows(book_title)
+
+_recorders = weakref.WeakValueDictionary()
+_recorders_lock = threading.Lock()
+
+def get_telemetry_recorder(target: str, db=None) -> TelemetryRecorder:
+    # target: "db" (llm_calls table of `db`, a ConnectionManager) or a .jsonl path.
+    # One recorder and writer thread per database file or JSONL file, shared by
+    # every BookGen using it. An in-memory database is private to the thread that
+    # opened it, so its records are written on flush by the thread reading them.
+    if target == "db" and db.db_path == ":memory:":
+        return TelemetryRecorder(SQLiteTelemetrySink(db), background=False)
+    key = ("db", os.path.abspath(db.db_path)) if target == "db" else ("jsonl", os.path.abspath(target))
+    with _recorders_lock:
+        recorder = _recorders.get(key)
+        if recorder is None:
+            sink = SQLiteTelemetrySink(db) if target == "db" else JSONLTelemetrySink(target)
+            recorder = _recorders[key] = TelemetryRecorder(sink)
+        return recorder
+
+# =========================
+# Reports
+# =========================
+def percentile(values: List[float], p: float) -> Optional[float]:
+    values = sorted(v for v in values if v is not None)
+    return values[min(len(values) - 1, int(p * len(values)))] if values else None
+
+def summarize_calls(rows: Iterable[Dict]) -> Dict:
+    # per stage latency percentiles, tokens, cost and retries; tokens per chapter
+    stages, chapters = {}, {}
+    totals = {"calls": 0, "cached": 0, "failures": 0, "latency_s": 0.0, "prompt_tokens": 0, "completion_tokens": 0, "cost": 0.0}
+    for row in rows:
+        stage = stages.setdefault(row.get("stage") or "other", {"rows": []})
+        stage["rows"].append(row)
+        if row.get("heading"):
+            chapter = chapters.setdefault(row["heading"], {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "latency_s": 0.0})
+            chapter["calls"] += 1
+            chapter["prompt_tokens"] += row.get("prompt_tokens") or 0
+            chapter["completion_tokens"] += row.get("completion_tokens") or 0
+            chapter["latency_s"] += row.get("latency") or 0.0
+        totals["calls"] += 1
+        totals["cached"] += 1 if row.get("cached") else 0
+        totals["failures"] += 0 if row.get("ok", True) else 1
+        totals["latency_s"] += row.get("latency") or 0.0
+        totals["prompt_tokens"] += row.get("prompt_tokens") or 0
+        totals["completion_tokens"] += row.get("completion_tokens") or 0
+        totals["cost"] += row.get("cost") or 0.0
+    for name, stage in stages.items():
+        rows = stage.pop("rows")
+        live = [row for row in rows if not row.get("cached")]
+        stages[name] = {
+            "calls": len(rows),
+            "cached": len(rows) - len(live),
+            "failures": sum(1 for row in rows if not row.get("ok", True)),
+            "retries": sum(row.get("retries") or 0 for row in rows),
+            "latency_p50": percentile([row.get("latency") for row in live], 0.50),
+            "latency_p95": percentile([row.get("latency") for row in live], 0.95),
+            "ttfb_p50": percentile([row.get("ttfb") for row in live], 0.50),
+            "prompt_tokens": sum(row.get("prompt_tokens") or 0 for row in rows),
+            "completion_tokens": sum(row.get("completion_tokens") or 0 for row in rows),
+            "cost": sum(row.get("cost") or 0.0 for row in rows),
+        }
+    return {"totals": totals, "stages": stages, "chapters": chapters}
@@ -95,6 +95,31 @@ Start writing immediately with the content itself.
 Output ONLY the final prose for this section.
 """
 
+SECTION_PROMPT = """
+Write one section of a book chapter now.
+
+Book Title:
+__BOOK_TITLE__
+
+Current Heading Topic:
+__HEADING_TITLE__
+
+Section to write (this section only):
+__SECTION_TITLE__
+
+Other sections of this chapter, written separately (do not cover them):
+__OTHER_SECTIONS__
+
+Context from previous sections (do not repeat, do not reference explicitly):
+__PREVIOUS_HEADINGS_SUMMARY_DICT__
+
+Editorial guidance (must be followed exactly if present):
+__HEADING_NOTES__
+
+Start writing immediately with the content itself.
+Output ONLY the final prose for this section.
+"""
+
 SUMMARIZE_SYS_PROMPT = """
 You generate summaries only.
 
@@ -130,3 +155,10 @@ __INPUT_TEXT__
 Start immediately with the summary.
 Output ONLY the summary text.
 """
+
+DEDUP_NOTE = """
+This section overlaps heavily with material already written in: __OTHER_HEADINGS__.
+What those sections already cover:
+__OTHER_SUMMARIES__
+Do not explain those points again. Refer back to them in at most a sentence and spend this section on what is new to it.
+"""
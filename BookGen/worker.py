@@ -0,0 +1,200 @@
+import os, socket, signal, threading, uuid, argparse, logging, multiprocessing
+from typing import Dict, Optional
+from .main import BookGen
+from .db_utils import *
+
+logger = logging.getLogger("BookGen")
+
+class LeaseLostError(RuntimeError):
+    pass
+
+# =========================
+# Job Worker
+# =========================
+class JobWorker:
+    # Claims tasks from the job queue in the BookGen database and runs them.
+    # Each task's writes commit together with its completion, so a crash at
+    # any point re-runs at most the one task that was in flight. Run several
+    # processes against the same database to scale out.
+    def __init__(self, bookgen: BookGen, worker_id: Optional[str] = None, lease_seconds: float = 300.0,
+                 poll_interval: float = 2.0, retry_backoff: float = 30.0):
+        self.bookgen = bookgen
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.retry_backoff = retry_backoff
+        self._stop = threading.Event()
+        # one heartbeat thread (and so one connection) for the worker's lifetime,
+        # renewing the lease of whichever task is running
+        self._leased_task: Optional[Dict] = None
+        self._heartbeat_lock = threading.Lock()
+        self._heartbeat_stop = threading.Event()
+        self._heartbeat_thread: Optional[threading.Thread] = None
+
+    def stop(self):
+        # finish the current task, then exit
+        self._stop.set()
+
+    def run(self, max_tasks: Optional[int] = None, until_idle: bool = False) -> int:
+        conn = self.bookgen.conn
+        completed = 0
+        logger.info(f"Worker {self.worker_id} started")
+        try:
+            while not self._stop.is_set():
+                task = claim_task(conn, self.worker_id, self.lease_seconds)
+                if task is None:
+                    if until_idle and not count_open_tasks(conn):
+                        break
+                    self._stop.wait(self.poll_interval)
+                    continue
+                if self.run_task(task):
+                    completed += 1
+                if max_tasks and completed >= max_tasks:
+                    break
+        finally:
+            self._stop_heartbeat()
+        logger.info(f"Worker {self.worker_id} stopped after {completed} task(s)")
+        return completed
+
+    def run_task(self, task: Dict) -> bool:
+        conn = self.bookgen.conn
+        job = get_job(conn, task["job_id"])
+        label = f"job {job['id']} '{job['book_title']}' {task['kind']}" + (f" '{task['heading_title']}'" if task["heading_title"] else "")
+        logger.info(f"Running {label} (attempt {task['attempts']}/{task['max_attempts']})")
+        self._start_heartbeat()
+        with self._heartbeat_lock:
+            self._leased_task = task
+        try:
+            getattr(self, f"_run_{task['kind']}")(job, task)
+            return True
+        except LeaseLostError:
+            logger.warning(f"Lease lost on {label}, another worker owns it now")
+        except Exception as e:
+            logger.error(f"Failed {label}: {e}")
+            fail_task(conn, task, self.worker_id, f"{type(e).__name__}: {e}", self.retry_backoff)
+        finally:
+            with self._heartbeat_lock:
+                self._leased_task = None
+        return False
+
+    def _start_heartbeat(self):
+        if self._heartbeat_thread is None or not self._heartbeat_thread.is_alive():
+            self._heartbeat_stop.clear()
+            self._heartbeat_thread = threading.Thread(target=self._heartbeat, daemon=True)
+            self._heartbeat_thread.start()
+
+    def _stop_heartbeat(self):
+        if self._heartbeat_thread is not None:
+            self._heartbeat_stop.set()
+            self._heartbeat_thread.join()
+            self._heartbeat_thread = None
+
+    def _heartbeat(self):
+        # keeps the lease alive through long LLM calls, on its own connection
+        while not self._heartbeat_stop.wait(self.lease_seconds / 3):
+            with self._heartbeat_lock:
+                task = self._leased_task
+                # renewing under the lock, so a finished task is never renewed after run_task clears it
+                if task and not renew_lease(self.bookgen.conn, task["id"], self.worker_id, self.lease_seconds):
+                    self._leased_task = None
+
+    def _complete(self, task: Dict):
+        if not complete_task(self.bookgen.conn, task, self.worker_id):
+            raise LeaseLostError(f"Task {task['id']} is no longer leased to {self.worker_id}")
+
+    # -------------------------
+    # Task Kinds
+    # -------------------------
+    def _run_outline(self, job: Dict, task: Dict):
+        gen = self.bookgen
+        outline = gen.generate_outline(job["book_title"], job["notes"])
+        with transaction(gen.conn):
+            book_id = gen.save_book_and_outline(job["book_title"], job["notes"], outline)
+            tasks = []
+            for heading in get_headings_by_book(gen.conn, book_id):
+                tasks.append({"seq": len(tasks) + 1, "kind": "content", "heading_title": heading["heading_title"]})
+                tasks.append({"seq": len(tasks) + 1, "kind": "summary", "heading_title": heading["heading_title"]})
+            if job["output_stem"]:
+                tasks.append({"seq": len(tasks) + 1, "kind": "export"})
+            add_job_tasks(gen.conn, job["id"], tasks, task["max_attempts"])
+            self._complete(task)
+
+    def _heading(self, job: Dict, task: Dict):
+        # the heading plus the summaries of every heading before it
+        conn = self.bookgen.conn
+        book = get_book(conn, job["book_title"])
+        if not book:
+            raise ValueError(f"No book found with title {job['book_title']}")
+        context = {}
+        for heading in get_headings_by_book(conn, book["id"]):
+            if heading["heading_title"] == task["heading_title"]:
+                return book, heading, context
+            context[heading["heading_title"]] = heading["summary"]
+        raise ValueError(f"No heading {task['heading_title']!r} in book {job['book_title']}")
+
+    def _run_content(self, job: Dict, task: Dict):
+        gen = self.bookgen
+        book, heading, context = self._heading(job, task)
+        content = gen.generate_content(book, heading, context, job["heading_notes"])
+        with transaction(gen.conn):
+            update_heading(gen.conn, book["id"], heading["heading_title"], content=content)
+            save_sections(gen.conn, heading["id"], getattr(content, "sections", None))
+            self._complete(task)
+
+    def _run_summary(self, job: Dict, task: Dict):
+        gen = self.bookgen
+        book, heading, context = self._heading(job, task)
+        summary = gen.generate_summary(book, heading, heading["content"], job["heading_notes"])
+        input_fingerprint = gen.heading_fingerprint(book, heading, context, job["heading_notes"])
+        with transaction(gen.conn):
+            gen.save_heading_content(book, heading, heading["content"], summary, input_fingerprint)
+            self._complete(task)
+
+    def _run_export(self, job: Dict, task: Dict):
+        self.bookgen.export_book(job["book_title"], job["output_stem"], job["export_formats"])
+        self._complete(task)
+
+# =========================
+# Entry Point
+# =========================
+def run_worker(db_path: str, model: Optional[str] = None, lease_seconds: float = 300.0, poll_interval: float = 2.0,
+               until_idle: bool = False, max_tasks: Optional[int] = None, granularity: str = "chapter") -> int:
+    options = {"model": model} if model else {}
+    # WAL so several worker processes can share the database
+    worker = JobWorker(BookGen(db_path=db_path, db_wal=True, db_synchronous="NORMAL", granularity=granularity, **options),
+                       lease_seconds=lease_seconds, poll_interval=poll_interval)
+    signal.signal(signal.SIGTERM, lambda signum, frame: worker.stop())
+    try:
+        return worker.run(max_tasks=max_tasks, until_idle=until_idle)
+    except KeyboardInterrupt:
+        worker.stop()
+        return 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m BookGen.worker", description="Run BookGen job queue workers.")
+    parser.add_argument("--db", default="bookgen.db", help="BookGen SQLite database holding the queue")
+    parser.add_argument("--processes", type=int, default=1, help="worker processes to start")
+    parser.add_argument("--model", default=None)
+    parser.add_argument("--lease", type=float, default=300.0, help="task lease in seconds, renewed while running")
+    parser.add_argument("--poll", type=float, default=2.0, help="seconds between polls of an empty queue")
+    parser.add_argument("--until-idle", action="store_true", help="exit once no pending or running tasks remain")
+    parser.add_argument("--granularity", choices=("chapter", "section"), default="chapter",
+                        help="write chapters in one call or one call per outline section")
+    args = parser.parse_args(argv)
+    worker_args = (args.db, args.model, args.lease, args.poll, args.until_idle, None, args.granularity)
+    if args.processes <= 1:
+        run_worker(*worker_args)
+        return
+    processes = [multiprocessing.Process(target=run_worker, args=worker_args) for _ in range(args.processes)]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.terminate()
+            process.join()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+# Re-running generation with identical inputs should be served from the cache.
+#   python benchmarks/bench_cache.py
+import json, time
+
+from common import WORKDIR, make_outline
+from BookGen import BookGen
+from mock_openrouter import MockOpenRouter
+
+CHAPTERS = 10
+LATENCY = 0.05
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    fn(*args, **kwargs)
+    return round(time.perf_counter() - start, 4)
+
+if __name__ == "__main__":
+    with MockOpenRouter(latency=LATENCY) as mock:
+        gen = BookGen(api_url=mock.url, cache_path=f"{WORKDIR}/cache.db")
+        title = "Cached Book"
+        gen.save_book_and_outline(title, "notes", make_outline(title, CHAPTERS))
+        cold = timed(gen.generate_heading_content, title)
+        requests_cold = mock.requests
+        warm = timed(gen.generate_heading_content, title)
+        requests_warm = mock.requests - requests_cold
+        forced = timed(gen.generate_heading_content, title, force_regenerate=True)
+        print(json.dumps({
+            "chapters": CHAPTERS,
+            "cold_s": cold,
+            "warm_s": warm,
+            "forced_s": forced,
+            "requests_cold": requests_cold,
+            "requests_warm": requests_warm,
+            "requests_forced": mock.requests - requests_cold - requests_warm,
+            **gen.cache.stats(),
+        }))
+        assert requests_warm == 0, "identical re-run hit the backend"
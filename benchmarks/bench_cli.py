@@ -0,0 +1,62 @@
+# Library-wide jobs: a BookGen loop over every book vs `python -m BookGen`
+# fanning the books out over a process pool.
+#   python benchmarks/bench_cli.py [books]
+import json, os, random, subprocess, sys, time
+
+from common import WORKDIR
+from BookGen import BookGen
+from BookGen.db_utils import get_db_connection, iter_books
+
+BOOKS = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+CHAPTERS = 10
+CHAPTER_WORDS = 600
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def build_library(path):
+    rng = random.Random(3)
+    words = [f"word{i}" for i in range(5000)]
+    conn = get_db_connection(path)
+    with conn:
+        conn.executemany("INSERT INTO books (title, before_notes, created_at, updated_at) VALUES (?, 'notes', '', '')",
+                         [(f"Book {n}",) for n in range(BOOKS)])
+        # straight into headings: no per-chapter revision or section bookkeeping needed here
+        conn.executemany("""
+        INSERT INTO headings (book_id, heading_number, heading_title, sub_heading, description, summary, content, created_at, updated_at)
+        VALUES (?, ?, ?, 'One\nTwo', 'About it', 'Summary.', ?, '', '')
+        """, [(book["id"], c, f"Chapter {c}",
+               "\n\n".join(" ".join(rng.choices(words, k=CHAPTER_WORDS // 6)) for _ in range(6)))
+              for book in list(iter_books(conn)) for c in range(1, CHAPTERS + 1)])
+    conn.close()
+
+def loop(gen, command, out_dir):
+    for book in iter_books(gen.conn):
+        if command == "outline":
+            gen.get_book_and_outline(book["title"])
+        elif command == "export":
+            gen.book_gen(book["title"], os.path.join(out_dir, f"{book['id']}.docx"))
+        else:
+            outline = json.loads(gen.get_book_and_outline(book["title"]))["outline"]
+            sum(len((chapter["content"] or "").split()) for chapter in outline)
+
+def cli(command, processes, out_dir):
+    args = [sys.executable, "-m", "BookGen", "--db", "library.db", "--processes", str(processes),
+            "--output", f"{command}.jsonl", "--progress-every", "0", command]
+    if command == "export":
+        args += ["--out-dir", out_dir, "--formats", "docx"]
+    subprocess.run(args, check=True, cwd=WORKDIR, env={**os.environ, "PYTHONPATH": REPO}, stderr=subprocess.DEVNULL)
+
+if __name__ == "__main__":
+    build_library("library.db")
+    gen = BookGen(db_path="library.db", db_read_only=True)
+    # on a single CPU the pool only shows its overhead
+    processes = max(os.cpu_count() or 1, 2)
+    for command in ("stats", "outline", "export"):
+        row = {"command": command, "books": BOOKS, "cpus": os.cpu_count()}
+        for name, run in [("bookgen_loop_s", lambda: loop(gen, command, "loop_out")),
+                          ("cli_1_process_s", lambda: cli(command, 1, "cli_out")),
+                          (f"cli_{processes}_processes_s", lambda: cli(command, processes, "cli_out"))]:
+            os.makedirs("loop_out", exist_ok=True)
+            start = time.perf_counter()
+            run()
+            row[name] = round(time.perf_counter() - start, 2)
+        print(json.dumps(row))
@@ -0,0 +1,29 @@
+# Wall-clock comparison of the generation modes against the mock server.
+#   python benchmarks/bench_concurrency.py
+import json, time
+
+from common import make_outline
+from BookGen import BookGen
+from mock_openrouter import MockOpenRouter
+
+CHAPTER_COUNTS = (4, 8, 16)
+LATENCY = 0.1
+
+def run(url, mode, chapters):
+    gen = BookGen(api_url=url, generation_mode=mode, max_workers=8)
+    title = f"Bench {mode} {chapters}"
+    gen.save_book_and_outline(title, "notes", make_outline(title, chapters))
+    start = time.perf_counter()
+    gen.generate_heading_content(title)
+    return time.perf_counter() - start
+
+if __name__ == "__main__":
+    with MockOpenRouter(latency=LATENCY) as mock:
+        for chapters in CHAPTER_COUNTS:
+            timings = {mode: run(mock.url, mode, chapters) for mode in ("sequential", "pipelined", "parallel")}
+            print(json.dumps({
+                "chapters": chapters,
+                "latency": LATENCY,
+                **{f"{mode}_s": round(t, 3) for mode, t in timings.items()},
+                **{f"{mode}_speedup": round(timings["sequential"] / t, 2) for mode, t in timings.items() if mode != "sequential"},
+            }))
@@ -0,0 +1,50 @@
+# Content prompt tokens per chapter: full previous-summary dict vs the budgeted context,
+# and the CPU cost of building that context for every prompt of a long book.
+#   python benchmarks/bench_context_budget.py
+import json, time
+
+from common import make_outline
+from BookGen import BookGen
+from BookGen.prompt_utils import RollingSummaryContext, build_summary_context
+from mock_openrouter import MockOpenRouter
+
+CHAPTERS = 100
+BUDGETS = (None, 2000)
+
+def run(url, budget):
+    gen = BookGen(api_url=url, context_token_budget=budget)
+    title = f"Context Book {budget}"
+    gen.save_book_and_outline(title, "notes", make_outline(title, CHAPTERS))
+    gen.generate_heading_content(title)
+    usage = list(gen.prompt_token_usage.values())
+    return {
+        "context_token_budget": budget,
+        "chapters": CHAPTERS,
+        "prompt_tokens_ch1": usage[0],
+        "prompt_tokens_ch10": usage[9],
+        "prompt_tokens_ch50": usage[49],
+        "prompt_tokens_ch100": usage[99],
+        "total_prompt_tokens": sum(usage),
+    }
+
+def context_cpu(chapters, budget=4000):
+    # ~150-word summaries; every chapter's prompt compresses all the summaries before it
+    summary = " ".join(["the hero crosses the river and loses the map"] * 15)
+    previous_summary, rolling = {}, RollingSummaryContext()
+    row = {"chapters": chapters, "context_token_budget": budget}
+    for name, build in (("per_prompt_s", lambda: build_summary_context(previous_summary, budget)),
+                        ("rolling_s", lambda: rolling.render(previous_summary, budget))):
+        previous_summary.clear()
+        start = time.process_time()
+        for n in range(1, chapters + 1):
+            build()
+            previous_summary[f"Chapter {n}"] = summary
+        row[name] = round(time.process_time() - start, 2)
+    return row
+
+if __name__ == "__main__":
+    for chapters in (100, 500, 1000):
+        print(json.dumps(context_cpu(chapters)))
+    with MockOpenRouter(response_words=120) as mock:
+        for budget in BUDGETS:
+            print(json.dumps(run(mock.url, budget)))
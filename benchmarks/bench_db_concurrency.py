@@ -0,0 +1,71 @@
+# Stress test: N concurrent writers (threads and processes) on one bookgen.db.
+#   python benchmarks/bench_db_concurrency.py
+import json, os, sqlite3, threading, time
+from multiprocessing import Pool
+
+from common import WORKDIR
+from BookGen.db_utils import ConnectionManager, transaction, add_book, add_headings_bulk, update_heading, get_book, get_headings_by_book
+
+DB_PATH = os.path.join(WORKDIR, "concurrency.db")
+WRITERS = 8
+BOOKS_PER_WRITER = 25
+HEADINGS = 10
+
+def write_books(manager, worker):
+    locked = 0
+    for i in range(BOOKS_PER_WRITER):
+        try:
+            conn = manager.connection()
+            with transaction(conn):
+                book_id = add_book(conn, f"w{worker}-b{i}", "notes")
+                add_headings_bulk(conn, book_id, [{"heading_number": n, "heading_title": f"Chapter {n}"} for n in range(1, HEADINGS + 1)])
+            for n in range(1, HEADINGS + 1):
+                update_heading(conn, book_id, f"Chapter {n}", summary="summary", content="content " * 50)
+        except sqlite3.OperationalError as e:
+            if "locked" not in str(e):
+                raise
+            locked += 1
+    return locked
+
+def read_books(manager, stop, counts):
+    while not stop.is_set():
+        with manager.snapshot() as conn:
+            for row in conn.execute("SELECT title FROM books ORDER BY id DESC LIMIT 5").fetchall():
+                book = get_book(conn, row["title"])
+                get_headings_by_book(conn, book["id"])
+        counts.append(1)
+
+def process_writer(worker):
+    return write_books(ConnectionManager(DB_PATH), worker)
+
+def run_threads():
+    manager = ConnectionManager(DB_PATH)
+    manager.connection()
+    stop, reads, results = threading.Event(), [], []
+    readers = [threading.Thread(target=read_books, args=(manager, stop, reads)) for _ in range(2)]
+    writers = [threading.Thread(target=lambda w=w: results.append(write_books(manager, w))) for w in range(WRITERS)]
+    start = time.perf_counter()
+    for t in readers + writers:
+        t.start()
+    for t in writers:
+        t.join()
+    stop.set()
+    for t in readers:
+        t.join()
+    return {"mode": "threads", "writers": WRITERS, "locked_errors": sum(results), "snapshot_reads": len(reads),
+            "elapsed_s": round(time.perf_counter() - start, 3)}
+
+def run_processes():
+    start = time.perf_counter()
+    with Pool(WRITERS) as pool:
+        locked = pool.map(process_writer, range(WRITERS, 2 * WRITERS))
+    return {"mode": "processes", "writers": WRITERS, "locked_errors": sum(locked), "elapsed_s": round(time.perf_counter() - start, 3)}
+
+if __name__ == "__main__":
+    print(json.dumps(run_threads()))
+    print(json.dumps(run_processes()))
+    conn = ConnectionManager(DB_PATH).connection()
+    books = conn.execute("SELECT COUNT(*) FROM books").fetchone()[0]
+    expected = 2 * WRITERS * BOOKS_PER_WRITER
+    print(json.dumps({"books": books, "expected": expected}))
+    assert books == expected, "some writes were lost"
@@ -0,0 +1,47 @@
+# Heading lookup/update cost as the number of books in the store grows.
+#   python benchmarks/bench_db_scaling.py
+import json, os, random, time
+from datetime import datetime
+
+from common import WORKDIR
+from BookGen.db_utils import get_db_connection, get_book, get_headings_by_book, update_heading
+
+BOOK_COUNTS = (100, 1000, 10000)
+HEADINGS_PER_BOOK = 10
+SAMPLES = 500
+
+def populate(conn, start, stop):
+    now = datetime.utcnow().isoformat()
+    conn.executemany(
+        "INSERT INTO books (id, title, before_notes, created_at, updated_at) VALUES (?, ?, 'notes', ?, ?)",
+        [(i, f"Book {i}", now, now) for i in range(start, stop)]
+    )
+    conn.executemany("""
+        INSERT INTO headings (book_id, heading_number, heading_title, sub_heading, description, content, created_at, updated_at)
+        VALUES (?, ?, ?, 'a\nb', 'description', 'content', ?, ?)
+        """,
+        [(i, n, f"Chapter {n}", now, now) for i in range(start, stop) for n in range(1, HEADINGS_PER_BOOK + 1)]
+    )
+    conn.commit()
+
+def per_op_us(fn, samples):
+    start = time.perf_counter()
+    for args in samples:
+        fn(*args)
+    return round((time.perf_counter() - start) / len(samples) * 1e6, 1)
+
+if __name__ == "__main__":
+    conn = get_db_connection(os.path.join(WORKDIR, "scaling.db"))
+    populated = 1
+    for books in BOOK_COUNTS:
+        populate(conn, populated, books + 1)
+        populated = books + 1
+        ids = [random.randint(1, books) for _ in range(SAMPLES)]
+        print(json.dumps({
+            "books": books,
+            "headings": books * HEADINGS_PER_BOOK,
+            "schema_objects": conn.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()[0],
+            "get_book_us": per_op_us(lambda i: get_book(conn, f"Book {i}"), [(i,) for i in ids]),
+            "get_headings_us": per_op_us(lambda i: get_headings_by_book(conn, i), [(i,) for i in ids]),
+            "update_heading_us": per_op_us(lambda i: update_heading(conn, i, "Chapter 5", summary="s"), [(i,) for i in ids]),
+        }))
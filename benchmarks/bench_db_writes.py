@@ -0,0 +1,40 @@
+# Outline save throughput: per-heading commits vs one bulk transaction.
+#   python benchmarks/bench_db_writes.py
+import json, os, time
+
+from common import WORKDIR
+from BookGen.db_utils import get_db_connection, add_book, add_heading, add_headings_bulk, transaction
+
+OUTLINE_SIZES = (1, 100, 1000)
+CONFIGS = {
+    "default": {},
+    "wal_normal": {"wal": True, "synchronous": "NORMAL"},
+}
+
+def outline(chapters):
+    return [{"heading_number": n, "heading_title": f"Chapter {n}", "sub_heading": "a\nb", "description": "d"}
+            for n in range(1, chapters + 1)]
+
+def save_per_heading(conn, title, headings):
+    book_id = add_book(conn, title, "notes")
+    for heading in headings:
+        add_heading(conn, book_id, **heading)
+
+def save_bulk(conn, title, headings):
+    with transaction(conn):
+        book_id = add_book(conn, title, "notes")
+        add_headings_bulk(conn, book_id, headings)
+
+if __name__ == "__main__":
+    for name, options in CONFIGS.items():
+        conn = get_db_connection(os.path.join(WORKDIR, f"writes_{name}.db"), **options)
+        for chapters in OUTLINE_SIZES:
+            headings = outline(chapters)
+            result = {"config": name, "chapters": chapters}
+            for label, save in (("per_heading", save_per_heading), ("bulk", save_bulk)):
+                start = time.perf_counter()
+                save(conn, f"{label} {chapters}", headings)
+                elapsed = time.perf_counter() - start
+                result[f"{label}_ms"] = round(elapsed * 1000, 2)
+                result[f"{label}_rows_per_s"] = round(chapters / elapsed)
+            print(json.dumps(result))
@@ -0,0 +1,36 @@
+# Multi-format export of a 500-chapter book: inline vs process pool, then an
+# incremental re-export after editing one chapter.
+#   python benchmarks/bench_export_formats.py
+import json, os, time
+
+from common import WORKDIR
+
+CHAPTERS = 500
+PARAGRAPH = ("The quick brown fox jumps over the lazy dog while the committee deliberates. " * 8).strip()
+CONTENT = "\n\n".join([PARAGRAPH] * 60)
+
+def populate(gen):
+    from BookGen.db_utils import transaction, add_book, add_headings_bulk
+    conn = gen.conn
+    with transaction(conn):
+        book_id = add_book(conn, "Big Book", "notes")
+        add_headings_bulk(conn, book_id, [{"heading_number": n, "heading_title": f"Chapter {n}"} for n in range(1, CHAPTERS + 1)])
+        conn.execute("UPDATE headings SET content = ? WHERE book_id = ?", (CONTENT, book_id))
+    return book_id
+
+def timed(label, fn):
+    start = time.perf_counter()
+    fn()
+    print(json.dumps({"run": label, "elapsed_s": round(time.perf_counter() - start, 2)}))
+
+if __name__ == "__main__":
+    from BookGen import BookGen
+    from BookGen.db_utils import update_heading
+    gen = BookGen(db_path=os.path.join(WORKDIR, "formats.db"))
+    book_id = populate(gen)
+    stem = os.path.join(WORKDIR, "big")
+    timed("full, inline (max_workers=1)", lambda: gen.export_book("Big Book", stem, max_workers=1, incremental=False))
+    timed(f"full, process pool ({os.cpu_count()} cpus)", lambda: gen.export_book("Big Book", stem, incremental=False))
+    update_heading(gen.conn, book_id, "Chapter 250", content=CONTENT + "\n\nOne more paragraph.")
+    timed("incremental, 1 chapter edited", lambda: gen.export_book("Big Book", stem))
+    timed("incremental, nothing edited", lambda: gen.export_book("Big Book", stem))
@@ -0,0 +1,60 @@
+# Peak memory and time of the DOCX export for 10 MB and 100 MB manuscripts.
+# Each run happens in a fresh process so ru_maxrss is not shared between runs.
+#   python benchmarks/bench_export_memory.py [--with-python-docx]
+import json, os, resource, subprocess, sys, time
+from datetime import datetime
+
+from common import WORKDIR
+
+CHAPTER_BYTES = 100 * 1024
+SIZES_MB = (10, 100)
+PARAGRAPH = ("The quick brown fox jumps over the lazy dog while the committee deliberates. " * 8).strip()
+
+def populate(db_path, size_mb):
+    from BookGen.db_utils import get_db_connection, transaction, add_book, add_headings_bulk
+    conn = get_db_connection(db_path)
+    chapters = size_mb * 1024 * 1024 // CHAPTER_BYTES
+    content = "\n\n".join([PARAGRAPH] * (CHAPTER_BYTES // (len(PARAGRAPH) + 2)))
+    with transaction(conn):
+        book_id = add_book(conn, "Big Book", "notes")
+        add_headings_bulk(conn, book_id, [{"heading_number": n, "heading_title": f"Chapter {n}"} for n in range(1, chapters + 1)])
+        conn.execute("UPDATE headings SET content = ?, updated_at = ? WHERE book_id = ?", (content, datetime.utcnow().isoformat(), book_id))
+    conn.close()
+
+def export(db_path, engine, output):
+    # runs inside the child process
+    from BookGen import BookGen
+    gen = BookGen(db_path=db_path)
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    if engine == "stream":
+        gen.book_gen("Big Book", output)
+    else:
+        from docx import Document
+        from BookGen.db_utils import get_book, get_headings_by_book
+        doc = Document()
+        doc.add_heading("Big Book", level=0)
+        book = get_book(gen.conn, "Big Book")
+        for heading in get_headings_by_book(gen.conn, book["id"]):
+            doc.add_heading(f"{heading['heading_number']}. {heading['heading_title']}", level=1)
+            doc.add_paragraph(heading["content"])
+        doc.save(output)
+    elapsed = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({"elapsed_s": round(elapsed, 2), "peak_rss_mb": round(peak / 1024, 1),
+                      "export_rss_growth_mb": round((peak - baseline) / 1024, 1),
+                      "output_mb": round(os.path.getsize(output) / 2 ** 20, 2)}))
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--child":
+        export(*sys.argv[2:5])
+        sys.exit(0)
+    engines = ["stream"] + (["python-docx"] if "--with-python-docx" in sys.argv else [])
+    for size_mb in SIZES_MB:
+        db_path = os.path.join(WORKDIR, f"export_{size_mb}.db")
+        populate(db_path, size_mb)
+        for engine in engines:
+            output = os.path.join(WORKDIR, f"export_{size_mb}_{engine}.docx")
+            result = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", db_path, engine, output],
+                                    capture_output=True, text=True, check=True)
+            print(json.dumps({"manuscript_mb": size_mb, "engine": engine, **json.loads(result.stdout.strip().splitlines()[-1])}))
@@ -0,0 +1,59 @@
+# Cold-start cost of `import BookGen` and of a DB-only BookGen (construct +
+# read one outline), each in a fresh process. Pass --tree to time another
+# checkout, e.g. `git worktree add /tmp/before HEAD~1`.
+#   python benchmarks/bench_import_time.py [--tree PATH] [--runs 15]
+import argparse, json, os, statistics, subprocess, sys
+
+from common import WORKDIR, make_outline
+
+HEAVY_MODULES = ("requests", "urllib3", "dotenv", "asyncio", "multiprocessing", "logging.handlers", "docx")
+
+CHILD = r"""
+import json, os, sys, time
+sys.path.insert(0, sys.argv[1])
+start = time.perf_counter()
+import BookGen
+imported = time.perf_counter() - start
+read = None
+if sys.argv[2] == "read":
+    gen = BookGen.BookGen(db_path=sys.argv[3], telemetry=None)
+    gen.get_book_and_outline("Startup Book")
+    read = time.perf_counter() - start
+heavy = [name for name in json.loads(sys.argv[4]) if name in sys.modules]
+print(json.dumps({"import_s": imported, "read_s": read, "heavy": heavy, "logs_dir": os.path.isdir("logs")}))
+"""
+
+def populate(db_path):
+    from BookGen.main import BookGen
+    gen = BookGen(db_path=db_path, telemetry=None)
+    gen.save_book_and_outline("Startup Book", "notes", make_outline("Startup Book", 20))
+    gen.db.close()
+
+def measure(tree, mode, db_path, runs):
+    results = []
+    for i in range(runs):
+        cwd = os.path.join(WORKDIR, f"{mode}-{i}")
+        os.makedirs(cwd)
+        # without the repo's own env overrides, so logging does what an application would see
+        env = {k: v for k, v in os.environ.items() if k not in ("BOOKGEN_LOG_DIR", "PYTHONPATH")}
+        out = subprocess.run([sys.executable, "-c", CHILD, tree, mode, db_path, json.dumps(HEAVY_MODULES)],
+                             cwd=cwd, env={**env, "BOOKGEN_LOG_LEVEL": "ERROR"}, capture_output=True, text=True, check=True)
+        results.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    key = "import_s" if mode == "import" else "read_s"
+    return {
+        "case": mode,
+        "median_ms": round(statistics.median(r[key] for r in results) * 1000, 1),
+        "min_ms": round(min(r[key] for r in results) * 1000, 1),
+        "heavy_modules": results[-1]["heavy"],
+        "creates_logs_dir": results[-1]["logs_dir"],
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tree", default=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    parser.add_argument("--runs", type=int, default=15)
+    args = parser.parse_args()
+    db_path = os.path.join(WORKDIR, "startup.db")
+    populate(db_path)
+    for mode in ("import", "read"):
+        print(json.dumps({"tree": args.tree, **measure(os.path.abspath(args.tree), mode, db_path, args.runs)}))
@@ -0,0 +1,62 @@
+# LLM calls per revision: full regeneration from a chapter vs fingerprint-driven.
+#   python benchmarks/bench_incremental.py
+import json, re
+
+from common import make_outline
+from BookGen import BookGen
+from BookGen.db_utils import update_heading
+from mock_openrouter import MockOpenRouter
+
+CHAPTERS = 30
+EDITED = 5
+
+def responder(request):
+    # deterministic replies: summaries depend only on the heading unless notes leak in
+    prompt = request["messages"][-1]["content"]
+    heading = re.search(r"(?:Current Heading Topic|Section Topic):\s*\n(.+)", prompt).group(1)
+    if request["messages"][0]["content"].lstrip().startswith("You generate summaries only"):
+        notes = re.search(r"Editorial focus \(apply only if present\):\s*\n(.*)\n", prompt).group(1)
+        return f"Summary of {heading}. {'Focus: ' + notes if 'CASCADE' in notes else ''}".strip()
+    return f"Content for {heading}. {prompt[-200:]}"
+
+def run(gen, mock, title, notes):
+    update_heading(gen.conn, gen_book_id(gen, title), f"Chapter {EDITED}", after_notes=notes)
+    before = mock.requests
+    regenerated = gen.regenerate_changed(title)
+    return mock.requests - before, regenerated
+
+def gen_book_id(gen, title):
+    return gen.conn.execute("SELECT id FROM books WHERE title = ?", (title,)).fetchone()[0]
+
+def unchanged_after(mock, mode):
+    # a book written in any mode, with no edits, must not regenerate anything
+    gen = BookGen(api_url=mock.url, db_path=f"{mode}.db", generation_mode=mode)
+    title = f"{mode.title()} Book"
+    gen.save_book_and_outline(title, "notes", make_outline(title, CHAPTERS))
+    gen.generate_heading_content(title)
+    before = mock.requests
+    regenerated = gen.regenerate_changed(title)
+    assert not regenerated, f"{mode}: regenerated {regenerated} without edits"
+    return {"case": f"no changes after {mode} generation", "llm_calls": mock.requests - before, "regenerated": len(regenerated)}
+
+if __name__ == "__main__":
+    with MockOpenRouter(responder=responder) as mock:
+        for mode in ("pipelined", "parallel"):
+            print(json.dumps(unchanged_after(mock, mode)))
+
+        gen = BookGen(api_url=mock.url)
+        title = "Incremental Book"
+        gen.save_book_and_outline(title, "notes", make_outline(title, CHAPTERS))
+        gen.generate_heading_content(title)
+
+        before = mock.requests
+        untouched = gen.regenerate_changed(title)
+        print(json.dumps({"case": "no changes", "llm_calls": mock.requests - before, "regenerated": len(untouched)}))
+
+        calls, regenerated = run(gen, mock, title, "Tighten the prose.")
+        print(json.dumps({"case": "notes changed, same summary", "llm_calls": calls, "regenerated": regenerated,
+                          "full_regeneration_calls": 2 * (CHAPTERS - EDITED + 1)}))
+
+        calls, regenerated = run(gen, mock, title, "CASCADE: shift the argument.")
+        print(json.dumps({"case": "notes changed, summary differs", "llm_calls": calls, "regenerated": len(regenerated),
+                          "full_regeneration_calls": 2 * (CHAPTERS - EDITED + 1)}))
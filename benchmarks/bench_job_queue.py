@@ -0,0 +1,55 @@
+# Job queue throughput with 1 vs 4 worker processes, and crash recovery:
+# a worker is killed with SIGKILL mid-run and a fresh one finishes the batch.
+#   python benchmarks/bench_job_queue.py
+import json, os, re, signal, subprocess, sys, time
+
+from common import WORKDIR, make_outline
+from mock_openrouter import MockOpenRouter
+
+BOOKS = 8
+CHAPTERS = 5
+LATENCY = 0.05
+
+def responder(request):
+    system = request["messages"][0]["content"].lstrip()
+    if system.startswith("You are an AI Outline"):
+        title = re.search(r"Book Title:\s*\n(.+)", request["messages"][-1]["content"]).group(1)
+        return make_outline(title, CHAPTERS)
+    return "lorem " * 50
+
+def enqueue(db_path, prefix):
+    from BookGen import BookGen
+    gen = BookGen(db_path=db_path, db_wal=True)
+    return gen, [gen.enqueue_book(f"{prefix} {n}", "notes", output_stem=os.path.join(WORKDIR, f"{prefix}-{n}"))
+                 for n in range(1, BOOKS + 1)]
+
+def workers(db_path, url, processes, *extra):
+    env = {**os.environ, "OPENROUTER_URL": url}
+    return subprocess.Popen([sys.executable, "-m", "BookGen.worker", "--db", db_path, "--processes", str(processes),
+                             "--poll", "0.1", *extra], env=env, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def summary(gen, jobs):
+    return [gen.job_progress(job)["status"] for job in jobs].count("done")
+
+if __name__ == "__main__":
+    with MockOpenRouter(latency=LATENCY, responder=responder) as mock:
+        expected_calls = BOOKS * (1 + 2 * CHAPTERS)
+        for processes in (1, 4):
+            db_path = os.path.join(WORKDIR, f"queue_{processes}.db")
+            gen, jobs = enqueue(db_path, f"Book p{processes}")
+            before, start = mock.requests, time.perf_counter()
+            workers(db_path, mock.url, processes, "--until-idle").wait()
+            print(json.dumps({"processes": processes, "books": BOOKS, "done": summary(gen, jobs),
+                              "elapsed_s": round(time.perf_counter() - start, 2), "llm_calls": mock.requests - before}))
+
+        db_path = os.path.join(WORKDIR, "queue_crash.db")
+        gen, jobs = enqueue(db_path, "Crash")
+        before = mock.requests
+        victim = workers(db_path, mock.url, 1, "--lease", "1")
+        time.sleep(1.5)
+        victim.send_signal(signal.SIGKILL)
+        victim.wait()
+        done_at_crash = summary(gen, jobs)
+        workers(db_path, mock.url, 2, "--lease", "1", "--until-idle").wait()
+        print(json.dumps({"case": "SIGKILL mid-run", "done_at_crash": done_at_crash, "done": summary(gen, jobs),
+                          "llm_calls": mock.requests - before, "minimum_calls": expected_calls}))
@@ -0,0 +1,74 @@
+# Notifications off the hot path: N books through outline -> content ->
+# export with a slow SMTP server, sending inline (one connection and one
+# email per event) vs the queued dispatcher (reused connection, digests).
+#   python benchmarks/bench_notifications.py [--books 10] [--smtp-latency 0.5]
+import argparse, json, os, smtplib, time
+from email.message import EmailMessage
+
+from common import WORKDIR, make_outline
+from BookGen import BookGen
+from BookGen.config_utils import BookGenConfig
+from mock_openrouter import MockOpenRouter
+from mock_smtp import MockSMTP
+
+CHAPTERS = 5
+
+def inline_sender(port):
+    # the previous design: a blocking SMTP send at each checkpoint
+    def send(event, title):
+        message = EmailMessage()
+        message["Subject"], message["From"], message["To"] = f"BookGen: {event} - {title}", "bookgen@localhost", "editor@localhost"
+        message.set_content(event)
+        with smtplib.SMTP("127.0.0.1", port) as smtp:
+            smtp.send_message(message)
+    return send
+
+def run_books(gen, books, send=None):
+    start = time.perf_counter()
+    depth = 0
+    for b in range(books):
+        title = f"Notified Book {b}"
+        gen.save_book_and_outline(title, "notes", make_outline(title, CHAPTERS))
+        send and send("outline_ready", title)
+        gen.generate_heading_content(title)
+        send and send("content_completed", title)
+        gen.book_gen(title, os.path.join(WORKDIR, f"book{b}.docx"))
+        send and send("book_exported", title)
+        if gen.notifier:
+            depth = max(depth, gen.notification_stats()["pending"])
+    return time.perf_counter() - start, depth
+
+def case(name, llm_url, smtp, books, mode):
+    config = BookGenConfig(log_dir=None, log_level="ERROR", smtp_host="127.0.0.1" if smtp else None,
+                           smtp_port=smtp.port if smtp else 0, notify_to=["editor@localhost"])
+    gen = BookGen(api_url=llm_url, db_path=os.path.join(WORKDIR, f"{name}.db"), telemetry=None, config=config,
+                  notify=mode == "queued", notify_batch_window=1.0)
+    elapsed, depth = run_books(gen, books, inline_sender(smtp.port) if mode == "inline" else None)
+    result = {"case": name, "books": books, "events": 3 * books, "workflow_s": round(elapsed, 2)}
+    if mode == "queued":
+        drain_start = time.perf_counter()
+        gen.close_notifications()
+        stats = gen.notification_stats()
+        result.update({"max_queue_depth": depth, "drain_after_workflow_s": round(time.perf_counter() - drain_start, 2),
+                       "emails": stats["batches"], "smtp_connections": stats["smtp_connections"],
+                       "delivery_latency_p50_s": stats["latency_p50"], "delivery_latency_p95_s": stats["latency_p95"],
+                       "pending_after_close": stats["pending"]})
+    elif smtp:
+        result.update({"emails": 3 * books, "smtp_connections": 3 * books})
+    return result
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--books", type=int, default=10)
+    parser.add_argument("--smtp-latency", type=float, default=0.5)
+    args = parser.parse_args()
+    with MockOpenRouter(response_words=200) as llm:
+        print(json.dumps(case("no notifications", llm.url, None, args.books, None)))
+        with MockSMTP(latency=args.smtp_latency, connect_latency=0.1) as smtp:
+            print(json.dumps(case("inline smtp", llm.url, smtp, args.books, "inline")))
+        with MockSMTP(latency=args.smtp_latency, connect_latency=0.1) as smtp:
+            print(json.dumps({**case("queued dispatcher", llm.url, smtp, args.books, "queued"), "received": len(smtp.messages)}))
+        # mail server down for the whole run: generation is unaffected, events wait in the table
+        down = MockSMTP().start()
+        down.stop()
+        print(json.dumps(case("smtp unreachable", llm.url, down, args.books, "queued")))
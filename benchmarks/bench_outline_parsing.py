@@ -0,0 +1,73 @@
+# Outline parsing on a corpus of LLM response shapes seen in practice:
+# old greedy-regex parser vs. the balanced-brace scanner with repair and
+# schema validation. Every rejected response costs one more outline call.
+# Also: how much of a streamed response is read before the outline is complete.
+#   python benchmarks/bench_outline_parsing.py
+import json, random, re
+
+from common import make_outline
+from BookGen.json_utils import extract_json, extract_json_stream, validate_outline
+
+def outline(chapters=8):
+    return make_outline("Corpus Book", chapters)
+
+def corpus():
+    rng = random.Random(7)
+    clean = outline()
+    cases = {
+        "clean": lambda: clean,
+        "code fence": lambda: f"```json\n{clean}\n```",
+        "prose with braces": lambda: f"Here is the outline in {{json}} form:\n{clean}\nLet me know if {{anything}} should change.",
+        "think block": lambda: f"<think>The user wants {{chapters}}; maybe {{\"x\": 1}} first.</think>\n{clean}",
+        "trailing commas": lambda: re.sub(r"(\"|\])(\s*)(\]|\})", r"\1,\2\3", clean),
+        "raw newline in string": lambda: clean.replace("Description of chapter 2", "Description of\nchapter 2"),
+        "chapter_number as string": lambda: re.sub(r'"chapter_number": (\d+)', r'"chapter_number": "\1"', clean),
+        "draft then final": lambda: f"Draft: {outline(3)}\nFinal answer:\n{clean}",
+        "wrong shape": lambda: clean.replace('"outline"', '"chapters"'),
+        "truncated": lambda: clean[:len(clean) // 2],
+        # smart quotes as prose inside values, plus a defect that forces a repair
+        "quoted prose, trailing commas": lambda: re.sub(r"(\"|\])(\s*)(\]|\})", r"\1,\2\3",
+                                                        clean.replace("Description of chapter", "The “story” of chapter")),
+        "smart-quoted keys and values": lambda: re.sub(r'"([^"\n]*)"', "“\\1”", clean),
+    }
+    return [(name, make()) for name, make in cases.items() for _ in range(rng.randint(8, 12))]
+
+def old_parser(text):
+    # the previous BookGen.parse_llm_json: greedy regex + json.loads, no schema
+    match = re.search(r'\{.*\}', text, re.DOTALL)
+    if not match:
+        raise ValueError("No JSON found in response")
+    return json.loads(match.group())
+
+def usable(data):
+    # the final 8-chapter outline, not a draft and not an empty chapter list
+    return len(data.get("outline") or []) == 8
+
+if __name__ == "__main__":
+    responses = corpus()
+    by_case = {}
+    for name, text in responses:
+        case = by_case.setdefault(name, {"responses": 0, "old_ok": 0, "old_silently_bad": 0, "new_ok": 0})
+        case["responses"] += 1
+        try:
+            data = old_parser(text)
+            case["old_ok" if usable(data) else "old_silently_bad"] += 1
+        except ValueError:
+            pass
+        try:
+            case["new_ok"] += usable(extract_json(text, validate_outline))
+        except ValueError:
+            pass
+    for name, case in by_case.items():
+        print(json.dumps({"case": name, **case}))
+    total = len(responses)
+    old_ok = sum(c["old_ok"] for c in by_case.values())
+    new_ok = sum(c["new_ok"] for c in by_case.values())
+    print(json.dumps({"responses": total, "old_extra_round_trips": total - old_ok, "new_extra_round_trips": total - new_ok,
+                      "old_silently_bad": sum(c["old_silently_bad"] for c in by_case.values())}))
+
+    # streamed: outline followed by a long sign-off the model keeps writing
+    text = outline(20) + "\n\n" + "I hope this outline helps. " * 200
+    chunks = [text[i:i + 20] for i in range(0, len(text), 20)]
+    _, read = extract_json_stream(iter(chunks), validate_outline)
+    print(json.dumps({"streamed_chars": len(text), "read_before_stop": len(read), "saved": f"{1 - len(read) / len(text):.0%}"}))
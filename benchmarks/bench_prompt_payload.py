@@ -0,0 +1,44 @@
+# Regression benchmark: per-call payload must not grow with book length.
+#   python benchmarks/bench_prompt_payload.py
+import json
+
+from common import make_outline
+from BookGen import BookGen
+from BookGen.prompt_utils import payload_size
+
+CHAPTER_COUNTS = (10, 50, 200)
+
+class RecordingBookGen(BookGen):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.calls = []
+
+    def call_model(self, message, **kwargs):
+        self.calls.append(message)
+        return "Generated prose for this chapter. " * 20
+
+def run(chapters):
+    gen = RecordingBookGen()
+    title = f"Bench Book {chapters}"
+    gen.save_book_and_outline(title, "notes", make_outline(title, chapters))
+    gen.generate_heading_content(title)
+    summary_calls = [m for m in gen.calls if m[0]["content"].lstrip().startswith("You generate summaries only")]
+    return {
+        "chapters": chapters,
+        "calls": len(gen.calls),
+        "max_messages_per_call": max(len(m) for m in gen.calls),
+        "first_summary_payload": payload_size(summary_calls[0]),
+        "last_summary_payload": payload_size(summary_calls[-1]),
+        "max_payload": max(payload_size(m) for m in gen.calls),
+    }
+
+if __name__ == "__main__":
+    results = [run(n) for n in CHAPTER_COUNTS]
+    for r in results:
+        print(json.dumps(r))
+    assert all(r["max_messages_per_call"] == 2 for r in results), "message history is leaking between calls"
+    # allow a few bytes for longer chapter numbers in the titles
+    sizes = [r["last_summary_payload"] for r in results]
+    assert max(sizes) - min(sizes) < 16, "summary payload grows with book length"
+    # once the context budget is reached, content prompts stop growing too
+    assert results[-1]["max_payload"] < 1.1 * results[-2]["max_payload"], "content payload grows with book length"
@@ -0,0 +1,100 @@
+# Storage and read latency of the revision store vs overwriting in place
+# (and vs naive uncompressed copies), 50 revisions per chapter.
+#   python benchmarks/bench_revisions.py
+import json, os, random, statistics, time
+
+from common import make_outline
+from BookGen.db_utils import (get_db_connection, add_book, add_headings_bulk, update_heading, get_headings_by_book,
+                              get_revision, get_book_at, compact_revisions)
+
+CHAPTERS = 20
+REVISIONS = 50
+PARAGRAPHS = 15
+PARAGRAPH_WORDS = 80
+
+rng = random.Random(7)
+SYLLABLES = ["ka", "lo", "mi", "ne", "ra", "tu", "se", "vo", "di", "an", "el", "or", "is", "um", "pe", "qua"]
+VOCABULARY = ["".join(rng.choice(SYLLABLES) for _ in range(rng.randint(1, 4))) for _ in range(3000)]
+
+def paragraph():
+    return " ".join(rng.choice(VOCABULARY) for _ in range(PARAGRAPH_WORDS)) + "."
+
+def revisions(workload):
+    # "edit": an editor reworks two paragraphs per revision; "regenerate": every revision is a fresh draft
+    paragraphs = [paragraph() for _ in range(PARAGRAPHS)]
+    for _ in range(REVISIONS):
+        if workload == "edit":
+            for i in rng.sample(range(PARAGRAPHS), 2):
+                paragraphs[i] = paragraph()
+        else:
+            paragraphs = [paragraph() for _ in range(PARAGRAPHS)]
+        yield "\n\n".join(paragraphs), paragraph()
+
+def db_bytes(conn):
+    conn.execute("VACUUM")
+    return conn.execute("PRAGMA page_count").fetchone()[0] * conn.execute("PRAGMA page_size").fetchone()[0]
+
+def run(workload, store):
+    path = f"{workload}-{store}.db"
+    conn = get_db_connection(path)
+    book_id = add_book(conn, "Book", "notes")
+    add_headings_bulk(conn, book_id, [{"heading_number": c["chapter_number"], "heading_title": c["chapter_title"],
+                                       "sub_heading": "\n".join(c["sections"])}
+                                      for c in json.loads(make_outline("Book", CHAPTERS))["outline"]])
+    if store == "naive copies":
+        conn.execute("CREATE TABLE naive_revisions (heading_title TEXT, revision INTEGER, content TEXT, summary TEXT, "
+                     "created_at TEXT, PRIMARY KEY (heading_title, revision))")
+    rng.seed(11)
+    writes, midpoint = [], None
+    for n, chapter_revisions in enumerate(zip(*(revisions(workload) for _ in range(CHAPTERS))), 1):
+        for chapter, (content, summary) in enumerate(chapter_revisions, 1):
+            start = time.perf_counter()
+            update_heading(conn, book_id, f"Chapter {chapter}", summary=summary, content=content,
+                           record_revision=store == "revision store")
+            if store == "naive copies":
+                conn.execute("INSERT INTO naive_revisions VALUES (?, ?, ?, ?, datetime('now'))",
+                             (f"Chapter {chapter}", n, content, summary))
+                conn.commit()
+            writes.append(time.perf_counter() - start)
+        if n == REVISIONS // 2:
+            time.sleep(0.01)
+            midpoint = conn.execute("SELECT MAX(created_at) FROM revisions").fetchone()[0]
+    row = {"workload": workload, "store": store, "db_bytes": db_bytes(conn),
+           "write_ms": round(statistics.mean(writes) * 1000, 3)}
+    start = time.perf_counter()
+    get_headings_by_book(conn, book_id)
+    row["read_latest_book_ms"] = round((time.perf_counter() - start) * 1000, 2)
+    ids = [r[0] for r in conn.execute("SELECT id FROM headings WHERE book_id = ?", (book_id,))]
+    if store == "revision store":
+        timings = []
+        for heading_id in ids:
+            for revision in range(1, REVISIONS + 1):
+                start = time.perf_counter()
+                get_revision(conn, heading_id, revision)
+                timings.append(time.perf_counter() - start)
+        row["read_revision_ms_p50"] = round(statistics.median(timings) * 1000, 3)
+        row["read_revision_ms_max"] = round(max(timings) * 1000, 3)
+        start = time.perf_counter()
+        get_book_at(conn, book_id, midpoint)
+        row["book_at_midpoint_ms"] = round((time.perf_counter() - start) * 1000, 2)
+        start = time.perf_counter()
+        removed = sum(compact_revisions(conn, heading_id, keep_last=10, keep_daily=0) for heading_id in ids)
+        row.update({"compact_removed": removed, "compact_s": round(time.perf_counter() - start, 2),
+                    "db_bytes_after_compact": db_bytes(conn)})
+    elif store == "naive copies":
+        timings = []
+        for chapter in range(1, CHAPTERS + 1):
+            for revision in range(1, REVISIONS + 1):
+                start = time.perf_counter()
+                conn.execute("SELECT content, summary FROM naive_revisions WHERE heading_title = ? AND revision = ?",
+                             (f"Chapter {chapter}", revision)).fetchone()
+                timings.append(time.perf_counter() - start)
+        row["read_revision_ms_p50"] = round(statistics.median(timings) * 1000, 3)
+    conn.close()
+    os.remove(path)
+    return row
+
+if __name__ == "__main__":
+    for workload in ("edit", "regenerate"):
+        for store in ("overwrite", "naive copies", "revision store"):
+            print(json.dumps(run(workload, store)))
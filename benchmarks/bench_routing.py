@@ -0,0 +1,48 @@
+# Per-stage model routing against mock backends.
+#  1. a rate-limited "free" backend alone vs. routed with a paid fallback and
+#     a cheap summarizer
+#  2. two healthy backends at equal weight, one 4x slower: share of calls
+#     once latencies are known
+#   python benchmarks/bench_routing.py
+import json, os, time
+
+from common import WORKDIR, make_outline
+from BookGen import BookGen
+from mock_openrouter import MockOpenRouter
+
+CHAPTERS = 12
+
+def run(label, url, routes=None, mode="parallel", **options):
+    gen = BookGen(api_url=url, routes=routes, generation_mode=mode, max_workers=4, **options)
+    title = f"Routing {label}"
+    gen.save_book_and_outline(title, "notes", make_outline(title, CHAPTERS))
+    start = time.perf_counter()
+    gen.generate_heading_content(title)
+    elapsed = time.perf_counter() - start
+    calls = {stage: {b["model"]: b["calls"] for b in pool} for stage, pool in gen.backend_stats().items()}
+    return elapsed, calls, gen
+
+if __name__ == "__main__":
+    free = MockOpenRouter(latency=0.2, error_rate=0.25, error_status=429).start()
+    paid = MockOpenRouter(latency=0.1).start()
+    cheap = MockOpenRouter(latency=0.03).start()
+
+    elapsed, calls, _ = run("free only", free.url, model="free/model")
+    print(json.dumps({"case": "free tier only", "elapsed_s": round(elapsed, 2), "backend_calls": calls, "429s": free.server.errors}))
+    free.server.errors = 0
+    routes = {
+        "content": [{"model": "free/model", "weight": 3}, {"model": "paid/model", "api_url": paid.url, "weight": 1}],
+        "summary": {"model": "cheap/model", "api_url": cheap.url},
+    }
+    elapsed, calls, gen = run("routed", free.url, routes, model="free/model")
+    print(json.dumps({"case": "routed with failover", "elapsed_s": round(elapsed, 2), "backend_calls": calls, "429s": free.server.errors}))
+
+    slow = MockOpenRouter(latency=0.2).start()
+    fast = MockOpenRouter(latency=0.05).start()
+    routes = {"content": [{"model": "slow/model", "api_url": slow.url}, {"model": "fast/model", "api_url": fast.url}]}
+    # sequential, so the router has observed latencies to go on
+    elapsed, calls, gen = run("latency", slow.url, routes, mode="sequential")
+    print(json.dumps({"case": "equal weight, 4x latency gap", "content_calls": calls["content"],
+                      "latency_ewma": {b["model"]: round(b["latency_ewma"], 3) for b in gen.backend_stats()["content"]}}))
+    for mock in (free, paid, cheap, slow, fast):
+        mock.stop()
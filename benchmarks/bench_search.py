@@ -0,0 +1,95 @@
+# Full-text search over a generated corpus: ranked FTS5 queries vs a LIKE
+# scan, plus the cost of keeping the index in sync on writes.
+#   python benchmarks/bench_search.py [--books 2000] [--chapters 12]
+import argparse, json, os, random, statistics, time
+from datetime import datetime
+
+from common import WORKDIR
+from BookGen.db_utils import get_db_connection, transaction, add_book, add_headings_bulk, update_heading, search_headings
+
+SYLLABLES = ["ka", "lo", "mi", "ren", "tu", "sa", "vor", "el", "qui", "dan", "po", "shi", "gra", "ne", "tal", "ob"]
+
+def vocabulary(rng, size):
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+def text(rng, words, weights, count):
+    return " ".join(rng.choices(words, weights, k=count)) + "."
+
+def build(db_path, books, chapters, seed):
+    rng = random.Random(seed)
+    words = vocabulary(rng, 8000)
+    # zipf-like: a few very common words, a long tail of rare ones
+    weights = [1.0 / (rank + 1) for rank in range(len(words))]
+    conn = get_db_connection(db_path, wal=True, synchronous="NORMAL")
+    now = datetime.utcnow().isoformat()
+    start = time.perf_counter()
+    for b in range(books):
+        with transaction(conn):
+            book_id = add_book(conn, f"Book {b}", "notes")
+            add_headings_bulk(conn, book_id, [{
+                "heading_number": n, "heading_title": f"Chapter {n}",
+                "description": text(rng, words, weights, 15),
+            } for n in range(1, chapters + 1)])
+            conn.executemany("UPDATE headings SET content = ?, summary = ?, updated_at = ? WHERE book_id = ? AND heading_number = ?", [
+                (text(rng, words, weights, 300), text(rng, words, weights, 40), now, book_id, n) for n in range(1, chapters + 1)
+            ])
+    # a handful of chapters mention a term found nowhere else
+    conn.executemany("UPDATE headings SET content = content || ' zephyrquartz' WHERE id = ?",
+                     [(rng.randint(1, books * chapters),) for _ in range(5)])
+    conn.commit()
+    return conn, words, time.perf_counter() - start
+
+def timed(fn, runs):
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = fn()
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    return result, {"p50_ms": round(statistics.median(samples) * 1000, 2), "p95_ms": round(samples[int(len(samples) * 0.95) - 1] * 1000, 2)}
+
+def like_scan(conn, term):
+    # every match is needed before anything can be ranked
+    return conn.execute("""
+    SELECT id FROM headings WHERE content LIKE ? OR summary LIKE ? OR description LIKE ?
+    """, (f"%{term}%",) * 3).fetchall()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--books", type=int, default=2000)
+    parser.add_argument("--chapters", type=int, default=12)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    db_path = os.path.join(WORKDIR, "search.db")
+    conn, words, build_s = build(db_path, args.books, args.chapters, args.seed)
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    print(json.dumps({"books": args.books, "chapters": args.books * args.chapters, "build_s": round(build_s, 2),
+                      "db_mb": round(os.path.getsize(db_path) / 2 ** 20, 1)}))
+
+    common, mid, rare = words[0], words[200], "zephyrquartz"
+    queries = [
+        ("common term", common, False, None),
+        ("mid-frequency term", mid, False, None),
+        ("rare term", rare, False, None),
+        ("two terms", f"{mid} {words[300]}", False, None),
+        ("phrase", f'"{common} {words[1]}"', True, None),
+        ("prefix", f"{mid[:4]}*", True, None),
+        ("one book", mid, False, f"Book {args.books // 2}"),
+    ]
+    for name, query, raw, book in queries:
+        results, stats = timed(lambda: search_headings(conn, query, book, limit=20, raw=raw), 30)
+        print(json.dumps({"query": name, "results": len(results), **stats}))
+    for name, term in (("LIKE scan, common term", common), ("LIKE scan, rare term", rare)):
+        results, stats = timed(lambda: like_scan(conn, term), 3)
+        print(json.dumps({"query": name, "results": len(results), "ranked": False, **stats}))
+
+    # index maintenance rides on the writer's transaction
+    heading = conn.execute("SELECT book_id, heading_title FROM headings ORDER BY random() LIMIT 1").fetchone()
+    new_text = " ".join(words[:300])
+    _, stats = timed(lambda: update_heading(conn, heading[0], heading[1], content=new_text), 20)
+    conn.execute("DROP TRIGGER headings_fts_update")
+    _, unindexed = timed(lambda: update_heading(conn, heading[0], heading[1], content=new_text), 20)
+    print(json.dumps({"write": "update_heading(content)", "indexed": stats, "without_index": unindexed}))
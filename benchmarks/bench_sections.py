@@ -0,0 +1,74 @@
+# Cost of fixing one weak section: whole-chapter rewrite vs regenerate_section.
+#   python benchmarks/bench_sections.py
+import json, re, threading, time
+
+from common import make_outline
+from BookGen import BookGen
+from BookGen.db_utils import get_book, update_heading
+from mock_openrouter import MockOpenRouter
+
+CHAPTERS = 4
+SECTIONS = 8
+SECTION_WORDS = 400
+EDITED = 2
+
+class Meter:
+    # tokens as the mock bills them: prompt and completion characters / 4
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = self.prompt_tokens = self.completion_tokens = 0
+
+    def responder(self, request):
+        prompt = request["messages"][-1]["content"]
+        heading = re.search(r"(?:Current Heading Topic|Section Topic):\s*\n(.+)", prompt).group(1)
+        if request["messages"][0]["content"].lstrip().startswith("You generate summaries only"):
+            text = f"Summary of {heading}."
+        else:
+            section = re.search(r"Section to write \(this section only\):\s*\n(.+)", prompt)
+            tag = "revised" if "REVISE" in prompt else "draft"
+            words = SECTION_WORDS if section else SECTIONS * SECTION_WORDS
+            name = section.group(1) if section else heading
+            text = " ".join(f"{name.replace(' ', '_')}-{tag}-{i}" for i in range(words))
+        with self.lock:
+            self.calls += 1
+            self.prompt_tokens += sum(len(m["content"]) for m in request["messages"]) // 4
+            self.completion_tokens += len(text) // 4
+        return text
+
+    def snapshot(self):
+        with self.lock:
+            return self.calls, self.prompt_tokens, self.completion_tokens
+
+def measure(meter, fn):
+    before = meter.snapshot()
+    start = time.perf_counter()
+    result = fn()
+    after = meter.snapshot()
+    return result, {
+        "llm_calls": after[0] - before[0],
+        "prompt_tokens": after[1] - before[1],
+        "completion_tokens": after[2] - before[2],
+        "seconds": round(time.perf_counter() - start, 2),
+    }
+
+if __name__ == "__main__":
+    meter = Meter()
+    # ~100 words/s per stream, so output length dominates like on a real model
+    with MockOpenRouter(responder=meter.responder, latency=0.2, chunk_words=5, chunk_delay=0.01) as mock:
+        results = {}
+        for granularity in ("chapter", "section"):
+            gen = BookGen(api_url=mock.url, db_path=f"{granularity}.db", max_workers=SECTIONS, granularity=granularity)
+            title = f"{granularity.title()} Book"
+            gen.save_book_and_outline(title, "notes", make_outline(title, CHAPTERS, SECTIONS))
+            _, results[f"{granularity}: generate book"] = measure(meter, lambda: gen.generate_heading_content(title))
+            if granularity == "chapter":
+                # fix one section by rewriting its chapter with the note attached
+                book = get_book(gen.conn, title)
+                update_heading(gen.conn, book["id"], f"Chapter {EDITED}", after_notes=f"REVISE section {EDITED}.3")
+                _, results["chapter: fix one section"] = measure(meter, lambda: gen.regenerate_changed(title))
+            else:
+                edit, results["section: fix one section"] = measure(
+                    meter, lambda: gen.regenerate_section(title, EDITED, 3, section_notes="REVISE this section."))
+                results["section: fix one section"].update(edit)
+        for case, row in results.items():
+            print(json.dumps({"case": case, **row}))
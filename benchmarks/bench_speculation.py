@@ -0,0 +1,40 @@
+# Time from outline approval to finished manuscript, with and without speculative drafting.
+#   python benchmarks/bench_speculation.py
+import json, time
+
+from common import make_outline
+from BookGen import BookGen
+from BookGen.db_utils import get_book, update_heading
+from mock_openrouter import MockOpenRouter
+
+CHAPTERS = 10
+REVIEW_SECONDS = 6.0
+
+def run(mock, name, review_notes=(), **options):
+    gen = BookGen(api_url=mock.url, db_path=f"{name}.db", generation_mode="sequential", **options)
+    title = "Speculative Book"
+    gen.save_book_and_outline(title, "notes", make_outline(title, CHAPTERS))
+    # the editor reviews the outline, and may leave notes on some chapters
+    time.sleep(REVIEW_SECONDS)
+    book = get_book(gen.conn, title)
+    for number in review_notes:
+        update_heading(gen.conn, book["id"], f"Chapter {number}", after_notes="Open with a case study.")
+    before = mock.requests
+    start = time.perf_counter()
+    gen.generate_heading_content(title)
+    row = {"case": name, "approval_to_manuscript_s": round(time.perf_counter() - start, 2),
+           "llm_calls_after_approval": mock.requests - before}
+    if gen.speculator:
+        stats = gen.speculation_stats()
+        row.update({key: stats[key] for key in ("hit_rate", "hits", "misses", "discarded", "skipped_over_budget",
+                                                "tokens_spent", "tokens_wasted", "latency_hidden_s")})
+        gen.close_speculation()
+    print(json.dumps(row))
+
+if __name__ == "__main__":
+    # ~1.2 s per chapter and summary call, like a slow free-tier model
+    with MockOpenRouter(latency=0.3, response_words=300, chunk_words=5, chunk_delay=0.015, seed=1) as mock:
+        run(mock, "no speculation")
+        run(mock, "speculate, approved unchanged", speculate=True, speculation_workers=4)
+        run(mock, "speculate, notes on 2 chapters", review_notes=(3, 7), speculate=True, speculation_workers=4)
+        run(mock, "speculate, budget for ~half", speculate=True, speculation_workers=4, speculation_token_budget=9000)
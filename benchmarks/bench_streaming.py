@@ -0,0 +1,48 @@
+# Time-to-first-token vs full completion time, blocking and streamed.
+#   python benchmarks/bench_streaming.py
+import asyncio, json, time
+
+from common import make_outline
+from BookGen import BookGen
+from mock_openrouter import MockOpenRouter
+
+WORDS = 400
+CHUNK_DELAY = 0.005
+
+def bench_blocking(gen, message):
+    start = time.perf_counter()
+    gen.call_model(message, use_cache=False)
+    elapsed = time.perf_counter() - start
+    return {"mode": "blocking", "first_output_s": round(elapsed, 3), "total_s": round(elapsed, 3)}
+
+def bench_stream(gen, message):
+    start = time.perf_counter()
+    first = None
+    for _ in gen.stream_model(message, use_cache=False):
+        first = first or time.perf_counter() - start
+    return {"mode": "stream", "first_output_s": round(first, 3), "total_s": round(time.perf_counter() - start, 3),
+            "ttft_s": round(gen.last_stream_stats["ttft"], 3)}
+
+async def bench_async_stream(gen, message):
+    start = time.perf_counter()
+    first = None
+    async for _ in gen.astream_model(message, use_cache=False):
+        first = first or time.perf_counter() - start
+    return {"mode": "async_stream", "first_output_s": round(first, 3), "total_s": round(time.perf_counter() - start, 3)}
+
+if __name__ == "__main__":
+    with MockOpenRouter(latency=0.05, response_words=WORDS, chunk_delay=CHUNK_DELAY) as mock:
+        gen = BookGen(api_url=mock.url)
+        message = gen.get_content_template("Write chapter one.")
+        print(json.dumps(bench_blocking(gen, message)))
+        print(json.dumps(bench_stream(gen, message)))
+        print(json.dumps(asyncio.run(bench_async_stream(gen, message))))
+        title = "Streamed Book"
+        gen.save_book_and_outline(title, "notes", make_outline(title, 3))
+        received = []
+        gen.generate_heading_content(title, on_chunk=lambda heading, chunk: received.append(heading))
+        chunks = list(gen.stream_heading(title, 2))
+        book = json.loads(gen.get_book_and_outline(title))
+        print(json.dumps({"on_chunk_calls": len(received), "stream_heading_chunks": len(chunks),
+                          "chapter_2_saved": book["outline"][1]["content"] == "".join(chunks),
+                          **{k: v for k, v in gen.transport.metrics.snapshot().items() if k.startswith("ttft")}}))
@@ -0,0 +1,33 @@
+# Per-call telemetry: overhead on a generation run and the per-book report.
+#   python benchmarks/bench_telemetry.py
+import json, os, time
+
+from common import WORKDIR, make_outline
+from BookGen import BookGen
+from mock_openrouter import MockOpenRouter
+
+CHAPTERS = 20
+
+def run(url, telemetry, mode="parallel"):
+    gen = BookGen(api_url=url, generation_mode=mode, max_workers=8, telemetry=telemetry,
+                  db_path=os.path.join(WORKDIR, f"telemetry_{bool(telemetry)}_{mode}.db"))
+    title = f"Telemetry {telemetry} {mode}"
+    gen.save_book_and_outline(title, "notes", make_outline(title, CHAPTERS))
+    start = time.perf_counter()
+    gen.generate_heading_content(title)
+    return gen, title, time.perf_counter() - start
+
+if __name__ == "__main__":
+    with MockOpenRouter(latency=0.02, jitter=0.01) as mock:
+        _, _, baseline = run(mock.url, None)
+        gen, title, elapsed = run(mock.url, "db")
+        print(json.dumps({"chapters": CHAPTERS, "no_telemetry_s": round(baseline, 3), "telemetry_s": round(elapsed, 3)}))
+        report = gen.telemetry_report(title)
+        print(json.dumps({"totals": report["totals"], "stages": report["stages"]}, indent=2))
+        print(json.dumps({"chapter_1": report["chapters"]["Chapter 1"]}))
+        jsonl = BookGen(api_url=mock.url, telemetry=os.path.join(WORKDIR, "calls.jsonl"), db_path=os.path.join(WORKDIR, "jsonl.db"))
+        jsonl.save_book_and_outline("JSONL", "notes", make_outline("JSONL", 3))
+        jsonl.stream = True
+        jsonl.generate_heading_content("JSONL")
+        print(json.dumps({"jsonl_sink_stages": {k: v["calls"] for k, v in jsonl.telemetry_report("JSONL")["stages"].items()},
+                          "streamed_ttfb_p50": jsonl.telemetry_report("JSONL")["stages"]["content"]["ttfb_p50"]}))
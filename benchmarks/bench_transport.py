@@ -0,0 +1,107 @@
+# Connection reuse, retry and timeout behaviour of LLMTransport against the mock server.
+#   python benchmarks/bench_transport.py
+import json, threading, time
+
+import requests
+import common
+from BookGen.http_utils import LLMTransport, TransportError
+from mock_openrouter import MockOpenRouter
+
+CALLS = 200
+PAYLOAD = {"model": "mock", "messages": [{"role": "user", "content": "hi"}]}
+
+def bench_keepalive(url):
+    start = time.perf_counter()
+    for _ in range(CALLS):
+        requests.post(url, data=json.dumps(PAYLOAD)).json()
+    per_call_new = (time.perf_counter() - start) / CALLS
+    transport = LLMTransport(url, "bench")
+    start = time.perf_counter()
+    for _ in range(CALLS):
+        transport.send(PAYLOAD)
+    per_call_pooled = (time.perf_counter() - start) / CALLS
+    return {"bench": "keepalive", "calls": CALLS, "new_connection_ms": round(per_call_new * 1000, 3), "pooled_ms": round(per_call_pooled * 1000, 3)}
+
+def bench_errors(error_rate, status, retry_after):
+    with MockOpenRouter(error_rate=error_rate, error_status=status, retry_after=retry_after) as mock:
+        transport = LLMTransport(mock.url, "bench", max_retries=8, backoff_base=0.01, failure_threshold=100)
+        ok = 0
+        for _ in range(50):
+            try:
+                transport.send(PAYLOAD)
+                ok += 1
+            except TransportError:
+                pass
+        return {"bench": "errors", "error_rate": error_rate, "status": status, "retry_after": retry_after,
+                "succeeded": ok, "server_errors": mock.server.errors, **transport.metrics.snapshot()}
+
+def bench_timeout():
+    with MockOpenRouter(latency=2.0) as mock:
+        transport = LLMTransport(mock.url, "bench", read_timeout=0.2, max_retries=1, backoff_base=0.01)
+        start = time.perf_counter()
+        try:
+            transport.send(PAYLOAD)
+            outcome = "completed"
+        except TransportError:
+            outcome = "timed out"
+        return {"bench": "timeout", "server_latency": 2.0, "read_timeout": 0.2, "outcome": outcome, "elapsed": round(time.perf_counter() - start, 3)}
+
+def bench_circuit_breaker():
+    with MockOpenRouter(error_rate=1.0) as mock:
+        transport = LLMTransport(mock.url, "bench", max_retries=0, failure_threshold=3, reset_timeout=60)
+        outcomes = []
+        for _ in range(6):
+            try:
+                transport.send(PAYLOAD)
+                outcomes.append("ok")
+            except TransportError as e:
+                outcomes.append(type(e).__name__)
+        return {"bench": "circuit_breaker", "outcomes": outcomes, "server_requests": mock.requests}
+
+def bench_breaker_retries():
+    # a call counts as one failure however many attempts it made
+    with MockOpenRouter(error_rate=1.0) as mock:
+        transport = LLMTransport(mock.url, "bench", max_retries=3, backoff_base=0.01, failure_threshold=2, reset_timeout=60)
+        outcomes = []
+        for _ in range(3):
+            try:
+                transport.send(PAYLOAD)
+                outcomes.append("ok")
+            except TransportError as e:
+                outcomes.append(type(e).__name__)
+        return {"bench": "breaker_retries", "outcomes": outcomes, "server_requests": mock.requests}
+
+def bench_half_open(callers=8):
+    # once the reset timeout passes, only one of the concurrent callers reaches the backend
+    with MockOpenRouter(error_rate=1.0, latency=0.3) as mock:
+        transport = LLMTransport(mock.url, "bench", max_retries=0, failure_threshold=1, reset_timeout=0.2)
+        try:
+            transport.send(PAYLOAD)
+        except TransportError:
+            pass
+        time.sleep(0.25)
+        mock.server.error_rate = 0.0
+        before, outcomes = mock.requests, []
+        def call():
+            try:
+                transport.send(PAYLOAD)
+                outcomes.append("ok")
+            except TransportError as e:
+                outcomes.append(type(e).__name__)
+        threads = [threading.Thread(target=call) for _ in range(callers)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return {"bench": "half_open", "callers": callers, "trial_requests": mock.requests - before,
+                "outcomes": sorted(outcomes), "state_after": transport.breaker.state}
+
+if __name__ == "__main__":
+    with MockOpenRouter() as mock:
+        print(json.dumps(bench_keepalive(mock.url)))
+    print(json.dumps(bench_errors(0.3, 503, None)))
+    print(json.dumps(bench_errors(0.3, 429, 0.05)))
+    print(json.dumps(bench_timeout()))
+    print(json.dumps(bench_circuit_breaker()))
+    print(json.dumps(bench_breaker_retries()))
+    print(json.dumps(bench_half_open()))
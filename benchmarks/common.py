@@ -0,0 +1,19 @@
+# Shared setup for the benchmark scripts: run offline, in a scratch directory.
+import os, sys, json, tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+WORKDIR = tempfile.mkdtemp(prefix="bookgen_bench_")
+os.environ.setdefault("BOOKGEN_LOG_DIR", WORKDIR)
+os.environ.setdefault("BOOKGEN_LOG_LEVEL", "ERROR")
+os.chdir(WORKDIR)
+
+def make_outline(title, chapters, sections=2):
+    return json.dumps({
+        "book_title": title,
+        "outline": [{
+            "chapter_number": n,
+            "chapter_title": f"Chapter {n}",
+            "chapter_description": f"Description of chapter {n}",
+            "sections": [f"Section {n}.{s}" for s in range(1, sections + 1)],
+        } for n in range(1, chapters + 1)]
+    })
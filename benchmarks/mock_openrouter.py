@@ -0,0 +1,148 @@
+# Local stand-in for the OpenRouter chat-completions endpoint.
+#   python benchmarks/mock_openrouter.py --port 8765 --latency 0.5
+import json, random, time, threading, argparse
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+def usage(request, text):
+    # rough token counts and a made-up price of $1 / $2 per million tokens
+    prompt_tokens = sum(len(m.get("content", "")) for m in request.get("messages", [])) // 4
+    completion_tokens = len(text) // 4
+    return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens, "cost": (prompt_tokens + 2 * completion_tokens) / 1e6}
+
+class MockOpenRouterHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, body, headers=None):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _send_chunk(self, data):
+        self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def _send_stream(self, request, text):
+        # SSE in the OpenRouter format, with a keep-alive comment up front
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        self._send_chunk(b": OPENROUTER PROCESSING\n\n")
+        words = text.split(" ")
+        for i in range(0, len(words), self.server.chunk_words):
+            piece = " ".join(words[i:i + self.server.chunk_words]) + ("" if i + self.server.chunk_words >= len(words) else " ")
+            event = {"model": request.get("model"), "choices": [{"index": 0, "delta": {"content": piece}}]}
+            self._send_chunk(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+            time.sleep(self.server.chunk_delay)
+        if request.get("usage", {}).get("include"):
+            event = {"model": request.get("model"), "choices": [], "usage": usage(request, text)}
+            self._send_chunk(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+        self._send_chunk(b"data: [DONE]\n\n")
+        self._send_chunk(b"")
+
+    def do_POST(self):
+        server = self.server
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        with server.lock:
+            server.requests += 1
+            delay = server.latency + server.rng.uniform(-server.jitter, server.jitter)
+            fail = server.error_rate and server.rng.random() < server.error_rate
+        time.sleep(max(0.0, delay))
+        if fail:
+            with server.lock:
+                server.errors += 1
+            headers = {"Retry-After": str(server.retry_after)} if server.retry_after is not None else None
+            self._send_json(server.error_status, {"error": {"code": server.error_status, "message": "injected error"}}, headers)
+            return
+        text = server.responder(request) if server.responder else " ".join(["lorem"] * server.response_words)
+        if request.get("stream"):
+            try:
+                self._send_stream(request, text)
+            except (BrokenPipeError, ConnectionResetError):
+                # the client stopped reading early, e.g. once it had a full outline
+                self.close_connection = True
+            return
+        # a blocking completion takes as long as the whole stream would
+        time.sleep(server.chunk_delay * -(-len(text.split(" ")) // server.chunk_words))
+        self._send_json(200, {
+            "id": f"mock-{server.requests}",
+            "model": request.get("model"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+            "usage": usage(request, text),
+        })
+
+class MockOpenRouter:
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, jitter=0.0, response_words=200, responder=None,
+                 error_rate=0.0, error_status=503, retry_after=None, chunk_words=5, chunk_delay=0.0, seed=None):
+        self.server = ThreadingHTTPServer((host, port), MockOpenRouterHandler)
+        self.server.daemon_threads = True
+        self.server.lock = threading.Lock()
+        # seeded: the same sequence of latencies and injected errors every run
+        self.server.rng = random.Random(seed)
+        self.server.requests = 0
+        self.server.latency = latency
+        self.server.jitter = jitter
+        self.server.response_words = response_words
+        self.server.responder = responder
+        self.server.error_rate = error_rate
+        self.server.error_status = error_status
+        self.server.retry_after = retry_after
+        self.server.errors = 0
+        self.server.chunk_words = chunk_words
+        self.server.chunk_delay = chunk_delay
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/api/v1/chat/completions"
+
+    @property
+    def requests(self):
+        return self.server.requests
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mock OpenRouter chat-completions server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--response-words", type=int, default=200)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--retry-after", type=float, default=None)
+    parser.add_argument("--chunk-words", type=int, default=5)
+    parser.add_argument("--chunk-delay", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+    mock = MockOpenRouter(args.host, args.port, args.latency, args.jitter, args.response_words,
+                          error_rate=args.error_rate, error_status=args.error_status, retry_after=args.retry_after,
+                          chunk_words=args.chunk_words, chunk_delay=args.chunk_delay, seed=args.seed)
+    print(f"Serving mock OpenRouter on {mock.url}")
+    mock.server.serve_forever()
@@ -0,0 +1,89 @@
+# Local SMTP stand-in: accepts any mail, records it, and can be made slow.
+#   python benchmarks/mock_smtp.py --port 8025 --latency 0.5
+import argparse, socketserver, threading, time
+from email import message_from_bytes
+
+class MockSMTPHandler(socketserver.StreamRequestHandler):
+    def _reply(self, line):
+        self.wfile.write(f"{line}\r\n".encode("ascii"))
+        self.wfile.flush()
+
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.connections += 1
+        time.sleep(server.connect_latency)
+        self._reply("220 mock-smtp ready")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode("ascii", "replace").strip().upper()
+            if command.startswith(("EHLO", "HELO")):
+                self._reply("250-mock-smtp")
+                self._reply("250 8BITMIME")
+            elif command.startswith("DATA"):
+                self._reply("354 end with <CR><LF>.<CR><LF>")
+                data = []
+                for raw in iter(self.rfile.readline, b""):
+                    if raw in (b".\r\n", b".\n"):
+                        break
+                    data.append(raw[1:] if raw.startswith(b"..") else raw)
+                # a slow server: the time a real relay spends accepting the message
+                time.sleep(server.latency)
+                with server.lock:
+                    server.messages.append(message_from_bytes(b"".join(data)))
+                self._reply("250 queued")
+            elif command.startswith("QUIT"):
+                self._reply("221 bye")
+                return
+            else:
+                # MAIL, RCPT, RSET, NOOP
+                self._reply("250 ok")
+
+class MockSMTP:
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, connect_latency=0.0):
+        self.server = socketserver.ThreadingTCPServer((host, port), MockSMTPHandler)
+        self.server.daemon_threads = True
+        self.server.lock = threading.Lock()
+        self.server.latency = latency
+        self.server.connect_latency = connect_latency
+        self.server.connections = 0
+        self.server.messages = []
+
+    @property
+    def port(self):
+        return self.server.server_address[1]
+
+    @property
+    def messages(self):
+        return self.server.messages
+
+    @property
+    def connections(self):
+        return self.server.connections
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mock SMTP server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8025)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--connect-latency", type=float, default=0.0)
+    args = parser.parse_args()
+    mock = MockSMTP(args.host, args.port, args.latency, args.connect_latency)
+    print(f"Serving mock SMTP on {args.host}:{mock.port}")
+    mock.server.serve_forever()
@@ -0,0 +1,155 @@
+# End-to-end offline benchmark: generate_outline -> save_book_and_outline ->
+# generate_heading_content -> book_gen / export_book against the mock
+# OpenRouter server, one scenario per process. Writes machine-readable JSON
+# and can compare against an earlier results file to catch regressions.
+#   python benchmarks/run_benchmarks.py [--scenario NAME ...] [--output results.json]
+#                                       [--compare baseline.json --threshold 1.2]
+import argparse, json, os, platform, re, resource, subprocess, sys, time
+from datetime import datetime, timezone
+
+ORIGINAL_CWD = os.getcwd()
+from common import WORKDIR, make_outline
+from mock_openrouter import MockOpenRouter
+
+SCENARIOS = {
+    "sequential-10": {"chapters": 10, "mode": "sequential", "latency": 0.05, "jitter": 0.01, "response_words": 400},
+    "parallel-30": {"chapters": 30, "mode": "parallel", "latency": 0.05, "jitter": 0.02, "response_words": 400},
+    "pipelined-30": {"chapters": 30, "mode": "pipelined", "latency": 0.05, "jitter": 0.02, "response_words": 400},
+    "flaky-20": {"chapters": 20, "mode": "parallel", "latency": 0.05, "jitter": 0.02, "response_words": 400, "error_rate": 0.05},
+    "large-responses-10": {"chapters": 10, "mode": "parallel", "latency": 0.05, "jitter": 0.0, "response_words": 5000},
+}
+# lower is better for all of these
+COMPARED_METRICS = ("total_s", "outline_s", "save_s", "content_s", "export_docx_s", "export_formats_s", "db_s", "peak_rss_mb")
+
+def responder(chapters, response_words):
+    def respond(request):
+        if request["messages"][0]["content"].lstrip().startswith("You are an AI Outline"):
+            title = re.search(r"Book Title:\s*\n(.+)", request["messages"][-1]["content"]).group(1)
+            return make_outline(title, chapters)
+        return " ".join(["lorem"] * response_words)
+    return respond
+
+# -------------------------
+# Child: one scenario
+# -------------------------
+def run_scenario(config, url):
+    from BookGen import BookGen
+
+    class TimedBookGen(BookGen):
+        # accumulates time spent writing chapters to the database
+        db_write_s = 0.0
+
+        def save_heading_content(self, *args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return super().save_heading_content(*args, **kwargs)
+            finally:
+                self.db_write_s += time.perf_counter() - start
+
+    gen = TimedBookGen(api_url=url, generation_mode=config["mode"], max_workers=config.get("workers", 8),
+                       db_path=os.path.join(WORKDIR, f"{config['name']}.db"), db_wal=True, db_synchronous="NORMAL")
+    title = f"Benchmark {config['name']}"
+    timings = {}
+    def stage(name, fn):
+        start = time.perf_counter()
+        result = fn()
+        timings[f"{name}_s"] = round(time.perf_counter() - start, 4)
+        return result
+    total_start = time.perf_counter()
+    outline = stage("outline", lambda: gen.generate_outline(title, "benchmark notes"))
+    stage("save", lambda: gen.save_book_and_outline(title, "benchmark notes", outline))
+    stage("content", lambda: gen.generate_heading_content(title))
+    stage("export_docx", lambda: gen.book_gen(title, os.path.join(WORKDIR, f"{config['name']}.docx")))
+    stage("export_formats", lambda: gen.export_book(title, os.path.join(WORKDIR, config["name"])))
+    timings["total_s"] = round(time.perf_counter() - total_start, 4)
+    report = gen.telemetry_report(title)
+    totals = report["totals"]
+    return {
+        **timings,
+        "db_s": round(timings["save_s"] + gen.db_write_s, 4),
+        "chapters_per_s": round(config["chapters"] / timings["content_s"], 2),
+        "completion_tokens_per_s": round(totals["completion_tokens"] / timings["content_s"], 1),
+        "llm_calls": totals["calls"],
+        "llm_failures": totals["failures"],
+        "prompt_tokens": totals["prompt_tokens"],
+        "completion_tokens": totals["completion_tokens"],
+        "stages": {name: {k: (round(v, 4) if isinstance(v, float) else v) for k, v in stats.items()
+                          if k in ("calls", "retries", "failures", "latency_p50", "latency_p95", "ttfb_p50")}
+                   for name, stats in report["stages"].items()},
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+# -------------------------
+# Parent: mock server, scenarios, results
+# -------------------------
+def run(names, seed):
+    results = {}
+    for name in names:
+        config = {"name": name, **SCENARIOS[name]}
+        with MockOpenRouter(latency=config["latency"], jitter=config["jitter"], error_rate=config.get("error_rate", 0.0),
+                            responder=responder(config["chapters"], config["response_words"]), seed=seed) as mock:
+            child = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", json.dumps(config), mock.url],
+                                   capture_output=True, text=True)
+            if child.returncode != 0:
+                print(child.stderr, file=sys.stderr)
+                raise SystemExit(f"Scenario {name} failed")
+            results[name] = {"config": config, **json.loads(child.stdout.strip().splitlines()[-1]),
+                             "mock_requests": mock.requests, "mock_injected_errors": mock.server.errors}
+        print(json.dumps({"scenario": name, **{k: results[name][k] for k in ("total_s", "content_s", "db_s", "chapters_per_s", "peak_rss_mb")}}))
+    return results
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+def compare(results, baseline_path, threshold):
+    with open(baseline_path) as f:
+        baseline = json.load(f)["scenarios"]
+    regressions = []
+    for name, metrics in results.items():
+        for metric in COMPARED_METRICS:
+            old, new = baseline.get(name, {}).get(metric), metrics.get(metric)
+            if not old or new is None:
+                continue
+            ratio = new / old
+            print(json.dumps({"scenario": name, "metric": metric, "baseline": old, "current": new, "ratio": round(ratio, 3)}))
+            if ratio > threshold:
+                regressions.append(f"{name}.{metric} {old} -> {new} (x{ratio:.2f})")
+    return regressions
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--child":
+        print(json.dumps(run_scenario(json.loads(sys.argv[2]), sys.argv[3])))
+        sys.exit(0)
+    parser = argparse.ArgumentParser(description="Offline end-to-end BookGen benchmarks")
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS), help="run only these (repeatable)")
+    parser.add_argument("--seed", type=int, default=1234, help="mock server latency / error sequence")
+    parser.add_argument("--output", default=None, help="results JSON path (default: print only)")
+    parser.add_argument("--compare", default=None, help="earlier results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=1.2, help="ratio above which a metric counts as a regression")
+    args = parser.parse_args()
+    results = run(args.scenario or list(SCENARIOS), args.seed)
+    document = {
+        "meta": {
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "seed": args.seed,
+        },
+        "scenarios": results,
+    }
+    if args.output:
+        path = os.path.join(ORIGINAL_CWD, args.output)
+        with open(path, "w") as f:
+            json.dump(document, f, indent=2)
+        print(f"Results written to {path}")
+    if args.compare:
+        regressions = compare(results, os.path.join(ORIGINAL_CWD, args.compare), args.threshold)
+        if regressions:
+            print("Regressions:\n  " + "\n  ".join(regressions))
+            sys.exit(1)